@@ -0,0 +1,23 @@
+from functools import lru_cache
+from dotenv import load_dotenv
+import os
+
+
+@lru_cache(maxsize=1)
+def get_azure_settings():
+    """
+    讀取 .env 中的 Azure OpenAI 設定。
+
+    只在第一次呼叫時解析 .env 檔案，之後直接返回快取的設定，
+    避免在每次建立客戶端時重複執行 load_dotenv()。
+    """
+    # 加载 .env 文件中的环境变量
+    load_dotenv()
+
+    # 从环境变量中获取 API Key、Endpoint 和 API 版本
+    return {
+        'api_key': os.getenv("AZURE_OPENAI_API_KEY"),
+        'api_base': os.getenv("AZURE_OPENAI_ENDPOINT"),
+        'api_version': os.getenv("AZURE_OPENAI_API_VERSION"),
+        'embedding_api_version': os.getenv("Embedding_API_VERSION"),
+    }
@@ -0,0 +1,66 @@
+import threading
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+
+class ClientPool:
+    """
+    行程 (process) 內共用的 LLM / embedding 客戶端註冊表。
+
+    以 (類型, mode, option, endpoint) 為鍵，每組設定只建立一次客戶端，之後的呼叫直接重用同一個實例，
+    省去每次查詢重新建立客戶端的成本。Azure 客戶端 (httpx) 會因此重用 HTTP 連線；
+    Ollama 客戶端每次請求直接呼叫 requests.post，沒有可重用的連線。
+    建立客戶端在全域鎖之外進行，只以每個鍵各自的鎖避免重複建立，不阻塞其他設定的取得。
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._create_locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_create(self, key, factory):
+        """
+        取得 key 對應的客戶端，若不存在則呼叫 factory 建立並快取。
+
+        Args:
+            key (tuple): 客戶端的鍵，例如 ('llm', mode, llm_option, endpoint)。
+            factory (callable): 無參數的函式，返回新建立的客戶端。
+        """
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self.hits += 1
+                return client
+            create_lock = self._create_locks.setdefault(key, threading.Lock())
+
+        # 以該鍵的鎖建立，確保同一組設定在多個 session 同時請求時只建立一次
+        with create_lock:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is not None:
+                    self.hits += 1
+                    return client
+                self.misses += 1
+
+            client = factory()
+            with self._lock:
+                self._clients[key] = client
+            logging.info(f"ClientPool 建立新的客戶端: {key}")
+            return client
+
+    def clear(self):
+        """清空所有已快取的客戶端（例如 .env 設定變更後）。"""
+        with self._lock:
+            self._clients.clear()
+
+    def stats(self):
+        """返回命中/未命中次數與目前快取的客戶端數量。"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._clients)}
+
+
+# 行程內共用的客戶端池
+client_pool = ClientPool()
@@ -1,7 +1,7 @@
 from langchain_community.embeddings import OllamaEmbeddings
 from langchain_openai import AzureOpenAIEmbeddings
-from dotenv import load_dotenv
-import os
+from apis.azure_settings import get_azure_settings
+from apis.client_pool import client_pool
 
 
 class EmbeddingAPI:
@@ -29,27 +29,29 @@ class EmbeddingAPI:
         if not base_url:
             raise ValueError(f"無效的內部 embeddings 模型名稱：{embedding}")
 
-        # 建立並返回 OllamaEmbeddings 實例
-        embeddings = OllamaEmbeddings(base_url=base_url, model=embedding)
-        return embeddings
+        # 建立並返回 OllamaEmbeddings 實例，依 (mode, option, endpoint) 從客戶端池取得
+        return client_pool.get_or_create(
+            ('embedding', '內部LLM', embedding, base_url),
+            lambda: OllamaEmbeddings(base_url=base_url, model=embedding)
+        )
 
     @staticmethod
     def _get_external_embeddings(embedding):
         """獲取外部 Azure 模型的 embeddings"""
-        # 加载 .env 文件中的环境变量
-        load_dotenv()
-
-        # 从环境变量中获取 API Key、Endpoint 和 API 版本
-        api_key = os.getenv("AZURE_OPENAI_API_KEY")
-        api_base = os.getenv("AZURE_OPENAI_ENDPOINT")
-        embedding_api_version = os.getenv("Embedding_API_VERSION")
-
-        # 使用 Azure OpenAI API 來建立 embeddings
-        embeddings = AzureOpenAIEmbeddings(
-            model=embedding,
-            azure_endpoint=api_base,
-            api_key=api_key,
-            openai_api_version=embedding_api_version,
-            # dimensions: Optional[int] = None  # 可選擇指定新 text-embedding-3 模型的維度
+        # 取得 .env 中的 API Key、Endpoint 和 API 版本（只解析一次）
+        settings = get_azure_settings()
+        api_key = settings['api_key']
+        api_base = settings['api_base']
+        embedding_api_version = settings['embedding_api_version']
+
+        # 使用 Azure OpenAI API 來建立 embeddings；重用同一實例即重用其 HTTP 連線 (keep-alive)
+        return client_pool.get_or_create(
+            ('embedding', '外部LLM', embedding, api_base),
+            lambda: AzureOpenAIEmbeddings(
+                model=embedding,
+                azure_endpoint=api_base,
+                api_key=api_key,
+                openai_api_version=embedding_api_version,
+                # dimensions: Optional[int] = None  # 可選擇指定新 text-embedding-3 模型的維度
+            )
         )
-        return embeddings
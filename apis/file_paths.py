@@ -22,6 +22,18 @@ class FilePaths:
         """
         return self.base_dir / 'user' / username / conversation_id / 'vector_store'
 
+    def get_shared_dir(self):
+        """
+        獲取共用文件庫目錄 (shared_dir) 的路徑。
+        """
+        return self.base_dir / 'shared'
+
+    def get_shared_vector_store_dir(self, embedding):
+        """
+        獲取共用向量存儲目錄的路徑，每個 embedding 模型各自一個目錄。
+        """
+        return self.base_dir / 'shared' / 'vector_store' / embedding
+
     def get_output_dir(self):
         """
         獲取輸出目錄 (output_dir) 的路徑。
@@ -1,21 +1,43 @@
-from dotenv import load_dotenv
-import os
 from langchain_openai import AzureChatOpenAI
 from langchain_community.llms import Ollama
+from apis.azure_settings import get_azure_settings
+from apis.client_pool import client_pool
 
 class LLMAPI:
     @staticmethod
-    def get_llm(mode, llm_option):
-        """根據模式選擇內部或外部 LLM"""
+    def get_llm(mode, llm_option, cache=None):
+        """
+        根據模式選擇內部或外部 LLM（同一組設定在行程內共用同一個客戶端）
+
+        cache 為 LangChain BaseCache（例如 models.llm_response_cache.LLMResponseCache）時，返回使用該快取的客戶端：
+        invoke 時相同模型、生成參數與 prompt 直接返回已保存的回應（stream 不查詢快取）。
+        客戶端池以快取的 namespace 區分；沒有 namespace 的快取每次建立新的客戶端。
+        """
         # mode = self.chat_session_data.get("mode")
         # llm_option = self.chat_session_data.get("llm_option")
         if mode == '內部LLM':
-            return LLMAPI._get_internal_llm(llm_option)
+            return LLMAPI._get_internal_llm(llm_option, cache)
         else:
-            return LLMAPI._get_external_llm(llm_option)
+            return LLMAPI._get_external_llm(llm_option, cache)
 
     @staticmethod
-    def _get_internal_llm(llm_option):
+    def get_utility_llm(mode):
+        """
+        取得用於摘要、改寫問題、產生標題等輔助工作的小模型。
+
+        內部使用 11437 上的 llama3.2:1b，外部使用 gpt-4o-mini，不佔用對話模型的推論資源。
+        """
+        if mode == '內部LLM':
+            api_base = "http://10.5.61.81:11437"
+            return client_pool.get_or_create(
+                ('llm', '內部LLM', 'llama3.2:1b', api_base),
+                lambda: Ollama(base_url=api_base, model="llama3.2:1b")
+            )
+        else:
+            return LLMAPI._get_external_llm('gpt-4o-mini')
+
+    @staticmethod
+    def _get_internal_llm(llm_option, llm_cache=None):
         """獲取內部 LLM 模型"""
         api_base_34 = 'http://10.5.61.81:11434'
         model_name = "cwchang/llama-3-taiwan-8b-instruct:f16"
@@ -50,30 +72,55 @@ class LLMAPI:
         if not model:
             raise ValueError(f"無效的內部模型選項：{llm_option}")
 
-        # Ollama 模型實例
-        llm = Ollama(base_url=api_base, model=model)
-        return llm
+        # Ollama 模型實例，依 (mode, option, endpoint, 快取) 從客戶端池取得
+        return LLMAPI._get_or_create(
+            ('llm', '內部LLM', llm_option, api_base), llm_cache,
+            lambda: Ollama(base_url=api_base, model=model, cache=llm_cache)
+        )
 
     @staticmethod
-    def _get_external_llm(llm_option):
+    def _get_external_llm(llm_option, llm_cache=None):
         """獲取外部 Azure LLM 模型"""
         deployment_name = llm_option
-        # 加载 .env 文件中的环境变量
-        load_dotenv()
-
-        # 从环境变量中获取 API Key、Endpoint 和 API 版本
-        api_key = os.getenv("AZURE_OPENAI_API_KEY")
-        api_base = os.getenv("AZURE_OPENAI_ENDPOINT")
-        api_version = os.getenv("AZURE_OPENAI_API_VERSION")
+        # 取得 .env 中的 API Key、Endpoint 和 API 版本（只解析一次）
+        settings = get_azure_settings()
+        api_key = settings['api_key']
+        api_base = settings['api_base']
+        api_version = settings['api_version']
 
         if not all([api_key, api_base, api_version]):
             raise ValueError("缺少API Key、Endpoint 或 API Version")
 
-        # 初始化 Azure ChatOpenAI 模型
-        llm = AzureChatOpenAI(
-            openai_api_key=api_key,
-            azure_endpoint=api_base,
-            api_version=api_version,
-            deployment_name=deployment_name
+        # 初始化 Azure ChatOpenAI 模型；重用同一實例即重用其 HTTP 連線 (keep-alive)
+        return LLMAPI._get_or_create(
+            ('llm', '外部LLM', deployment_name, api_base), llm_cache,
+            lambda: AzureChatOpenAI(
+                openai_api_key=api_key,
+                azure_endpoint=api_base,
+                api_version=api_version,
+                deployment_name=deployment_name,
+                cache=llm_cache
+            )
         )
-        return llm
+
+    @staticmethod
+    def _get_or_create(key, llm_cache, factory):
+        """
+        依 key 與快取的 namespace 從客戶端池取得客戶端。
+
+        不以快取物件的 id 作為鍵：物件被回收後 id 可能被重用，會取得綁定到其他快取的客戶端。
+        """
+        if llm_cache is None:
+            return client_pool.get_or_create((*key, None), factory)
+        namespace = getattr(llm_cache, 'namespace', None)
+        if not isinstance(namespace, str):
+            return factory()
+        return client_pool.get_or_create((*key, ('cache', namespace)), factory)
+
+    @staticmethod
+    def to_text(output):
+        """將 LLM 的輸出（字串或訊息物件/串流片段）轉換為文字。"""
+        # 內部 Ollama 回傳字串，外部 AzureChatOpenAI 回傳具有 content 屬性的訊息物件
+        if hasattr(output, 'content'):
+            return output.content
+        return output if isinstance(output, str) else str(output)
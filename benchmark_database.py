@@ -0,0 +1,157 @@
+import argparse
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from models.database_base import BaseDB
+from models.database_userRecords import UserRecordsDB
+
+CREATE_TABLE_QUERY = '''
+    CREATE TABLE IF NOT EXISTS chat_history (
+        id INTEGER PRIMARY KEY,
+        username TEXT,
+        conversation_id TEXT,
+        user_query TEXT,
+        ai_response TEXT
+    )
+'''
+INSERT_QUERY = "INSERT INTO chat_history (username, conversation_id, user_query, ai_response) VALUES (?, ?, ?, ?)"
+
+
+class LegacyDB:
+    """改版前的 BaseDB 寫入方式：每個語句開啟新連線，使用預設的 rollback journal。"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def execute_query(self, query, params=()):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(query, params)
+            conn.commit()
+
+    def fetch_query(self, query, params=()):
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute(query, params).fetchall()
+
+
+LEGACY_CHAT_HISTORY_QUERY = '''
+    CREATE TABLE IF NOT EXISTS chat_history (
+        id INTEGER PRIMARY KEY,
+        conversation_id TEXT,
+        active_window_index INTEGER,
+        title TEXT,
+        user_query TEXT,
+        ai_response TEXT
+    )
+'''
+
+
+def legacy_delete_window(db, delete_index):
+    """改版前的 UserRecordsDB 刪除視窗：刪除後逐列更新索引較大的訊息。"""
+    db.execute_query("DELETE FROM chat_history WHERE active_window_index = ?", (delete_index,))
+    for row_id, active_window_index in db.fetch_query(
+            "SELECT id, active_window_index FROM chat_history ORDER BY active_window_index"):
+        if active_window_index > delete_index:
+            db.execute_query("UPDATE chat_history SET active_window_index = ? WHERE id = ?",
+                             (active_window_index - 1, row_id))
+
+
+def benchmark_window_deletion(tmp_dir, windows, messages):
+    """比較改版前後刪除第一個視窗（最差情況）的耗時，返回 (改版前秒數, 改版後秒數)。"""
+    legacy_db = LegacyDB(Path(tmp_dir) / 'legacy_user.db')
+    legacy_db.execute_query(LEGACY_CHAT_HISTORY_QUERY)
+    with sqlite3.connect(legacy_db.db_path) as conn:
+        conn.executemany(
+            "INSERT INTO chat_history (conversation_id, active_window_index, title, user_query, ai_response) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(f"conversation{w}", w, f"title {w}", f"question {m}", "answer " * 50)
+             for w in range(windows) for m in range(messages)])
+    start = time.perf_counter()
+    legacy_delete_window(legacy_db, 0)
+    legacy_seconds = time.perf_counter() - start
+
+    user_db = UserRecordsDB('benchmark', base_dir=tmp_dir)
+    for w in range(windows):
+        for m in range(messages):
+            user_db.save_to_database(f"question {m}", "answer " * 50,
+                                     {'conversation_id': f"conversation{w}", 'title': f"title {w}"})
+    start = time.perf_counter()
+    user_db.delete_chat_by_index(0)
+    new_seconds = time.perf_counter() - start
+    assert user_db.count_windows() == windows - 1
+    return legacy_seconds, new_seconds
+
+
+def run_writers(db, threads, inserts_per_thread):
+    """以多個執行緒同時寫入，返回 (總耗時, 每筆寫入的延遲列表, 失敗次數)。"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(threads)
+
+    def writer(thread_index):
+        local_latencies = []
+        local_errors = 0
+        start_barrier.wait()
+        for i in range(inserts_per_thread):
+            start = time.perf_counter()
+            try:
+                db.execute_query(INSERT_QUERY, (f"user{thread_index}", f"conversation{thread_index}",
+                                                f"question {i}", "answer " * 50))
+            except sqlite3.OperationalError:
+                local_errors += 1
+            local_latencies.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    workers = [threading.Thread(target=writer, args=(i,)) for i in range(threads)]
+    start_time = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start_time, latencies, sum(errors)
+
+
+def report(name, elapsed, latencies, errors):
+    """輸出每秒寫入數與延遲分位數。"""
+    latencies = sorted(latencies)
+    p50 = latencies[int(len(latencies) * 0.50)] * 1000
+    p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000
+    print(f"{name:<10} {len(latencies) / elapsed:>12.0f} {p50:>10.2f} {p99:>10.2f} {errors:>8}")
+
+
+def main():
+    """
+    主程序執行入口：比較改版前後 BaseDB 在多個寫入執行緒下的每秒寫入數與 p99 延遲，
+    以及 UserRecordsDB 刪除視窗的耗時。
+    """
+    parser = argparse.ArgumentParser(description="BaseDB 與 UserRecordsDB 的效能測試")
+    parser.add_argument('--threads', type=int, default=20, help="寫入執行緒數量")
+    parser.add_argument('--inserts', type=int, default=200, help="每個執行緒的寫入筆數")
+    parser.add_argument('--windows', type=int, default=50, help="刪除視窗測試的視窗數量")
+    parser.add_argument('--messages', type=int, default=200, help="刪除視窗測試中每個視窗的訊息數量")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"{args.threads} 個寫入執行緒，每個執行緒 {args.inserts} 筆")
+        print(f"{'':<10} {'inserts/s':>12} {'p50 (ms)':>10} {'p99 (ms)':>10} {'errors':>8}")
+
+        legacy_db = LegacyDB(Path(tmp_dir) / 'legacy.db')
+        legacy_db.execute_query(CREATE_TABLE_QUERY)
+        report('legacy', *run_writers(legacy_db, args.threads, args.inserts))
+
+        pooled_db = BaseDB(Path(tmp_dir) / 'pooled.db')
+        pooled_db.execute_query(CREATE_TABLE_QUERY)
+        report('pooled', *run_writers(pooled_db, args.threads, args.inserts))
+
+        print(f"\n刪除視窗：{args.windows} 個視窗，每個視窗 {args.messages} 則訊息")
+        legacy_seconds, new_seconds = benchmark_window_deletion(tmp_dir, args.windows, args.messages)
+        print(f"{'legacy':<10} {legacy_seconds * 1000:>10.2f} ms")
+        print(f"{'indexed':<10} {new_seconds * 1000:>10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import argparse
+import itertools
+import json
+import logging
+import sqlite3
+from pathlib import Path
+import pandas as pd
+from mockdata.batch_runner import BatchRunner
+from mockdata.benchmark_index import BenchmarkIndex
+from mockdata.evaluate_rag import ResponseEvaluator
+from models.document_model import DocumentModel
+from models.llm_rag import RAGModel
+
+QA_PATH = './mockdata/QAData.csv'
+
+# 每個測試格的基本 session 參數（LLM、embedding、向量資料庫與檢索設定依測試組合覆寫）
+BASE_SESSION = {
+    'conversation_id': 'benchmark',
+    'num_chat_windows': 1,
+    'active_window_index': 0,
+    'agent': '個人KM',
+    'api_base': '',
+    'api_key': '',
+    'doc_names': '',
+    'db_name': '',
+    'db_source': '',
+    'chat_history': [],
+    'title': '',
+    'upload_time': None,
+    'username': 'benchmark',
+    'bypass_answer_cache': True,  # 評估實際的檢索與生成，不使用語意快取的回答
+    'empty_window_exists': True
+}
+
+# 彙總時使用的欄位
+SUMMARY_COLUMNS = ['config', 'score', 'total_seconds', 'retrieval_seconds',
+                   'prompt_tokens_est', 'completion_tokens_est', 'chunk_count']
+
+
+class RagBenchmark:
+    """
+    以 (LLM, embedding 模型, 拆分策略, k/fetch_k) 的組合矩陣測試 RAG 的正確率與效能。
+
+    每個 (測試組合, 問題, 第幾次) 為一個測試格，生成回答並評分後寫入檢查點，
+    中斷後重新執行時略過已完成的測試格；最後將所有測試格寫入同一個結果表格。
+    """
+
+    def __init__(self, output_dir, judge='gpt-4o', judge_votes=1, max_workers=4):
+        """
+        :param output_dir: 輸出目錄（向量資料庫、檢查點與結果表格）
+        :param judge: 評分使用的外部模型
+        :param judge_votes: 每個回答的評分次數（取平均）
+        :param max_workers: 同時執行的測試格數量
+        """
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.index = BenchmarkIndex(self.output_dir / 'indexes')
+        self.evaluator = ResponseEvaluator(
+            input_file=QA_PATH,
+            output_file=(self.output_dir / 'results.csv').as_posix(),
+            mode='外部LLM',
+            llm_option=judge,
+            evaluation_attempts=judge_votes
+        )
+        self.batch_runner = BatchRunner(
+            checkpoint_path=self.output_dir / 'checkpoints.db',
+            run_name=f"benchmark:{judge}:{judge_votes}",
+            max_workers=max_workers
+        )
+
+    @staticmethod
+    def build_configs(llm_options, embeddings, chunkers, retrievers):
+        """展開測試組合矩陣，retrievers 為 (k, fetch_k) 列表。"""
+        return [
+            {
+                'key': f"{llm_option}|{embedding}|{chunker}|{k}/{fetch_k}",
+                # 外部模型皆為 Azure 上的 gpt 系列
+                'mode': '外部LLM' if llm_option.startswith('gpt') else '內部LLM',
+                'llm_option': llm_option,
+                'embedding': embedding,
+                'chunker': chunker,
+                'k': k,
+                'fetch_k': fetch_k,
+            }
+            for llm_option, embedding, chunker, (k, fetch_k)
+            in itertools.product(llm_options, embeddings, chunkers, retrievers)
+        ]
+
+    def run(self, configs, attempts=1, retry_failed=False):
+        """
+        執行所有測試格，返回結果 DataFrame。
+
+        :param configs: build_configs() 返回的測試組合
+        :param attempts: 每個問題重複生成的次數
+        :param retry_failed: 是否重新執行先前失敗的測試格
+        """
+        # 依 (embedding, 拆分策略) 建立向量資料庫，相同組合共用
+        index_stats = {}
+        for config in configs:
+            index_key = (config['embedding'], config['chunker'])
+            if index_key not in index_stats:
+                index_stats[index_key] = self.index.build(*index_key)
+            config['vector_store_dir'], config['index_stats'] = index_stats[index_key]
+
+        if retry_failed:
+            failed = [key for key, result in self.batch_runner.load_results().items() if result.get('error')]
+            logging.info(f"重新執行 {len(failed)} 個失敗的測試格")
+            self.batch_runner.forget(failed)
+
+        qa_data = pd.read_csv(QA_PATH)
+        tasks = [
+            (f"{config['key']}|{row.QA_No}|{attempt}", (config, int(row.QA_No), row.Question, row.Answer, attempt))
+            for config in configs
+            for row in qa_data.itertuples()
+            for attempt in range(attempts)
+        ]
+        results = self.batch_runner.run(tasks, self.run_cell, description='測試格')
+
+        df = pd.DataFrame(results)
+        for config in configs:
+            selected = df['config'] == config['key']
+            df.loc[selected, 'chunk_count'] = config['index_stats']['chunk_count']
+            df.loc[selected, 'index_build_seconds'] = config['index_stats']['build_seconds']
+        self._save_results(df)
+        return df
+
+    def run_cell(self, config, qa_no, question, expected, attempt):
+        """
+        生成並評分單一測試格，返回可寫入檢查點的結果。
+
+        暫時性錯誤（速率限制、逾時等）直接拋出，由 BatchRunner 退避重試；其他錯誤記錄於 error 欄位。
+        """
+        session = dict(BASE_SESSION, **{
+            'mode': config['mode'],
+            'llm_option': config['llm_option'],
+            'embedding': config['embedding'],
+            'vector_store_dir': config['vector_store_dir'],
+            'retriever_k': config['k'],
+            'retriever_fetch_k': config['fetch_k'],
+            'chat_history': [],
+            # 每次重複生成使用各自的 LLM 回應快取命名空間，重新執行時結果一致
+            'llm_cache': f'benchmark-{attempt}',
+        })
+        result = {
+            'config': config['key'],
+            'llm_option': config['llm_option'],
+            'embedding': config['embedding'],
+            'chunker': config['chunker'],
+            'k': config['k'],
+            'fetch_k': config['fetch_k'],
+            'qa_no': qa_no,
+            'attempt': attempt,
+            'question': question,
+            'expected': expected,
+        }
+
+        llm_rag = RAGModel(session)
+        try:
+            answer, documents = llm_rag.query_llm_rag(question, raise_errors=True)
+        except Exception as e:
+            # 速率限制等暫時性錯誤交由 BatchRunner 退避重試，不寫入檢查點
+            if BatchRunner.is_retryable_error(e):
+                raise
+            logging.error(f"測試格 {config['key']} / {qa_no} 生成回答失敗: {e}")
+            result['error'] = f'生成回答失敗: {e}'
+            return result
+
+        score = self.evaluator.score(question, expected, answer)
+        if score is None:
+            # 所有評分都失敗時不計入正確率，可用 --retry-failed 重新執行
+            result.update({'answer': answer, 'error': '評分失敗'})
+            return result
+
+        result.update({
+            'answer': answer,
+            'score': score,
+            'correct': score > 0.5,
+            'retrieved_chunks': json.dumps([doc.metadata.get('chunk_id') for doc in documents]),
+            'error': '',
+            **llm_rag.last_timings,
+        })
+        return result
+
+    def _save_results(self, df):
+        """將結果寫入 results.csv 與 results.db 的 results 表格（每次覆寫為完整的結果）。"""
+        df.to_csv(self.output_dir / 'results.csv', index=False, encoding='utf-8-sig')
+        with sqlite3.connect(self.output_dir / 'results.db') as conn:
+            df.to_sql('results', conn, if_exists='replace', index=False)
+        logging.info(f"結果已儲存至 {self.output_dir}")
+
+    @staticmethod
+    def summarize(df):
+        """依測試組合彙總正確率、延遲、檢索耗時與估計 token 數。"""
+        # 所有測試格都失敗時結果中沒有評分與耗時欄位，補上空欄位讓彙總仍可計算
+        completed = df[df['error'] == ''].reindex(columns=SUMMARY_COLUMNS)
+        completed = completed.astype({column: float for column in SUMMARY_COLUMNS[1:]})
+        grouped = completed.groupby('config')
+        summary = pd.DataFrame({
+            'cells': grouped.size(),
+            'failed': df[df['error'] != ''].groupby('config').size(),
+            'accuracy': grouped['score'].agg(lambda scores: (scores > 0.5).mean()),
+            'p50_s': grouped['total_seconds'].quantile(0.50),
+            'p95_s': grouped['total_seconds'].quantile(0.95),
+            'retrieval_ms': grouped['retrieval_seconds'].mean() * 1000,
+            # 回答鏈只返回文字，沒有實際的 token 用量，以字元數估算
+            'prompt_tokens_est': grouped['prompt_tokens_est'].mean(),
+            'completion_tokens_est': grouped['completion_tokens_est'].mean(),
+            'chunks': grouped['chunk_count'].first(),
+        })
+        return summary.fillna({'cells': 0, 'failed': 0})
+
+
+def parse_retriever(value):
+    """解析 'k/fetch_k' 形式的檢索設定。"""
+    k, _, fetch_k = value.partition('/')
+    return int(k), int(fetch_k or k)
+
+
+def main():
+    """
+    主程序執行入口：依命令列指定的測試組合矩陣執行 RAG 效能測試，輸出結果表格與彙總。
+    """
+    parser = argparse.ArgumentParser(description="RAG 正確率與效能測試")
+    parser.add_argument('--llm-options', nargs='+', default=['Taiwan-llama3-f16'], help="生成回答的模型")
+    parser.add_argument('--embeddings', nargs='+', default=['bge-m3'], help="embedding 模型")
+    parser.add_argument('--chunkers', nargs='+', default=['markdown_recursive'],
+                        choices=list(DocumentModel.SPLITTERS), help="拆分策略")
+    parser.add_argument('--retrievers', nargs='+', type=parse_retriever, default=[(3, 8)],
+                        help="檢索設定 k/fetch_k，例如 3/8 5/20")
+    parser.add_argument('--attempts', type=int, default=1, help="每個問題重複生成的次數")
+    parser.add_argument('--judge', default='gpt-4o', help="評分使用的外部模型")
+    parser.add_argument('--judge-votes', type=int, default=1, help="每個回答的評分次數")
+    parser.add_argument('--max-workers', type=int, default=4, help="同時執行的測試格數量")
+    parser.add_argument('--output-dir', default='./mockdata/benchmark', help="輸出目錄")
+    parser.add_argument('--retry-failed', action='store_true', help="重新執行先前失敗的測試格")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    benchmark = RagBenchmark(args.output_dir, args.judge, args.judge_votes, args.max_workers)
+    configs = RagBenchmark.build_configs(args.llm_options, args.embeddings, args.chunkers, args.retrievers)
+    df = benchmark.run(configs, args.attempts, args.retry_failed)
+
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(RagBenchmark.summarize(df).round(3))
+
+
+if __name__ == "__main__":
+    main()
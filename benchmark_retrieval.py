@@ -0,0 +1,171 @@
+import argparse
+import logging
+import re
+import time
+from collections import defaultdict
+from pathlib import Path
+import pandas as pd
+from langchain_chroma import Chroma
+from apis.embedding_api import EmbeddingAPI
+from mockdata.benchmark_index import BenchmarkIndex
+from models.document_model import DocumentModel
+
+QA_PATH = './mockdata/QAData.csv'
+
+# 比對時忽略的空白、標點與 Markdown 符號
+IGNORED_CHARS_PATTERN = re.compile(r'[\s\W_*#>`|]+')
+
+
+class RetrievalBenchmark:
+    """
+    只測試檢索（不生成回答）：以各拆分策略收錄示例 PDF，將 QAData 的問題送入與 RAGModel 相同的 MMR 檢索器，
+    以標註的正確段落計算 recall@k 與 MRR，並記錄向量資料庫的建立時間、大小與檢索延遲。
+
+    正確段落優先讀取 gold 檔案（QA_No, Passage，每列一個段落）；未提供時以 Answer 欄位的每一行作為正確段落。
+    檢索到的文檔塊包含正確段落中至少 match_threshold 比例的字元二元組 (bigram) 即視為命中，
+    可容忍拆分邊界與 Markdown 格式的差異。
+    """
+
+    # 短於此字數的段落（例如「是」、「1」）無法可靠比對，略過
+    MIN_PASSAGE_CHARS = 4
+
+    def __init__(self, output_dir, gold_path=None, match_threshold=0.6):
+        """
+        :param output_dir: 輸出目錄（向量資料庫與結果）
+        :param gold_path: 正確段落 CSV 檔案路徑（可選）
+        :param match_threshold: 視為命中的最低字元二元組覆蓋率
+        """
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.index = BenchmarkIndex(self.output_dir / 'indexes')
+        self.match_threshold = match_threshold
+        self.questions = self._load_questions(gold_path)
+
+    def _load_questions(self, gold_path):
+        """返回 [(QA_No, 問題, [正確段落])]，略過沒有可比對段落的問題。"""
+        qa_data = pd.read_csv(QA_PATH)
+        passages = defaultdict(list)
+        if gold_path:
+            for row in pd.read_csv(gold_path).itertuples():
+                passages[int(row.QA_No)].append(row.Passage)
+        else:
+            for row in qa_data.itertuples():
+                passages[int(row.QA_No)].extend(str(row.Answer).splitlines())
+
+        questions = []
+        for row in qa_data.itertuples():
+            gold = [self._normalize(passage) for passage in passages[int(row.QA_No)]]
+            gold = [passage for passage in gold if len(passage) >= self.MIN_PASSAGE_CHARS]
+            if gold:
+                questions.append((int(row.QA_No), row.Question, gold))
+        if not questions:
+            raise ValueError(f"沒有任何問題有長度至少 {self.MIN_PASSAGE_CHARS} 字的正確段落，"
+                             f"請確認 gold 檔案 ({gold_path or 'Answer 欄位'}) 的 QA_No 與 Passage 欄位")
+        logging.info(f"共 {len(qa_data)} 個問題，{len(questions)} 個有可比對的正確段落")
+        return questions
+
+    def run(self, embeddings, chunkers, k_values, fetch_k):
+        """
+        測試所有 (embedding 模型, 拆分策略) 組合，返回每個組合一列的結果 DataFrame。
+
+        :param embeddings: embedding 模型列表
+        :param chunkers: DocumentModel.SPLITTERS 中的拆分策略名稱列表
+        :param k_values: 計算 recall@k 的 k 值列表（以最大的 k 檢索一次）
+        :param fetch_k: MMR 的候選文檔塊數量
+        """
+        max_k = max(k_values)
+        rows = []
+        for embedding in embeddings:
+            for chunker in chunkers:
+                vector_store_dir, index_stats = self.index.build(embedding, chunker)
+                retriever = Chroma(
+                    embedding_function=EmbeddingAPI.get_embedding_function('內部LLM', embedding),
+                    persist_directory=vector_store_dir.as_posix()
+                ).as_retriever(search_type="mmr", search_kwargs={"k": max_k, "fetch_k": max(fetch_k, max_k)})
+
+                latencies, reciprocal_ranks = [], []
+                recalls = defaultdict(list)
+                for _, question, gold in self.questions:
+                    start_time = time.perf_counter()
+                    documents = retriever.invoke(question)
+                    latencies.append(time.perf_counter() - start_time)
+
+                    chunks = [self._normalize(doc.page_content) for doc in documents]
+                    found_at = [self._first_match(passage, chunks) for passage in gold]
+                    for k in k_values:
+                        recalls[k].append(sum(rank is not None and rank < k for rank in found_at) / len(gold))
+                    ranks = [rank for rank in found_at if rank is not None]
+                    reciprocal_ranks.append(1 / (min(ranks) + 1) if ranks else 0.0)
+
+                latencies.sort()
+                row = {
+                    'embedding': embedding,
+                    'chunker': chunker,
+                    'chunks': index_stats['chunk_count'],
+                    'build_s': index_stats['build_seconds'],
+                    # 以前的版本建立時可能使用 embedding 快取，命中數大於 0 時建立時間偏低
+                    'cache_hits': index_stats.get('cache_hits', 0),
+                    'index_mb': index_stats['index_bytes'] / 1024 ** 2,
+                    **{f'recall@{k}': sum(recalls[k]) / len(recalls[k]) for k in k_values},
+                    'mrr': sum(reciprocal_ranks) / len(reciprocal_ranks),
+                    'p50_ms': self._percentile(latencies, 0.50) * 1000,
+                    'p95_ms': self._percentile(latencies, 0.95) * 1000,
+                }
+                logging.info(f"{embedding} / {chunker}: {row}")
+                rows.append(row)
+
+        df = pd.DataFrame(rows)
+        df.to_csv(self.output_dir / 'retrieval_results.csv', index=False, encoding='utf-8-sig')
+        return df
+
+    def _first_match(self, passage, chunks):
+        """返回第一個包含正確段落的文檔塊名次（從 0 開始），未命中時返回 None。"""
+        for rank, chunk in enumerate(chunks):
+            if self.coverage(passage, chunk) >= self.match_threshold:
+                return rank
+        return None
+
+    @staticmethod
+    def coverage(passage, chunk):
+        """正確段落的字元二元組出現在文檔塊中的比例。"""
+        if passage in chunk:
+            return 1.0
+        passage_bigrams = {passage[i:i + 2] for i in range(len(passage) - 1)}
+        chunk_bigrams = {chunk[i:i + 2] for i in range(len(chunk) - 1)}
+        return len(passage_bigrams & chunk_bigrams) / len(passage_bigrams) if passage_bigrams else 0.0
+
+    @staticmethod
+    def _normalize(text):
+        """移除空白、標點與 Markdown 符號，並轉為小寫。"""
+        return IGNORED_CHARS_PATTERN.sub('', str(text)).lower()
+
+    @staticmethod
+    def _percentile(sorted_values, fraction):
+        return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def main():
+    """
+    主程序執行入口：比較各拆分策略與 embedding 模型的檢索品質（recall@k、MRR）、建立成本與檢索延遲。
+    """
+    parser = argparse.ArgumentParser(description="RAG 檢索效能測試（不生成回答）")
+    parser.add_argument('--embeddings', nargs='+', default=['bge-m3'], help="embedding 模型")
+    parser.add_argument('--chunkers', nargs='+', default=list(DocumentModel.SPLITTERS),
+                        choices=list(DocumentModel.SPLITTERS), help="拆分策略")
+    parser.add_argument('--k', nargs='+', type=int, default=[1, 3, 5], help="計算 recall@k 的 k 值")
+    parser.add_argument('--fetch-k', type=int, default=20, help="MMR 的候選文檔塊數量")
+    parser.add_argument('--gold', default=None, help="正確段落 CSV 檔案（QA_No, Passage），預設使用 Answer 欄位")
+    parser.add_argument('--match-threshold', type=float, default=0.6, help="視為命中的最低字元二元組覆蓋率")
+    parser.add_argument('--output-dir', default='./mockdata/benchmark', help="輸出目錄")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    benchmark = RetrievalBenchmark(args.output_dir, args.gold, args.match_threshold)
+    df = benchmark.run(args.embeddings, args.chunkers, args.k, args.fetch_k)
+
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(df.round(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -18,17 +18,9 @@ class SessionInitializer:
 
     def initialize_session_state(self):
         """初始化 Session 狀態，並儲存到字典 chat_session_data 中。"""
-        # 從 user_records_db 載入資料，只取 active_window_index 欄位
+        # 從 user_records_db 取得聊天窗口的數量（只查詢 conversations 表格，與訊息數量無關）
         userRecords_db = UserRecordsDB(self.username)
-        database = userRecords_db.load_database(
-            'chat_history',
-            ['active_window_index'])
-
-        # 設置聊天窗口的數量及活躍窗口索引
-        if not database.empty:
-            num_chat_windows = len(set(database['active_window_index']))
-        else:
-            num_chat_windows = 0
+        num_chat_windows = userRecords_db.count_windows()
 
         active_window_index = num_chat_windows
         num_chat_windows += 1  # 為新聊天窗口增加計數
@@ -49,7 +41,11 @@ class SessionInitializer:
             'db_name': '',
             'db_source': '',
             'chat_history': [],
+            'has_older_messages': False,
             'title': '',
+            'window_list': None,  # 側邊欄的窗口列表快取
+            'bypass_answer_cache': False,  # 個人KM 不使用語意快取的回答
+            'llm_cache': False,  # 對話預設不使用 LLM 回應的完全比對快取
 
             'upload_time': None,
             'username': self.username,  # 設置使用者名稱
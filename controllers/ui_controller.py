@@ -1,4 +1,5 @@
 from models.database_userRecords import UserRecordsDB
+from models.chat_history_cache import chat_history_cache
 import uuid
 
 
@@ -10,19 +11,38 @@ class UIController:
 
     def get_title(self, index):
         """根據窗口索引返回標題"""
-        # 從資料庫加載數據
-        userRecords_db = UserRecordsDB(self.username)
-        df_database = userRecords_db.load_database(
-            'chat_history',
-            ['active_window_index', 'title'])
-        df_window = df_database[df_database['active_window_index'] == index]
+        windows = self.list_windows()
 
-        # 設置標題，如果無數據則為新對話
-        if not df_window.empty:
-            window_title = df_window['title'].iloc[0]
-        else:
-            window_title = "(新對話)"
-        return window_title
+        # 如果無數據則為新對話
+        if index < len(windows) and windows[index][1] is not None:
+            return windows[index][1]
+        return "(新對話)"
+
+    def list_windows(self):
+        """返回所有窗口的 (index, title, last_activity)，結果快取於 chat_session_data"""
+        if self.chat_session_data.get('window_list') is None:
+            userRecords_db = UserRecordsDB(self.username)
+            self.chat_session_data['window_list'] = userRecords_db.list_windows()
+        return self.chat_session_data['window_list']
+
+    def invalidate_window_list(self):
+        """新增訊息或刪除窗口後，清除快取的窗口列表"""
+        self.chat_session_data['window_list'] = None
+
+    def load_older_messages(self):
+        """載入目前窗口中更早的一頁訊息，加在聊天記錄的最前面"""
+        chat_history = self.chat_session_data.get('chat_history', [])
+        if not chat_history or chat_history[0].get('id') is None:
+            return self.chat_session_data
+
+        userRecords_db = UserRecordsDB(self.username)
+        older_messages, has_older = userRecords_db.get_messages(
+            self.chat_session_data.get('conversation_id'),
+            UserRecordsDB.MESSAGE_PAGE_SIZE,
+            before_id=chat_history[0]['id'])
+        self.chat_session_data['chat_history'] = older_messages + chat_history
+        self.chat_session_data['has_older_messages'] = has_older
+        return self.chat_session_data
 
     def new_chat(self):
         """創建新聊天窗口，更新 chat_session_data 狀態"""
@@ -49,7 +69,8 @@ class UIController:
             'db_name': None,
             'db_source': None,
             'title': '',
-            'chat_history': []
+            'chat_history': [],
+            'has_older_messages': False
         }
         for key, value in reset_session_state.items():
             self.chat_session_data[key] = value
@@ -57,11 +78,12 @@ class UIController:
 
     def delete_chat_history_and_update_indexes(self, delete_index):
         """刪除指定聊天窗口並更新索引"""
-        # 刪除指定聊天窗口索引的聊天歷史記錄
+        # 刪除指定聊天窗口索引的聊天歷史記錄（其餘窗口的索引由顯示順序推算，不需更新）
         userRecords_db = UserRecordsDB(self.username)
+        conversation_id = userRecords_db.get_conversation_id(delete_index)
         userRecords_db.delete_chat_by_index(delete_index)
-        # 更新剩餘聊天窗口的索引
-        userRecords_db.update_chat_indexes(delete_index)
+        chat_history_cache.invalidate(self.username, conversation_id)
+        self.invalidate_window_list()
         # 更新聊天窗口的數量
         self.chat_session_data['num_chat_windows'] -= 1
         return self.chat_session_data
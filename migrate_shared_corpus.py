@@ -0,0 +1,157 @@
+import argparse
+import hashlib
+import logging
+import shutil
+from langchain_chroma import Chroma
+from apis.file_paths import FilePaths
+from models.document_corpus import DocumentCorpus
+from models.database_base import BaseDB
+from models.vector_store_cache import vector_store_cache
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class SharedCorpusMigrator:
+    """
+    將舊有的對話專屬向量資料庫 (data/user/<user>/<conversation_id>/vector_store)
+    合併到共用文件庫，已收錄過的文件只會建立引用，不會重複寫入向量。
+    """
+
+    # 每次寫入共用向量資料庫的向量數量
+    UPSERT_BATCH_SIZE = 500
+    # 查不到上傳紀錄時使用的 embedding 模型
+    DEFAULT_EMBEDDING = 'bge-m3'
+
+    def __init__(self, base_dir=None, delete_legacy=False, dry_run=False):
+        """
+        Args:
+            base_dir (str, optional): data 目錄路徑，預設為專案的 data 資料夾。
+            delete_legacy (bool): 合併後是否刪除舊有的向量資料庫目錄。
+            dry_run (bool): 只列出將合併的對話，不做任何寫入。
+        """
+        self.file_paths = FilePaths(base_dir)
+        self.delete_legacy = delete_legacy
+        self.dry_run = dry_run
+        self.corpus = DocumentCorpus(self.file_paths.get_shared_dir().joinpath('DocumentCorpus.db'))
+
+    def run(self):
+        """遍歷所有使用者的對話目錄，逐一合併。"""
+        user_root = self.file_paths.base_dir / 'user'
+        if not user_root.exists():
+            logging.info(f"找不到使用者目錄：{user_root}")
+            return
+
+        migrated = 0
+        for legacy_dir in sorted(user_root.glob('*/*/vector_store')):
+            conversation_dir = legacy_dir.parent
+            username = conversation_dir.parent.name
+            if legacy_dir.joinpath(DocumentCorpus.MIGRATED_MARKER).exists():
+                continue
+            try:
+                if self.migrate_conversation(username, conversation_dir.name):
+                    migrated += 1
+            except Exception as e:
+                logging.error(f"合併對話 {username}/{conversation_dir.name} 時發生錯誤：{e}")
+        logging.info(f"已合併 {migrated} 個對話的向量資料庫。")
+
+    def migrate_conversation(self, username, conversation_id):
+        """合併單一對話的向量資料庫，返回是否有合併。"""
+        legacy_dir = self.file_paths.get_local_vector_store_dir(username, conversation_id)
+        data = Chroma(persist_directory=legacy_dir.as_posix())._collection.get(
+            include=['embeddings', 'documents', 'metadatas'])
+        if not data['ids']:
+            logging.info(f"略過空的向量資料庫：{legacy_dir}")
+            return False
+
+        embedding = self._lookup_embedding(username, conversation_id)
+        doc_id = self._legacy_doc_id(username, conversation_id, data['documents'])
+        org_name = self._lookup_org_name(username, conversation_id)
+        logging.info(f"合併 {username}/{conversation_id}: {len(data['ids'])} 個文檔塊 → doc_id={doc_id[:12]}... ({embedding})")
+        if self.dry_run:
+            return True
+
+        # 尚未收錄的文件才寫入共用向量資料庫
+        if not self.corpus.is_ingested(doc_id, embedding):
+            shared_dir = self.file_paths.get_shared_vector_store_dir(embedding)
+            collection = Chroma(persist_directory=shared_dir.as_posix())._collection
+            for start in range(0, len(data['ids']), self.UPSERT_BATCH_SIZE):
+                end = start + self.UPSERT_BATCH_SIZE
+                chunk_ids = [f"{doc_id}-{i}" for i in range(start, min(end, len(data['ids'])))]
+                collection.upsert(
+                    ids=chunk_ids,
+                    embeddings=data['embeddings'][start:end],
+                    documents=data['documents'][start:end],
+                    metadatas=[{**(metadata or {}), 'doc_id': doc_id, 'chunk_id': chunk_id}
+                               for metadata, chunk_id in zip(data['metadatas'][start:end], chunk_ids)]
+                )
+            self.corpus.add_document(doc_id, embedding, org_name, len(data['ids']))
+            vector_store_cache.invalidate(shared_dir)
+
+        # 讓對話引用共用文件庫中的文件
+        self.corpus.link_documents(username, conversation_id, {doc_id: org_name})
+
+        if self.delete_legacy:
+            shutil.rmtree(legacy_dir)
+            vector_store_cache.invalidate(legacy_dir)
+            logging.info(f"已刪除舊有的向量資料庫：{legacy_dir}")
+        else:
+            # 標記為已合併，RAGModel 不再同時檢索舊有的向量資料庫
+            legacy_dir.joinpath(DocumentCorpus.MIGRATED_MARKER).touch()
+        return True
+
+    def _legacy_doc_id(self, username, conversation_id, documents):
+        """
+        計算舊有向量資料庫對應的 doc_id。
+
+        對話只有一份臨時文件時使用該文件的 sha256（與新上傳的文件一致，可直接共用）；
+        多份文件時使用各文件 sha256 的組合；找不到臨時文件時使用文檔塊內容的 sha256。
+        """
+        tmp_dir = self.file_paths.get_tmp_dir(username, conversation_id)
+        file_hashes = sorted(DocumentCorpus.file_hash(file.read_bytes()) for file in tmp_dir.glob('*.pdf'))
+        if len(file_hashes) == 1:
+            return file_hashes[0]
+        if file_hashes:
+            return hashlib.sha256('\n'.join(file_hashes).encode('utf-8')).hexdigest()
+        return hashlib.sha256('\n'.join(documents).encode('utf-8')).hexdigest()
+
+    def _lookup_embedding(self, username, conversation_id):
+        """從使用者的 pdf_uploads 紀錄中查詢對話使用的 embedding 模型。"""
+        rows = self._fetch_user_records(
+            username,
+            "SELECT embedding FROM pdf_uploads WHERE conversation_id = ? ORDER BY id DESC LIMIT 1",
+            (conversation_id,))
+        return rows[0][0] if rows and rows[0][0] else self.DEFAULT_EMBEDDING
+
+    def _lookup_org_name(self, username, conversation_id):
+        """從使用者的 file_names 紀錄中查詢對話上傳的原始檔名。"""
+        rows = self._fetch_user_records(
+            username,
+            "SELECT DISTINCT org_name FROM file_names WHERE conversation_id = ?",
+            (conversation_id,))
+        return ', '.join(row[0] for row in rows if row[0]) or conversation_id
+
+    def _fetch_user_records(self, username, query, params):
+        """查詢使用者紀錄資料庫，資料庫不存在時返回空列表。"""
+        db_path = self.file_paths.get_user_records_dir(username).joinpath(f"{username}.db")
+        if not db_path.exists():
+            return []
+        return BaseDB(db_path).fetch_query(query, params)
+
+
+def main():
+    """
+    主程序執行入口：將對話專屬的向量資料庫合併到共用文件庫。
+    """
+    parser = argparse.ArgumentParser(description="將對話專屬的向量資料庫合併到共用文件庫")
+    parser.add_argument('--base-dir', default=None, help="data 目錄路徑（預設為專案的 data 資料夾）")
+    parser.add_argument('--delete-legacy', action='store_true', help="合併後刪除舊有的向量資料庫目錄")
+    parser.add_argument('--dry-run', action='store_true', help="只列出將合併的對話，不做任何寫入")
+    args = parser.parse_args()
+
+    print("=== 開始合併向量資料庫 ===")
+    SharedCorpusMigrator(args.base_dir, args.delete_legacy, args.dry_run).run()
+    print("=== 合併完成 ===")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import json
+import time
+import random
+import logging
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from models.database_base import BaseDB
+
+
+class BatchRunner:
+    """
+    評估用的並行批次執行器。
+
+    - 以有界的執行緒池同時執行多個工作（生成回答或評分），結果依輸入順序返回。
+    - 遇到速率限制 (HTTP 429) 或暫時性的連線錯誤時，以指數退避加隨機抖動重試。
+    - 每完成一個工作即寫入檢查點 (SQLite)，中途中斷後重新執行時略過已完成的工作。
+    - 結束時回報吞吐量（每分鐘完成的工作數）。
+    """
+
+    # 視為可重試的錯誤訊息片段
+    RETRYABLE_MESSAGES = ('429', 'rate limit', 'ratelimit', 'too many requests', 'timeout', 'timed out',
+                          'connection', 'temporarily unavailable', '503', '502')
+
+    def __init__(self, checkpoint_path, run_name, max_workers=4, max_retries=6, base_delay=2.0, max_delay=60.0):
+        """
+        :param checkpoint_path: 檢查點資料庫路徑
+        :param run_name: 執行名稱；相同名稱與工作鍵的結果會被重複使用
+        :param max_workers: 同時執行的工作數
+        :param max_retries: 可重試錯誤的最多重試次數
+        :param base_delay: 第一次重試前等待的秒數
+        :param max_delay: 單次重試最長等待的秒數
+        """
+        self.run_name = run_name
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.base_db = BaseDB(Path(checkpoint_path))
+        self.base_db.ensure_db_path_exists()
+        self.base_db.execute_query('''
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                run_name TEXT,
+                task_key TEXT,
+                result TEXT,
+                completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (run_name, task_key)
+            )
+        ''')
+        self._progress_lock = threading.Lock()
+
+    @classmethod
+    def is_retryable_error(cls, error):
+        """判斷錯誤是否為速率限制或暫時性的錯誤。"""
+        if type(error).__name__ in ('RateLimitError', 'APITimeoutError', 'APIConnectionError'):
+            return True
+        message = str(error).lower()
+        return any(fragment in message for fragment in cls.RETRYABLE_MESSAGES)
+
+    def run(self, tasks, func, description='工作'):
+        """
+        並行執行工作，依輸入順序返回結果。
+
+        :param tasks: (工作鍵, 參數 tuple) 列表；工作鍵需能唯一識別工作內容
+        :param func: 執行單一工作的函式，以參數 tuple 展開呼叫，返回可 JSON 序列化的結果；
+                     返回 None 表示工作失敗，不寫入檢查點，下次執行時重新執行
+        :param description: 進度訊息中的工作名稱
+        :return: 結果列表，順序與 tasks 相同
+        """
+        results = [None] * len(tasks)
+        completed = self.load_results()
+        pending = []
+        for position, (task_key, args) in enumerate(tasks):
+            if task_key in completed:
+                results[position] = completed[task_key]
+            else:
+                pending.append((position, task_key, args))
+        logging.info(f"{description}: 共 {len(tasks)} 個，檢查點已完成 {len(tasks) - len(pending)} 個，"
+                     f"待執行 {len(pending)} 個 (並行 {self.max_workers})")
+
+        start_time = time.perf_counter()
+        progress = {'done': 0}
+
+        def execute(position, task_key, args):
+            result = self._call_with_backoff(func, args)
+            results[position] = result
+            if result is not None:
+                self.base_db.execute_query(
+                    "INSERT OR REPLACE INTO checkpoints (run_name, task_key, result) VALUES (?, ?, ?)",
+                    (self.run_name, task_key, json.dumps(result, ensure_ascii=False, default=str)))
+            with self._progress_lock:
+                progress['done'] += 1
+                done = progress['done']
+            if done % 10 == 0 or done == len(pending):
+                logging.info(f"{description}: {done}/{len(pending)} "
+                             f"({self._per_minute(done, time.perf_counter() - start_time):.1f} 個/分鐘)")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(execute, *task) for task in pending]
+            for future in futures:
+                future.result()
+
+        elapsed = time.perf_counter() - start_time
+        logging.info(f"{description}完成: {len(pending)} 個，耗時 {elapsed:.1f}s，"
+                     f"吞吐量 {self._per_minute(len(pending), elapsed):.1f} 個/分鐘")
+        return results
+
+    def _call_with_backoff(self, func, args):
+        """呼叫 func，遇到可重試的錯誤時以指數退避重試。"""
+        for retry in range(self.max_retries + 1):
+            try:
+                return func(*args)
+            except Exception as e:
+                if retry == self.max_retries or not self.is_retryable_error(e):
+                    raise
+                delay = min(self.base_delay * 2 ** retry, self.max_delay) * random.uniform(0.5, 1.5)
+                logging.warning(f"可重試的錯誤，{delay:.1f}s 後第 {retry + 1} 次重試: {e}")
+                time.sleep(delay)
+
+    def forget(self, task_keys):
+        """刪除指定工作的檢查點，下次執行時重新執行（例如重試失敗的工作）。"""
+        self.base_db.execute_many(
+            "DELETE FROM checkpoints WHERE run_name = ? AND task_key = ?",
+            [(self.run_name, task_key) for task_key in task_keys])
+
+    def load_results(self):
+        """載入此執行名稱已完成的工作結果 {工作鍵: 結果}。"""
+        rows = self.base_db.fetch_query(
+            "SELECT task_key, result FROM checkpoints WHERE run_name = ?", (self.run_name,))
+        return {task_key: json.loads(result) for task_key, result in rows}
+
+    @staticmethod
+    def _per_minute(count, seconds):
+        return count * 60 / seconds if seconds > 0 else 0.0
@@ -0,0 +1,76 @@
+import json
+import time
+import hashlib
+import logging
+from pathlib import Path
+from models.document_model import DocumentModel
+
+
+class BenchmarkIndex:
+    """
+    為效能測試建立獨立的向量資料庫，每個 (embedding 模型, 拆分策略) 各自一個目錄。
+
+    已建立的向量資料庫直接重複使用（建立統計保存在目錄中的 build_stats.json），
+    中斷後重新執行或多次測試時不需重新嵌入。建立時不使用 embedding 快取，建立時間反映實際的嵌入耗時。
+    """
+
+    STATS_FILE = 'build_stats.json'
+
+    def __init__(self, base_dir, pdf_path='./mockdata/A_出差辦法bot_原.pdf'):
+        """
+        :param base_dir: 向量資料庫的根目錄
+        :param pdf_path: 收錄的測試文件
+        """
+        self.base_dir = Path(base_dir)
+        self.pdf_path = Path(pdf_path)
+
+    def get_dir(self, embedding, chunker):
+        """返回 (embedding 模型, 拆分策略) 的向量資料庫目錄。"""
+        return self.base_dir / embedding / chunker
+
+    def build(self, embedding, chunker):
+        """
+        建立（或重複使用）向量資料庫。
+
+        :param embedding: embedding 模型名稱
+        :param chunker: DocumentModel.SPLITTERS 中的拆分策略名稱
+        :return: (向量資料庫目錄, 統計資料 {'build_seconds', 'chunk_count', 'index_bytes', 'cache_hits'})
+        """
+        vector_store_dir = self.get_dir(embedding, chunker)
+        stats_path = vector_store_dir / self.STATS_FILE
+        if stats_path.exists():
+            return vector_store_dir, json.loads(stats_path.read_text(encoding='utf-8'))
+
+        document_model = DocumentModel({
+            'mode': '內部LLM',  # RAGModel 一律以內部 embedding 模型檢索
+            'embedding': embedding,
+            'username': 'benchmark',
+            'conversation_id': f"{embedding}-{chunker}",
+            'vector_store_dir': vector_store_dir,
+            'use_embedding_cache': False,  # 每次建立都實際嵌入，建立時間可互相比較
+        })
+        split_function = document_model.get_split_function(chunker)
+        content = self.pdf_path.read_bytes()
+        doc_names = document_model.create_temporary_files([
+            {'doc_id': hashlib.sha256(content).hexdigest(), 'content': content, 'name': self.pdf_path.name}
+        ])
+
+        logging.info(f"建立向量資料庫: {embedding} / {chunker}")
+        start_time = time.perf_counter()
+        try:
+            ingest_stats = document_model.ingest_documents(list(doc_names), split_function)
+        finally:
+            document_model.delete_temporary_files(list(doc_names))
+        stats = {
+            'build_seconds': time.perf_counter() - start_time,
+            'chunk_count': ingest_stats['chunk_count'],
+            'index_bytes': self.directory_bytes(vector_store_dir),
+            'cache_hits': ingest_stats['cache_hits'],
+        }
+        stats_path.write_text(json.dumps(stats), encoding='utf-8')
+        return vector_store_dir, stats
+
+    @staticmethod
+    def directory_bytes(directory):
+        """計算目錄中所有檔案的總大小（位元組）。"""
+        return sum(path.stat().st_size for path in Path(directory).rglob('*') if path.is_file())
@@ -1,8 +1,11 @@
 import pandas as pd
 import logging
 from apis.llm_api import LLMAPI
+from models.llm_response_cache import LLMResponseCache
 import sqlite3
 import json
+import hashlib
+from mockdata.batch_runner import BatchRunner
 
 
 class ResponseEvaluator:
@@ -10,7 +13,8 @@ class ResponseEvaluator:
     回應評估類別，負責整體流程：讀取資料、評估回應、儲存結果。
     """
 
-    def __init__(self, input_file: str, output_file: str, mode: str, llm_option: str, evaluation_attempts: int = 3):
+    def __init__(self, input_file: str, output_file: str, mode: str, llm_option: str, evaluation_attempts: int = 3,
+                 use_cache: bool = True, max_workers: int = 8):
         """
         初始化 ResponseEvaluator。
 
@@ -19,12 +23,22 @@ class ResponseEvaluator:
         :param mode: 模式選擇（內部或外部模型）
         :param llm_option: 模型名稱
         :param evaluation_attempts: 評估嘗試次數（預設 3 次以提高穩定性）
+        :param use_cache: 是否使用 LLM 回應快取（每次嘗試使用各自的命名空間，重複執行時結果一致）
+        :param max_workers: 同時評估的回應數量
         """
         self.input_file = input_file  # 輸入檔案路徑
         self.output_file = output_file  # 輸出檔案路徑
         self.evaluation_attempts = evaluation_attempts  # 評估次數
+        self.run_name = f"evaluate:{mode}:{llm_option}"
+        self.max_workers = max_workers
         try:
-            self.llm = LLMAPI.get_llm(mode, llm_option)  # 初始化 LLM
+            # 初始化 LLM：每次嘗試各自快取，多次評估仍為獨立的結果
+            self.llms = [
+                LLMAPI.get_llm(mode, llm_option,
+                               cache=LLMResponseCache.from_setting(use_cache and f'evaluation-{attempt}'))
+                for attempt in range(evaluation_attempts)
+            ]
+            self.llm = self.llms[0]
         except Exception as e:
             logging.error(f"無法初始化 LLM：{e}")
             raise
@@ -84,36 +98,65 @@ class ResponseEvaluator:
         :param df: pandas DataFrame，包含預期回應與實際回應
         :return: 更新後的 DataFrame，新增相似度分數欄位
         """
-        evaluations = []
-
-        # 多次評估（根據設定的嘗試次數），提高模型回應穩定性
-        for attempt in range(self.evaluation_attempts):
-            scores = [
-                self._evaluate_single_response(row['Question'], row['Answer'], row['Test'])
-                for _, row in df.iterrows()
-            ]
-            evaluations.append(scores)
+        # 多次評估（根據設定的嘗試次數），提高模型回應穩定性；所有嘗試與列一起並行評估
+        rows = [(row['Question'], row['Answer'], row['Test']) for _, row in df.iterrows()]
+        tasks = [
+            (self._task_key(attempt, index, row), (*row, attempt))
+            for attempt in range(self.evaluation_attempts)
+            for index, row in enumerate(rows)
+        ]
+        # 並行評估，並將每個評分寫入檢查點，中斷後重新執行時略過已完成的評分
+        batch_runner = BatchRunner(
+            checkpoint_path=self.output_file.replace('.csv', '_checkpoint.db'),
+            run_name=self.run_name,
+            max_workers=self.max_workers
+        )
+        scores = batch_runner.run(tasks, self._evaluate_single_response, description='評估回應')
+        evaluations = [scores[attempt * len(rows):(attempt + 1) * len(rows)]
+                       for attempt in range(self.evaluation_attempts)]
 
         print('1. evaluations: ', evaluations)
 
-        # 計算每列的平均分數
-        average_scores = [
-            sum(score_list) / len(score_list)
-            for score_list in zip(*evaluations)
-        ]
+        # 計算每列的平均分數（略過評估失敗的嘗試，全部失敗時為 None）
+        average_scores = [self._average(score_list) for score_list in zip(*evaluations)]
+        failed = sum(score is None for score in average_scores)
+        if failed:
+            logging.warning(f"{failed} 個回應無法評估，重新執行時將重新評估")
         # 平均分數 > 0.5 即為 True，並新增欄位
         df['SimilarityScore'] = average_scores
-        df['SimilarityBoolean'] = [score > 0.5 for score in average_scores]
+        df['SimilarityBoolean'] = [score is not None and score > 0.5 for score in average_scores]
         return df
 
-    def _evaluate_single_response(self, query: str, expected_response: str, generated_response: str) -> float:
+    @staticmethod
+    def _average(scores):
+        """計算有效分數的平均值，沒有有效分數時返回 None。"""
+        valid_scores = [score for score in scores if score is not None]
+        return sum(valid_scores) / len(valid_scores) if valid_scores else None
+
+    def score(self, query: str, expected_response: str, generated_response: str):
+        """
+        以所有評估嘗試評分單一回應，返回平均分數（供效能測試逐題評分）。
+
+        :param query: 問題文字
+        :param expected_response: 預期回應文字
+        :param generated_response: 實際回應文字
+        :return: 平均分數（0 到 1）；所有評估嘗試都失敗時返回 None
+        """
+        return self._average([
+            self._evaluate_single_response(query, expected_response, generated_response, attempt)
+            for attempt in range(self.evaluation_attempts)
+        ])
+
+    def _evaluate_single_response(self, query: str, expected_response: str, generated_response: str,
+                                  attempt: int = 0):
         """
         使用模型評估單一回應是否包含預期回應的必要內容。
 
         :param query: 問題文字
         :param expected_response: 預期回應文字
         :param generated_response: 實際回應文字
-        :return: 分數（0 或 1 表示是否符合預期）
+        :param attempt: 第幾次評估
+        :return: 分數（0 或 1 表示是否符合預期）；無法評估時返回 None（不寫入檢查點，重新執行時重新評估）
         """
         prompt = self.prompt_template.format(
             query=query,
@@ -122,7 +165,7 @@ class ResponseEvaluator:
         )
 
         try:
-            evaluation_result = self.llm.invoke(prompt).content.strip().lower()
+            evaluation_result = self.llms[attempt].invoke(prompt).content.strip().lower()
 
             print('2. evaluation_result: ', evaluation_result)
 
@@ -139,8 +182,24 @@ class ResponseEvaluator:
             else:
                 raise ValueError("無法判斷模型回應結果，應為 '*t' 或 '*f'。")
         except Exception as e:
+            # 速率限制等暫時性錯誤交由 BatchRunner 退避重試
+            if BatchRunner.is_retryable_error(e):
+                raise
             logging.error(f"評估單一回應時發生錯誤：{e}")
-            return 0
+            return None
+
+    @staticmethod
+    def _task_key(attempt: int, index: int, row: tuple) -> str:
+        """
+        評分工作的檢查點鍵，包含列的內容雜湊，回答變更後不會沿用舊的評分。
+
+        :param attempt: 第幾次評估
+        :param index: 列的位置
+        :param row: (問題, 預期回應, 實際回應)
+        :return: 工作鍵
+        """
+        content_hash = hashlib.sha256('\0'.join(str(value) for value in row).encode('utf-8')).hexdigest()
+        return f"{attempt}:{index}:{content_hash}"
 
 
     def _save_data(self, df: pd.DataFrame):
@@ -0,0 +1,135 @@
+import time
+import queue
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from models.database_base import BaseDB
+
+logging.basicConfig(level=logging.INFO)
+
+
+class AuditWriter:
+    """
+    非同步的批次寫入器 (write-behind)。
+
+    呼叫端只將 (SQL, 參數) 放入佇列即返回，背景執行緒累積到 batch_size 筆或經過 flush_seconds 秒後，
+    以同一語句的多筆資料為一個交易寫入；行程結束時 (atexit) 寫入佇列中剩餘的資料。
+    佇列已滿時捨棄新資料並記錄警告，不阻塞呼叫端。
+    """
+
+    def __init__(self, db_path, batch_size=100, flush_seconds=1.0, max_queue_size=10000):
+        """
+        Args:
+            db_path (Path): 資料庫路徑。
+            batch_size (int): 累積多少筆資料時寫入。
+            flush_seconds (float): 最長多久寫入一次（秒）。
+            max_queue_size (int): 佇列容量。
+        """
+        self.base_db = BaseDB(db_path)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stop = threading.Event()
+        self.stats = {'written': 0, 'dropped': 0, 'batches': 0, 'errors': 0}
+
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, query, params=()):
+        """放入一筆待寫入的資料，立即返回。"""
+        try:
+            self._queue.put_nowait((query, params))
+        except queue.Full:
+            self.stats['dropped'] += 1
+            logging.warning(f"AuditWriter 佇列已滿，捨棄一筆資料 (累計 {self.stats['dropped']} 筆)")
+
+    def flush(self, timeout=5.0):
+        """
+        等待佇列中已放入的資料全部寫入，最長等待 timeout 秒。
+
+        Returns:
+            bool: 是否已全部寫入；背景執行緒已停止或逾時時返回 False。
+        """
+        if self._stop.is_set() or not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        try:
+            self._queue.put((None, done), timeout=timeout)
+        except queue.Full:
+            logging.warning("AuditWriter 佇列已滿，flush 逾時")
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """停止背景執行緒，並寫入佇列中剩餘的資料。"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        """背景執行緒：依數量或時間門檻批次寫入。"""
+        while True:
+            batch, flush_events = self._collect_batch()
+            if batch:
+                self._write(batch)
+            for event in flush_events:
+                event.set()
+            if self._stop.is_set() and self._queue.empty():
+                return
+
+    def _collect_batch(self):
+        """從佇列取出最多 batch_size 筆資料，最長等待 flush_seconds 秒。"""
+        batch = []
+        flush_events = []
+        try:
+            item = self._queue.get(timeout=self.flush_seconds)
+        except queue.Empty:
+            return batch, flush_events
+        # 從第一筆資料開始計時，最長 flush_seconds 秒後寫入
+        deadline = time.monotonic() + self.flush_seconds
+        while True:
+            query, params = item
+            if query is None:
+                # flush() 的標記：立即寫入目前累積的資料
+                flush_events.append(params)
+                break
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                break
+            try:
+                remaining = 0 if self._stop.is_set() else max(deadline - time.monotonic(), 0)
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+        return batch, flush_events
+
+    def _write(self, batch):
+        """將同一語句的資料合併為一個交易寫入。"""
+        rows_by_query = defaultdict(list)
+        for query, params in batch:
+            rows_by_query[query].append(params)
+        for query, rows in rows_by_query.items():
+            try:
+                self.base_db.execute_many(query, rows)
+                self.stats['written'] += len(rows)
+                self.stats['batches'] += 1
+            except Exception as e:
+                self.stats['errors'] += 1
+                logging.error(f"AuditWriter 寫入 {len(rows)} 筆資料時發生錯誤: {e}")
+
+
+# 各資料庫共用一個 AuditWriter
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_audit_writer(db_path):
+    """取得資料庫的 AuditWriter，不存在時建立。"""
+    with _writers_lock:
+        writer = _writers.get(str(db_path))
+        if writer is None:
+            writer = _writers[str(db_path)] = AuditWriter(db_path)
+        return writer
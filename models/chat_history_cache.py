@@ -0,0 +1,83 @@
+import logging
+import threading
+from collections import OrderedDict
+from models.database_userRecords import UserRecordsDB
+
+# from langchain.memory import ChatMessageHistory
+from langchain_community.chat_message_histories import ChatMessageHistory
+
+logging.basicConfig(level=logging.INFO)
+
+
+class ChatHistoryCache:
+    """
+    各對話 ChatMessageHistory 的 LRU 快取，以 (username, conversation_id) 為鍵。
+
+    - 未命中時從 UserRecordsDB 載入最近 max_turns 輪對話建立一次，之後每輪結束時只追加新的訊息，
+      不需在每次查詢時重播整個對話歷史。
+    - 每個對話最多保留 max_turns 輪；快取的對話數超過 max_entries 時淘汰最久未使用者。
+    - 刪除對話時呼叫 invalidate()。
+    """
+
+    def __init__(self, max_entries=256, max_turns=50):
+        """
+        Args:
+            max_entries (int): 最多快取的對話數量。
+            max_turns (int): 每個對話保留的對話輪數。
+        """
+        self.max_entries = max_entries
+        self.max_turns = max_turns
+        self._histories = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username, conversation_id):
+        """取得對話的 ChatMessageHistory，未快取時從資料庫載入。"""
+        key = (username, conversation_id)
+        with self._lock:
+            history = self._histories.get(key)
+            if history is not None:
+                self._histories.move_to_end(key)
+                return history
+
+        # 未命中：在鎖外讀取資料庫，避免阻塞其他對話
+        history = self._load(username, conversation_id)
+        with self._lock:
+            # 其他執行緒可能已同時載入，以先放入者為準
+            history = self._histories.setdefault(key, history)
+            self._histories.move_to_end(key)
+            while len(self._histories) > self.max_entries:
+                self._histories.popitem(last=False)
+            return history
+
+    def append(self, username, conversation_id, user_query, ai_response):
+        """將完成的一輪對話追加到已快取的 ChatMessageHistory（未快取時下次查詢再從資料庫載入）。"""
+        with self._lock:
+            history = self._histories.get((username, conversation_id))
+            if history is None:
+                return
+            history.add_user_message(user_query)
+            history.add_ai_message(ai_response)
+            # 每輪兩則訊息，超過 max_turns 時移除最早的訊息
+            overflow = len(history.messages) - self.max_turns * 2
+            if overflow > 0:
+                history.messages = history.messages[overflow:]
+
+    def invalidate(self, username, conversation_id):
+        """移除對話的快取。"""
+        with self._lock:
+            if self._histories.pop((username, conversation_id), None) is not None:
+                logging.info(f"ChatHistoryCache 已失效: {conversation_id}")
+
+    def _load(self, username, conversation_id):
+        """從 UserRecordsDB 載入最近 max_turns 輪對話，建立 ChatMessageHistory。"""
+        history = ChatMessageHistory()
+        if conversation_id:
+            records, _ = UserRecordsDB(username).get_messages(conversation_id, self.max_turns)
+            for record in records:
+                history.add_user_message(record['user_query'])
+                history.add_ai_message(record['ai_response'])
+        return history
+
+
+# 行程內共用的對話歷史快取
+chat_history_cache = ChatHistoryCache()
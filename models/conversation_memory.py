@@ -0,0 +1,181 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from apis.llm_api import LLMAPI
+from models.database_userRecords import UserRecordsDB
+
+logging.basicConfig(level=logging.INFO)
+
+
+class TokenBudgetMemory:
+    """
+    有 token 預算的對話記憶。
+
+    最近 KEEP_TURNS 輪對話原文保留，更早的對話併入滾動摘要；摘要以增量方式更新
+    （每次只將新移出的對話交給小模型併入），並快取於 chat_session_data 與 conversations 表格，
+    因此 prompt 長度與 Ollama 的 prefill 時間不會隨對話變長而無限增加。
+
+    摘要在背景執行緒中更新，本輪使用既有的摘要，不延遲回答的首個 token。
+    需要摘要的對話從資料庫分批讀取（不限於已載入的最新一頁），長對話中較早的訊息也會併入摘要。
+    """
+
+    # 原文保留的對話輪數
+    KEEP_TURNS = 4
+    # 各模型的對話記憶 token 預算（未列出的模型使用 DEFAULT_TOKEN_BUDGET）
+    DEFAULT_TOKEN_BUDGET = 2048
+    TOKEN_BUDGETS = {
+        'Gemma2': 2048,
+        'Gemma2:27b': 2048,
+        'Taiwan-llama3-8b': 2048,
+        'Taiwan-llama3-f16': 2048,
+        'Taide-llama3-8b-f16': 2048,
+        'gpt-4o': 8192,
+        'gpt-4o-mini': 8192,
+        'gpt-4': 4096,
+        'gpt-35-turbo': 4096,
+    }
+    # 預算中保留給摘要的比例
+    SUMMARY_RATIO = 0.25
+    # 每次併入摘要的最多對話輪數
+    SUMMARY_BATCH_TURNS = 10
+
+    # 更新摘要的共用執行緒，與回答並行執行
+    _summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='conversation-summary')
+    # 正在更新摘要的對話 (username, conversation_id)，避免重複提交
+    _pending = set()
+    _pending_lock = threading.Lock()
+
+    def __init__(self, chat_session_data):
+        self.chat_session_data = chat_session_data
+        self.mode = chat_session_data.get('mode')
+        self.conversation_id = chat_session_data.get('conversation_id')
+        self.token_budget = self.TOKEN_BUDGETS.get(chat_session_data.get('llm_option'), self.DEFAULT_TOKEN_BUDGET)
+        self.summary_key = f'conversation_summary_{self.conversation_id}'
+
+    @staticmethod
+    def estimate_tokens(text):
+        """粗估 token 數：中日韓文字約每字 1 個 token，其他文字約每 4 個字元 1 個 token。"""
+        cjk = sum(1 for ch in text if '⺀' <= ch <= '鿿' or '가' <= ch <= '힯')
+        return cjk + (len(text) - cjk + 3) // 4
+
+    @staticmethod
+    def format_turns(turns):
+        """將對話格式化為與 ConversationBufferMemory 相同的文字。"""
+        return '\n'.join(f"Human: {turn['user_query']}\nAI: {turn['ai_response']}" for turn in turns)
+
+    def load_history(self):
+        """
+        返回填入 prompt 的對話歷史：滾動摘要加上最近幾輪的原文。
+
+        Returns:
+            str: 對話歷史。
+        """
+        turns = self.chat_session_data.get('chat_history', [])
+        verbatim_turns = self._select_verbatim_turns(turns)
+        summary = self._update_summary(turns[:len(turns) - len(verbatim_turns)], verbatim_turns)
+
+        history = self.format_turns(verbatim_turns)
+        if summary:
+            history = f"先前對話摘要：{summary}\n{history}"
+        return history
+
+    def _select_verbatim_turns(self, turns):
+        """選出原文保留的最近幾輪對話，超過預算時再移出較早的對話（至少保留最近一輪）。"""
+        verbatim_turns = turns[-self.KEEP_TURNS:] if self.KEEP_TURNS else []
+        verbatim_budget = self.token_budget * (1 - self.SUMMARY_RATIO)
+        while len(verbatim_turns) > 1 and self.estimate_tokens(self.format_turns(verbatim_turns)) > verbatim_budget:
+            verbatim_turns = verbatim_turns[1:]
+        return verbatim_turns
+
+    def _update_summary(self, evicted_turns, verbatim_turns):
+        """
+        返回目前的摘要；有尚未摘要的移出對話時，在背景將它們併入摘要（下一輪起生效）。
+
+        移出的對話包含已載入的 evicted_turns，以及尚未載入、比已載入頁面更早的訊息（has_older_messages）。
+        """
+        summary, summary_upto = self._get_cached_summary()
+        verbatim_ids = [turn['id'] for turn in verbatim_turns if turn.get('id') is not None]
+        if not verbatim_ids:
+            return summary
+        before_id = min(verbatim_ids)
+
+        # 已載入的頁面中有新移出的對話，或更早的訊息尚未摘要（依訊息 id 判斷）
+        loaded_ids = [turn['id'] for turn in evicted_turns if turn.get('id') is not None]
+        first_loaded_id = min(loaded_ids, default=before_id)
+        has_new_turns = any(summary_upto is None or turn_id > summary_upto for turn_id in loaded_ids)
+        has_older_turns = (self.chat_session_data.get('has_older_messages')
+                           and (summary_upto is None or summary_upto < first_loaded_id))
+        if has_new_turns or has_older_turns:
+            self._submit_summary_update(summary, summary_upto, before_id)
+        return summary
+
+    def _submit_summary_update(self, summary, summary_upto, before_id):
+        """在背景執行緒中更新摘要；同一對話已在更新時略過。"""
+        pending_key = (self.chat_session_data.get('username'), self.conversation_id)
+        with TokenBudgetMemory._pending_lock:
+            if pending_key in TokenBudgetMemory._pending:
+                return
+            TokenBudgetMemory._pending.add(pending_key)
+
+        def run():
+            try:
+                self._summarize_until(summary, summary_upto, before_id)
+            except Exception as e:
+                # 摘要失敗時沿用原本的摘要，下一輪再重試
+                logging.warning(f"更新對話摘要時發生錯誤: {e}")
+            finally:
+                with TokenBudgetMemory._pending_lock:
+                    TokenBudgetMemory._pending.discard(pending_key)
+
+        self._summary_executor.submit(run)
+
+    def _summarize_until(self, summary, summary_upto, before_id):
+        """從資料庫分批讀取 id 小於 before_id 且尚未摘要的訊息，逐批併入摘要並保存。"""
+        user_records_db = UserRecordsDB(self.chat_session_data.get('username'))
+        llm = LLMAPI.get_utility_llm(self.mode)
+        summarized = 0
+        while True:
+            new_turns = self._fit_batch(user_records_db.get_messages_between(
+                self.conversation_id, summary_upto, before_id, self.SUMMARY_BATCH_TURNS))
+            if not new_turns:
+                break
+            summary = LLMAPI.to_text(llm.invoke(self._summary_prompt(summary, new_turns))).strip()
+            summary_upto = new_turns[-1]['id']
+            summarized += len(new_turns)
+            # 每批完成即保存，中途失敗時下一輪從此處繼續
+            self.chat_session_data[self.summary_key] = (summary, summary_upto)
+            user_records_db.save_summary(self.conversation_id, summary, summary_upto)
+        if summarized:
+            logging.info(f"已將 {summarized} 輪對話併入摘要 ({self.estimate_tokens(summary)} tokens)")
+
+    def _fit_batch(self, turns):
+        """限制每批對話的長度不超過預算，避免超出小模型的輸入長度（至少保留一輪）。"""
+        batch = turns[:1]
+        for turn in turns[1:]:
+            if self.estimate_tokens(self.format_turns(batch + [turn])) > self.token_budget:
+                break
+            batch.append(turn)
+        return batch
+
+    def _get_cached_summary(self):
+        """取得快取的摘要，不存在時從資料庫載入。"""
+        if self.summary_key not in self.chat_session_data:
+            self.chat_session_data[self.summary_key] = UserRecordsDB(
+                self.chat_session_data.get('username')).get_summary(self.conversation_id)
+        return self.chat_session_data[self.summary_key]
+
+    def _summary_prompt(self, summary, new_turns):
+        """生成增量摘要的提示。"""
+        max_tokens = int(self.token_budget * self.SUMMARY_RATIO)
+        return f"""
+        請將「新的對話」併入「既有摘要」，以台灣中文輸出更新後的摘要。請務必遵守以下規則：
+        1.保留使用者的需求、重要的事實、數字與結論。
+        2.摘要不超過 {max_tokens} 字。
+        3.只輸出摘要本身，不要有其他說明。
+        ---
+        既有摘要：
+        {summary or '(無)'}
+        ---
+        新的對話：
+        {self.format_turns(new_turns)}
+        """
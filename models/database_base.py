@@ -2,22 +2,68 @@
 from pathlib import Path
 import sqlite3
 import logging
+import threading
 
 logging.basicConfig(level=logging.INFO)
 
 class BaseDB:
+    """
+    SQLite 資料庫的基礎操作。
+
+    每個執行緒對每個資料庫檔案只開啟一個連線並重複使用（thread-local 連線池），
+    連線以 WAL 模式開啟，讀取不會被寫入阻塞，多個寫入者遇到鎖定時等待 busy_timeout 而非立即失敗；
+    連線內的 prepared statement 快取讓重複的 SQL 不需重新編譯。
+    """
+
+    # 等待資料庫鎖定的最長時間（毫秒）
+    BUSY_TIMEOUT_MS = 5000
+    # 每個連線的頁面快取大小（KiB）
+    CACHE_SIZE_KIB = 8192
+    # 每個連線快取的 prepared statement 數量
+    CACHED_STATEMENTS = 256
+
+    # 各執行緒的連線 {資料庫路徑: sqlite3.Connection}
+    _local = threading.local()
+
     def __init__(self, db_path: Path):
         self.db_path = db_path
     def ensure_db_path_exists(self):
         """確保資料庫文件夾存在。"""
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
 
+    def _get_connection(self):
+        """取得目前執行緒對此資料庫的連線，不存在時建立並設定 pragma。"""
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        key = str(self.db_path)
+        conn = connections.get(key)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=self.BUSY_TIMEOUT_MS / 1000,
+                cached_statements=self.CACHED_STATEMENTS)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL 模式下 NORMAL 仍可保證資料庫一致性，只有系統斷電時可能遺失最後的交易
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={self.BUSY_TIMEOUT_MS}")
+            conn.execute(f"PRAGMA cache_size=-{self.CACHE_SIZE_KIB}")
+            connections[key] = conn
+        return conn
+
+    def close(self):
+        """關閉目前執行緒對此資料庫的連線。"""
+        connections = getattr(self._local, 'connections', {})
+        conn = connections.pop(str(self.db_path), None)
+        if conn is not None:
+            conn.close()
+
     def execute_query(self, query: str, params=()):
         """執行資料庫的寫入操作。"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            conn = self._get_connection()
+            with conn:
                 conn.execute(query, params)
-                conn.commit()
         except sqlite3.OperationalError as e:
             logging.error(f"execute_query 資料庫操作錯誤: {e}")
             raise
@@ -25,9 +71,41 @@ class BaseDB:
     def fetch_query(self, query: str, params=()):
         """執行資料庫的查詢操作並返回結果。"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute(query, params)
-                return cursor.fetchall()
+            conn = self._get_connection()
+            return conn.execute(query, params).fetchall()
         except sqlite3.OperationalError as e:
             logging.error(f"fetch_query 資料庫操作錯誤: {e}")
-            raise
\ No newline at end of file
+            raise
+
+    def execute_many(self, query: str, params_seq):
+        """以單一交易執行多筆資料庫的寫入操作。"""
+        try:
+            conn = self._get_connection()
+            with conn:
+                conn.executemany(query, params_seq)
+        except sqlite3.OperationalError as e:
+            logging.error(f"execute_many 資料庫操作錯誤: {e}")
+            raise
+
+    def execute_transaction(self, statements):
+        """
+        以單一交易依序執行多個寫入語句（含 DDL），任一語句失敗時全部回滾。
+
+        Args:
+            statements (list): (query, params) 列表。
+
+        Returns:
+            int: 最後一個語句的 lastrowid。
+        """
+        try:
+            conn = self._get_connection()
+            with conn:
+                # 明確開始交易，讓 CREATE / DROP 等 DDL 也包含在同一個交易中
+                conn.execute("BEGIN")
+                cursor = None
+                for query, params in statements:
+                    cursor = conn.execute(query, params)
+            return cursor.lastrowid if cursor else None
+        except sqlite3.OperationalError as e:
+            logging.error(f"execute_transaction 資料庫操作錯誤: {e}")
+            raise
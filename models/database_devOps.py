@@ -1,5 +1,6 @@
 from datetime import datetime
 from models.database_base import BaseDB
+from models.audit_writer import get_audit_writer
 from apis.file_paths import FilePaths
 import logging
 
@@ -18,6 +19,9 @@ class DevOpsDB:
         self.base_db.ensure_db_path_exists()
         self._init_db()
 
+        # 稽核紀錄只供分析使用，由背景執行緒批次寫入，不增加回應延遲
+        self.audit_writer = get_audit_writer(self.db_path)
+
     def _init_db(self):
         """初始化資料庫，創建必要的表格。"""
         if not self.db_path.exists():
@@ -52,7 +56,10 @@ class DevOpsDB:
                     username TEXT,
                     conversation_id TEXT,
                     agent TEXT,
-                    embedding TEXT
+                    embedding TEXT,
+                    chunk_count INTEGER,
+                    cache_hits INTEGER,
+                    cache_hit_ratio REAL
                 )
             '''
             # 執行創建 PDF 上傳記錄表格的 SQL 語句
@@ -73,6 +80,32 @@ class DevOpsDB:
             self.base_db.execute_query(file_names_query)
             logging.info("DevOpsDB 資料庫初始化成功。")
 
+        # 為既有的資料庫補上新增的欄位
+        self._add_missing_columns('chat_history', {
+            'answer_cache_hit': 'INTEGER',
+            'response_seconds': 'REAL',
+            'saved_seconds': 'REAL'
+        })
+        self._add_missing_columns('pdf_uploads', {
+            'chunk_count': 'INTEGER',
+            'cache_hits': 'INTEGER',
+            'cache_hit_ratio': 'REAL'
+        })
+
+    def _add_missing_columns(self, table, columns):
+        """
+        若表格缺少指定欄位，則以 ALTER TABLE 新增。
+
+        Args:
+            table (str): 表格名稱。
+            columns (dict): {欄位名稱: 欄位型別}。
+        """
+        existing_columns = {row[1] for row in self.base_db.fetch_query(f"PRAGMA table_info({table})")}
+        for column, column_type in columns.items():
+            if column not in existing_columns:
+                self.base_db.execute_query(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                logging.info(f"DevOpsDB 已新增欄位 {table}.{column}")
+
     def save_to_database(self, query: str, response: str, chat_session_data):
         """
         將查詢結果保存到資料庫中。
@@ -102,23 +135,49 @@ class DevOpsDB:
             'user_query': query,
             'ai_response': response
         }.items()}
+        # 個人KM 的語意快取統計（其他助理為 NULL）
+        answer_cache_stats = chat_session_data.get('answer_cache_stats') or {}
+        data['answer_cache_hit'] = answer_cache_stats.get('hit')
+        data['response_seconds'] = answer_cache_stats.get('response_seconds')
+        data['saved_seconds'] = answer_cache_stats.get('saved_seconds')
 
         try:
-            # 插入資料到 chat_history 表格
-            self.base_db.execute_query(
+            # 排入 chat_history 表格的批次寫入
+            self.audit_writer.enqueue(
                 """
                 INSERT INTO chat_history 
                 (upload_time, username, agent, mode, llm_option, model, db_source, db_name,
                  conversation_id, active_window_index, num_chat_windows, title,
-                 user_query, ai_response) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                 user_query, ai_response, answer_cache_hit, response_seconds, saved_seconds) 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
                 tuple(data.values())
             )
-            logging.info("查詢結果已成功保存到資料庫 DevOpsDB (chat_history)")
+            logging.info("查詢結果已排入 DevOpsDB (chat_history) 的批次寫入")
         except Exception as e:
             logging.error(f"保存到 DevOpsDB (chat_history) 資料庫時發生錯誤: {e}")
 
+    def get_answer_cache_stats(self):
+        """
+        統計個人KM 語意快取的命中率與節省的時間。
+
+        Returns:
+            dict: {'queries', 'hits', 'hit_rate', 'saved_seconds'}。
+        """
+        # 先寫入尚在佇列中的紀錄；寫入器已停止或逾時時以資料庫現有的紀錄統計
+        self.audit_writer.flush(timeout=2.0)
+        queries, hits, saved_seconds = self.base_db.fetch_query(
+            """
+            SELECT COUNT(answer_cache_hit), COALESCE(SUM(answer_cache_hit), 0), COALESCE(SUM(saved_seconds), 0)
+            FROM chat_history WHERE answer_cache_hit IS NOT NULL
+            """)[0]
+        return {
+            'queries': queries,
+            'hits': hits,
+            'hit_rate': hits / queries if queries else 0.0,
+            'saved_seconds': saved_seconds,
+        }
+
     def save_to_pdf_uploads(self, chat_session_data):
         """將 PDF 上傳記錄保存到資料庫中。"""
         # 取得當前時間
@@ -130,20 +189,25 @@ class DevOpsDB:
             'username': '',
             'conversation_id': '',
             'agent': '',
-            'embedding': ''
+            'embedding': '',
+            'chunk_count': 0,
+            'cache_hits': 0
         }.items()}
+        # 計算 embedding 快取命中率
+        data['cache_hit_ratio'] = data['cache_hits'] / data['chunk_count'] if data['chunk_count'] else 0.0
 
         try:
-            # 插入資料到 pdf_uploads 表格
-            self.base_db.execute_query(
+            # 排入 pdf_uploads 表格的批次寫入
+            self.audit_writer.enqueue(
                 """
                 INSERT INTO pdf_uploads 
-                (upload_time, username, conversation_id, agent, embedding) 
-                VALUES (?, ?, ?, ?, ?)
+                (upload_time, username, conversation_id, agent, embedding,
+                 chunk_count, cache_hits, cache_hit_ratio) 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
                 """,
                 tuple(data.values())
             )
-            logging.info("查詢結果已成功保存到資料庫 DevOpsDB (pdf_uploads)。")
+            logging.info("查詢結果已排入 DevOpsDB (pdf_uploads) 的批次寫入。")
         except Exception as e:
             logging.error(f"保存到 DevOpsDB (pdf_uploads) 資料庫時發生錯誤: {e}")
 
@@ -159,8 +223,8 @@ class DevOpsDB:
 
         for tmp_name, org_name in doc_names.items():
             try:
-                # 插入資料到 file_names 表格
-                self.base_db.execute_query(
+                # 排入 file_names 表格的批次寫入
+                self.audit_writer.enqueue(
                     """
                     INSERT INTO file_names 
                     (upload_time, username, conversation_id, tmp_name, org_name) 
@@ -168,6 +232,6 @@ class DevOpsDB:
                     """,
                     (upload_time, username, conversation_id, tmp_name, org_name)
                 )
-                logging.info(f"file_names 已成功保存到 DevOpsDB: tmp_name={tmp_name}, org_names={org_name}")
+                logging.info(f"file_names 已排入 DevOpsDB 的批次寫入: tmp_name={tmp_name}, org_names={org_name}")
             except Exception as e:
                 logging.error(f"file_names 保存到 DevOpsDB 時發生錯誤: {e}")
@@ -0,0 +1,127 @@
+import json
+import logging
+from datetime import datetime
+from models.database_base import BaseDB
+from apis.file_paths import FilePaths
+
+logging.basicConfig(level=logging.INFO)
+
+
+class IngestJobsDB:
+    """
+    背景文件收錄工作的資料表。
+
+    所有使用者共用 developer/IngestJobs.db，記錄每個工作的狀態與進度（已解析頁數、已嵌入文檔塊數），
+    頁面重新執行或瀏覽器重新整理後仍可依 job_id 查詢。
+    """
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    COLUMNS = ['job_id', 'username', 'conversation_id', 'status', 'payload', 'pages',
+               'chunks_embedded', 'chunk_total', 'error', 'created_at', 'updated_at']
+
+    def __init__(self, db_path=None):
+        """初始化 IngestJobsDB 類別。"""
+        # 設定資料庫路徑
+        if db_path is None:
+            db_path = FilePaths().get_developer_dir().joinpath('IngestJobs.db')
+        self.db_path = db_path
+        self.base_db = BaseDB(self.db_path)
+
+        # 初始化資料庫表格
+        self.base_db.ensure_db_path_exists()
+        self._init_db()
+
+    def _init_db(self):
+        """初始化資料庫，創建 ingest_jobs 表格。"""
+        self.base_db.execute_query('''
+            CREATE TABLE IF NOT EXISTS ingest_jobs (
+                job_id TEXT PRIMARY KEY,
+                username TEXT,
+                conversation_id TEXT,
+                status TEXT,
+                payload TEXT,
+                pages INTEGER DEFAULT 0,
+                chunks_embedded INTEGER DEFAULT 0,
+                chunk_total INTEGER DEFAULT 0,
+                error TEXT,
+                created_at TIMESTAMP,
+                updated_at TIMESTAMP
+            )
+        ''')
+        self.base_db.execute_query(
+            "CREATE INDEX IF NOT EXISTS idx_ingest_jobs_username ON ingest_jobs (username, status)")
+
+    @staticmethod
+    def _now():
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def create_job(self, job_id, username, conversation_id, payload):
+        """
+        新增排隊中的工作。
+
+        Args:
+            job_id (str): 工作 ID。
+            username (str): 使用者名稱。
+            conversation_id (str): 對話 ID。
+            payload (dict): 執行工作所需的資料（收錄所需的會話欄位與文件列表），以 JSON 保存。
+        """
+        current_time = self._now()
+        self.base_db.execute_query(
+            """
+            INSERT INTO ingest_jobs (job_id, username, conversation_id, status, payload, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (job_id, username, conversation_id, self.STATUS_QUEUED,
+             json.dumps(payload, ensure_ascii=False), current_time, current_time))
+
+    def update_status(self, job_id, status, error=None):
+        """更新工作狀態。"""
+        self.base_db.execute_query(
+            "UPDATE ingest_jobs SET status = ?, error = ?, updated_at = ? WHERE job_id = ?",
+            (status, error, self._now(), job_id))
+
+    def update_progress(self, job_id, pages, chunks_embedded, chunk_total):
+        """更新工作進度。"""
+        self.base_db.execute_query(
+            """
+            UPDATE ingest_jobs SET pages = ?, chunks_embedded = ?, chunk_total = ?, updated_at = ?
+            WHERE job_id = ?
+            """,
+            (pages, chunks_embedded, chunk_total, self._now(), job_id))
+
+    def get_job(self, job_id):
+        """取得單一工作，不存在時返回 None。"""
+        rows = self.base_db.fetch_query(
+            f"SELECT {', '.join(self.COLUMNS)} FROM ingest_jobs WHERE job_id = ?", (job_id,))
+        return self._to_job(rows[0]) if rows else None
+
+    def get_user_jobs(self, username, statuses=ACTIVE_STATUSES):
+        """取得使用者指定狀態的工作，依建立時間排序。"""
+        placeholders = ', '.join('?' * len(statuses))
+        rows = self.base_db.fetch_query(
+            f"""
+            SELECT {', '.join(self.COLUMNS)} FROM ingest_jobs
+            WHERE username = ? AND status IN ({placeholders})
+            ORDER BY created_at
+            """,
+            (username, *statuses))
+        return [self._to_job(row) for row in rows]
+
+    def get_unfinished_jobs(self):
+        """取得所有排隊中或執行中的工作（行程重新啟動後重新排入佇列）。"""
+        placeholders = ', '.join('?' * len(self.ACTIVE_STATUSES))
+        rows = self.base_db.fetch_query(
+            f"SELECT {', '.join(self.COLUMNS)} FROM ingest_jobs WHERE status IN ({placeholders}) ORDER BY created_at",
+            self.ACTIVE_STATUSES)
+        return [self._to_job(row) for row in rows]
+
+    def _to_job(self, row):
+        """將查詢結果轉為字典，並解析 payload。"""
+        job = dict(zip(self.COLUMNS, row))
+        job['payload'] = json.loads(job['payload']) if job['payload'] else {}
+        return job
@@ -1,5 +1,7 @@
 import pandas as pd
 import logging
+import threading
+from datetime import datetime
 from pathlib import Path
 from models.database_base import BaseDB
 from apis.file_paths import FilePaths
@@ -8,66 +10,213 @@ logging.basicConfig(level=logging.INFO)
 
 
 class UserRecordsDB:
-    def __init__(self, username):
+    """
+    使用者的聊天記錄資料庫 (<username>.db)。
+
+    schema 版本記錄於 PRAGMA user_version：
+        0: 每則訊息一列的 chat_history 表格，重複保存視窗設定，沒有索引。
+        1: conversations（每個視窗一列，保存設定與標題）與 messages（以 conversation_id 引用）表格，
+           並提供相同欄位的 chat_history VIEW 供舊有的查詢使用。
+        2: 視窗以 conversation_id 識別，顯示順序由不會重新編號的 window_order 決定，
+           視窗索引 (active_window_index) 由排序推算，刪除視窗時不需更新其他視窗。
+        3: conversations 新增 summary / summary_upto，保存對話記憶中較早訊息的滾動摘要。
+    開啟資料庫時依版本依序執行 migration，既有的資料庫會就地升級。
+    """
+
+    SCHEMA_VERSION = 3
+
+    # 視窗設定欄位（保存於 conversations 表格）
+    SETUP_COLUMNS = ['conversation_id', 'agent', 'mode', 'llm_option', 'model', 'db_source', 'db_name', 'title']
+
+    # 開啟視窗時載入的最新訊息數量
+    MESSAGE_PAGE_SIZE = 20
+
+    # 本行程中已初始化的資料庫路徑（每個路徑只建立資料夾與執行 migration 一次）
+    _initialized_paths = set()
+    _init_lock = threading.Lock()
+
+    def __init__(self, username, base_dir=None):
         """ 初始化 UserRecordsDB 類別。 """
         # 設定資料庫路徑
-        self.file_paths = FilePaths()
+        self.file_paths = FilePaths(base_dir)
         self.db_path = self.file_paths.get_user_records_dir(username).joinpath(f"{username}.db")
         # 創建 BaseDB 實例來處理資料庫操作
         self.base_db = BaseDB(self.db_path)
 
-        # 初始化資料庫表格
-        self.base_db.ensure_db_path_exists()
-        self._init_db()
+        # 初始化資料庫表格（每個行程只執行一次）
+        with UserRecordsDB._init_lock:
+            if str(self.db_path) not in UserRecordsDB._initialized_paths:
+                self.base_db.ensure_db_path_exists()
+                self._init_db()
+                UserRecordsDB._initialized_paths.add(str(self.db_path))
 
     def _init_db(self):
-        """檢查資料庫文件是否存在，不存在則初始化資料庫。"""
-        if not self.db_path.exists():
-            # 定義聊天記錄表格的 SQL 語句
-            chat_history_query = '''
-                CREATE TABLE IF NOT EXISTS chat_history (
-                    id INTEGER PRIMARY KEY,
+        """依 PRAGMA user_version 執行尚未套用的 migration。"""
+        version = self.base_db.fetch_query("PRAGMA user_version")[0][0]
+        migrations = {1: self._migrate_to_v1, 2: self._migrate_to_v2, 3: self._migrate_to_v3}
+        for target_version in range(version + 1, self.SCHEMA_VERSION + 1):
+            migrations[target_version]()
+            logging.info(f"UserRecordsDB 資料庫已升級至版本 {target_version}: {self.db_path}")
+
+    def _migrate_to_v1(self):
+        """建立 conversations / messages 表格，並將舊有 chat_history 表格的資料搬移過去。"""
+        legacy_table_exists = bool(self.base_db.fetch_query(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_history'"))
+
+        statements = [
+            ("""
+                CREATE TABLE IF NOT EXISTS conversations (
+                    conversation_id TEXT PRIMARY KEY,
+                    active_window_index INTEGER,
                     agent TEXT,
-                    mode TEXT, 
-                    llm_option TEXT, 
-                    model TEXT, 
-                    db_source TEXT, 
+                    mode TEXT,
+                    llm_option TEXT,
+                    model TEXT,
+                    db_source TEXT,
                     db_name TEXT,
-                    conversation_id TEXT, 
-                    active_window_index INTEGER,
-                    num_chat_windows INTEGER, 
                     title TEXT,
-                    user_query TEXT, 
-                    ai_response TEXT
+                    created_at TIMESTAMP,
+                    updated_at TIMESTAMP
                 )
-            '''
-            # 執行創建聊天記錄表格的 SQL 語句
-            self.base_db.execute_query(chat_history_query)
-
-            # 定義 PDF 上傳記錄表格的 SQL 語句
-            pdf_uploads_query = '''
+            """, ()),
+            ("CREATE INDEX IF NOT EXISTS idx_conversations_window ON conversations (active_window_index)", ()),
+            ("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY,
+                    conversation_id TEXT NOT NULL,
+                    user_query TEXT,
+                    ai_response TEXT,
+                    created_at TIMESTAMP
+                )
+            """, ()),
+            ("CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, id)", ()),
+            ("""
                 CREATE TABLE IF NOT EXISTS pdf_uploads (
                     id INTEGER PRIMARY KEY,
                     conversation_id TEXT,
-                    agent TEXT,             
+                    agent TEXT,
                     embedding TEXT
                 )
-            '''
-            # 執行創建 PDF 上傳記錄表格的 SQL 語句
-            self.base_db.execute_query(pdf_uploads_query)
-
-            # 定義文件名稱記錄表格的 SQL 語句
-            file_names_query = '''
+            """, ()),
+            ("""
                 CREATE TABLE IF NOT EXISTS file_names (
                     id INTEGER PRIMARY KEY,
                     conversation_id TEXT,
-                    tmp_name TEXT,             
+                    tmp_name TEXT,
                     org_name TEXT
                 )
-            '''
-            # 執行創建文件名稱記錄表格的 SQL 語句
-            self.base_db.execute_query(file_names_query)
-            logging.info("UserRecordsDB 資料庫初始化成功。")
+            """, ()),
+        ]
+
+        if legacy_table_exists:
+            # 舊資料沒有時間欄位，以升級時間代替（依 updated_at 排序的查詢才不會出現 NULL）
+            migrated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            statements += [
+                # 每個視窗對應一個 conversation_id（最後一則訊息的 ID，沒有時以視窗索引產生），
+                # 視窗與訊息都使用同一份對應，同一視窗中 ID 不一致或為 NULL 的訊息才不會失去所屬的視窗
+                ("""
+                    CREATE TEMP TABLE legacy_windows AS
+                    SELECT active_window_index,
+                           COALESCE(conversation_id, 'window-' || IFNULL(active_window_index, 'unknown'))
+                               AS conversation_id,
+                           id AS last_id
+                    FROM chat_history
+                    WHERE id IN (SELECT MAX(id) FROM chat_history GROUP BY active_window_index)
+                """, ()),
+                # 每個視窗使用最後一則訊息的設定，標題使用第一則訊息的標題（與舊版顯示一致）
+                ("""
+                    INSERT OR REPLACE INTO conversations
+                    (conversation_id, active_window_index, agent, mode, llm_option, model,
+                     db_source, db_name, title, created_at, updated_at)
+                    SELECT w.conversation_id, h.active_window_index, h.agent, h.mode, h.llm_option, h.model,
+                           h.db_source, h.db_name,
+                           (SELECT f.title FROM chat_history f
+                            WHERE f.active_window_index IS h.active_window_index ORDER BY f.id LIMIT 1),
+                           ?, ?
+                    FROM legacy_windows w JOIN chat_history h ON h.id = w.last_id
+                """, (migrated_at, migrated_at)),
+                ("""
+                    INSERT INTO messages (id, conversation_id, user_query, ai_response, created_at)
+                    SELECT h.id, w.conversation_id, h.user_query, h.ai_response, ?
+                    FROM chat_history h JOIN legacy_windows w ON w.active_window_index IS h.active_window_index
+                    ORDER BY h.id
+                """, (migrated_at,)),
+                ("DROP TABLE legacy_windows", ()),
+                ("DROP TABLE chat_history", ()),
+            ]
+
+        statements += [
+            # 提供與舊版 chat_history 表格相同欄位的 VIEW
+            ("""
+                CREATE VIEW IF NOT EXISTS chat_history AS
+                SELECT m.id, c.agent, c.mode, c.llm_option, c.model, c.db_source, c.db_name,
+                       m.conversation_id, c.active_window_index,
+                       (SELECT COUNT(*) FROM conversations) AS num_chat_windows,
+                       c.title, m.user_query, m.ai_response
+                FROM messages m JOIN conversations c ON c.conversation_id = m.conversation_id
+            """, ()),
+            ("PRAGMA user_version = 1", ()),
+        ]
+        self.base_db.execute_transaction(statements)
+
+    def _migrate_to_v2(self):
+        """
+        以不會重新編號的 window_order 取代 active_window_index 欄位。
+
+        ALTER TABLE ... DROP COLUMN 需要 SQLite 3.35 以上，為支援較舊的系統 SQLite，
+        以建立新表格、複製資料再更名的方式重建 conversations 表格。
+        """
+        self.base_db.execute_transaction([
+            ("DROP VIEW IF EXISTS chat_history", ()),
+            ("DROP INDEX IF EXISTS idx_conversations_window", ()),
+            ("""
+                CREATE TABLE conversations_v2 (
+                    conversation_id TEXT PRIMARY KEY,
+                    agent TEXT,
+                    mode TEXT,
+                    llm_option TEXT,
+                    model TEXT,
+                    db_source TEXT,
+                    db_name TEXT,
+                    title TEXT,
+                    created_at TIMESTAMP,
+                    updated_at TIMESTAMP,
+                    window_order INTEGER
+                )
+            """, ()),
+            ("""
+                INSERT INTO conversations_v2
+                (conversation_id, agent, mode, llm_option, model, db_source, db_name, title,
+                 created_at, updated_at, window_order)
+                SELECT conversation_id, agent, mode, llm_option, model, db_source, db_name, title,
+                       created_at, updated_at, active_window_index
+                FROM conversations
+            """, ()),
+            ("DROP TABLE conversations", ()),
+            ("ALTER TABLE conversations_v2 RENAME TO conversations", ()),
+            ("CREATE INDEX IF NOT EXISTS idx_conversations_order ON conversations (window_order)", ()),
+            # 視窗索引由 window_order 的排序推算
+            ("""
+                CREATE VIEW chat_history AS
+                SELECT m.id, c.agent, c.mode, c.llm_option, c.model, c.db_source, c.db_name,
+                       m.conversation_id, w.active_window_index,
+                       (SELECT COUNT(*) FROM conversations) AS num_chat_windows,
+                       c.title, m.user_query, m.ai_response
+                FROM messages m
+                JOIN conversations c ON c.conversation_id = m.conversation_id
+                JOIN (SELECT conversation_id, ROW_NUMBER() OVER (ORDER BY window_order) - 1 AS active_window_index
+                      FROM conversations) w ON w.conversation_id = m.conversation_id
+            """, ()),
+            ("PRAGMA user_version = 2", ()),
+        ])
+
+    def _migrate_to_v3(self):
+        """新增保存滾動摘要的欄位。"""
+        self.base_db.execute_transaction([
+            ("ALTER TABLE conversations ADD COLUMN summary TEXT", ()),
+            ("ALTER TABLE conversations ADD COLUMN summary_upto INTEGER", ()),
+            ("PRAGMA user_version = 3", ()),
+        ])
 
     def load_database(self, database, columns=None) -> pd.DataFrame:
         """
@@ -108,64 +257,109 @@ class UserRecordsDB:
             print(f"load_database 發生錯誤: {e}")
             return empty_df
 
-    def delete_chat_by_index(self, delete_index):
-        """刪除指定的聊天記錄。"""
+    def count_windows(self):
+        """返回聊天視窗的數量。"""
+        return self.base_db.fetch_query("SELECT COUNT(*) FROM conversations")[0][0]
+
+    def list_windows(self):
+        """
+        以單一查詢返回所有視窗，依顯示順序排列。
+
+        Returns:
+            list: (index, title, last_activity) 列表。
+        """
+        rows = self.base_db.fetch_query(
+            "SELECT title, updated_at FROM conversations ORDER BY window_order")
+        return [(index, title, last_activity) for index, (title, last_activity) in enumerate(rows)]
+
+    def get_summary(self, conversation_id):
+        """
+        取得對話的滾動摘要。
+
+        Returns:
+            tuple: (摘要, 已摘要的最後一則訊息 id)；尚無摘要時返回 ('', None)。
+        """
+        rows = self.base_db.fetch_query(
+            "SELECT summary, summary_upto FROM conversations WHERE conversation_id = ?",
+            (conversation_id,))
+        if not rows or rows[0][0] is None:
+            return '', None
+        return rows[0]
+
+    def save_summary(self, conversation_id, summary, summary_upto):
+        """保存對話的滾動摘要。"""
         self.base_db.execute_query(
-            "DELETE FROM chat_history WHERE active_window_index = ?",
-            (delete_index,))
+            "UPDATE conversations SET summary = ?, summary_upto = ? WHERE conversation_id = ?",
+            (summary, summary_upto, conversation_id))
 
-    def update_chat_indexes(self, delete_index):
-        """更新聊天記錄索引。"""
-        chat_histories = self.base_db.fetch_query(
-            "SELECT id, active_window_index FROM chat_history ORDER BY active_window_index")
+    def update_title(self, conversation_id, title):
+        """在背景產生標題後，更新尚未有標題的對話。"""
+        self.base_db.execute_query(
+            "UPDATE conversations SET title = ? WHERE conversation_id = ? AND COALESCE(title, '') = ''",
+            (title, conversation_id))
+
+    def get_conversation_id(self, index):
+        """返回第 index 個視窗（依顯示順序）的 conversation_id，視窗不存在時返回 None。"""
+        rows = self.base_db.fetch_query(
+            "SELECT conversation_id FROM conversations ORDER BY window_order LIMIT 1 OFFSET ?",
+            (index,))
+        return rows[0][0] if rows else None
+
+    def get_window_title(self, index):
+        """返回指定視窗的標題，視窗不存在時返回 None。"""
+        rows = self.base_db.fetch_query(
+            "SELECT title FROM conversations ORDER BY window_order LIMIT 1 OFFSET ?",
+            (index,))
+        return rows[0][0] if rows else None
+
+    def delete_conversation(self, conversation_id):
+        """刪除指定對話的視窗與訊息；其他視窗的順序由 window_order 決定，不需更新。"""
+        self.base_db.execute_transaction([
+            ("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,)),
+            ("DELETE FROM conversations WHERE conversation_id = ?", (conversation_id,)),
+        ])
 
-        for id, active_window_index in chat_histories:
-            if active_window_index > delete_index:
-                new_index = active_window_index - 1
-                self.base_db.execute_query(
-                    "UPDATE chat_history SET active_window_index = ? WHERE id = ?",
-                    (new_index, id))
+    def delete_chat_by_index(self, delete_index):
+        """刪除指定的聊天記錄。"""
+        conversation_id = self.get_conversation_id(delete_index)
+        if conversation_id is not None:
+            self.delete_conversation(conversation_id)
 
 # -----------------------------------------
-    def get_active_window_setup(self, index, chat_session_data):
+    def get_active_window_setup(self, index, chat_session_data, page_size=None):
         """
         從資料庫中獲取並加載當前的聊天記錄。
 
         Args:
             index (int): 聊天記錄的 active_window_index。
             chat_session_data (dict): 聊天會話的數據，包括歷史記錄和其他相關資訊。
+            page_size (int, optional): 載入最新的訊息數量，預設為 MESSAGE_PAGE_SIZE。
         """
-        try:
-            # 定義設置和歷史記錄的欄位名稱
-            setup_columns = ['conversation_id', 'agent', 'mode', 'llm_option', 'model', 'db_source', 'db_name', 'title']
-            history_columns = ['user_query', 'ai_response']
-
-            # 合併所有欄位名稱
-            all_columns = setup_columns + history_columns
-
-            # SQL 查詢，用於獲取指定 active_window_index 的聊天記錄
-            query = """
-                SELECT conversation_id, agent, mode, llm_option, model, db_source, db_name, title,
-                       user_query, ai_response
-                FROM chat_history 
-                WHERE active_window_index = ? 
-                ORDER BY id
-            """
+        return self.get_conversation_setup(self.get_conversation_id(index), chat_session_data, page_size)
 
-            # 執行查詢並獲取結果
-            active_window_setup = self.base_db.fetch_query(query, (index,))
+    def get_conversation_setup(self, conversation_id, chat_session_data, page_size=None):
+        """
+        從資料庫中獲取並加載指定對話的設定與最新一頁的聊天記錄。
 
-            if active_window_setup:
-                # 將查詢結果轉換為 DataFrame
-                df_check = pd.DataFrame(active_window_setup, columns=all_columns)
+        Args:
+            conversation_id (str): 對話 ID。
+            chat_session_data (dict): 聊天會話的數據，包括歷史記錄和其他相關資訊。
+            page_size (int, optional): 載入最新的訊息數量，預設為 MESSAGE_PAGE_SIZE。
+        """
+        try:
+            # 取得視窗設定
+            setup = self.base_db.fetch_query(
+                f"SELECT {', '.join(self.SETUP_COLUMNS)} FROM conversations WHERE conversation_id = ?",
+                (conversation_id,))
 
+            if setup:
                 # 更新 chat_session_data 的設置列
-                for column in setup_columns:
-                    chat_session_data[column] = df_check[column].iloc[-1]
+                chat_session_data.update(zip(self.SETUP_COLUMNS, setup[0]))
 
-                # 更新 chat_history 並轉換為字典格式
-                chat_history_df = df_check[history_columns]
-                chat_session_data['chat_history'] = chat_history_df.to_dict(orient='records')
+                # 只載入最新一頁的聊天記錄，較早的訊息由 get_messages 分頁載入
+                messages, has_older = self.get_messages(conversation_id, page_size or self.MESSAGE_PAGE_SIZE)
+                chat_session_data['chat_history'] = messages
+                chat_session_data['has_older_messages'] = has_older
             else:
                 # 如果無結果，重置 chat_session_data 為預設值
                 # chat_session_data = self.reset_session_state_to_defaults()
@@ -174,7 +368,60 @@ class UserRecordsDB:
             return chat_session_data
 
         except Exception as e:
-            print(f"get_active_window_setup 發生錯誤: {e}")
+            print(f"get_conversation_setup 發生錯誤: {e}")
+
+    def get_messages(self, conversation_id, limit, before_id=None):
+        """
+        以 keyset 分頁取得對話的訊息：id 小於 before_id 的最新 limit 則，依時間順序返回。
+
+        Args:
+            conversation_id (str): 對話 ID。
+            limit (int): 訊息數量。
+            before_id (int, optional): 只取得比此 id 更早的訊息；未提供時取得最新的訊息。
+
+        Returns:
+            tuple: (訊息列表 [{'id', 'user_query', 'ai_response'}], 是否還有更早的訊息)。
+        """
+        # 多取一則以判斷是否還有更早的訊息
+        before_clause, params = ("AND id < ?", (before_id,)) if before_id is not None else ("", ())
+        rows = self.base_db.fetch_query(
+            f"""
+            SELECT id, user_query, ai_response FROM messages
+            WHERE conversation_id = ? {before_clause}
+            ORDER BY id DESC LIMIT ?
+            """,
+            (conversation_id, *params, limit + 1))
+        has_older = len(rows) > limit
+        messages = [
+            {'id': message_id, 'user_query': user_query, 'ai_response': ai_response}
+            for message_id, user_query, ai_response in reversed(rows[:limit])
+        ]
+        return messages, has_older
+
+    def get_messages_between(self, conversation_id, after_id, before_id, limit):
+        """
+        依時間順序取得 id 介於 after_id 與 before_id 之間（不含）的最早 limit 則訊息，供滾動摘要分批讀取。
+
+        Args:
+            conversation_id (str): 對話 ID。
+            after_id (int): 只取得比此 id 更晚的訊息；None 表示從第一則開始。
+            before_id (int): 只取得比此 id 更早的訊息。
+            limit (int): 訊息數量。
+
+        Returns:
+            list: 訊息列表 [{'id', 'user_query', 'ai_response'}]。
+        """
+        rows = self.base_db.fetch_query(
+            """
+            SELECT id, user_query, ai_response FROM messages
+            WHERE conversation_id = ? AND id > ? AND id < ?
+            ORDER BY id LIMIT ?
+            """,
+            (conversation_id, -1 if after_id is None else after_id, before_id, limit))
+        return [
+            {'id': message_id, 'user_query': user_query, 'ai_response': ai_response}
+            for message_id, user_query, ai_response in rows
+        ]
 
     def save_to_database(self, query: str, response: str, chat_session_data):
         """
@@ -184,39 +431,55 @@ class UserRecordsDB:
             query (str): 使用者的查詢。
             response (str): AI 回應的結果。
             chat_session_data (dict): 聊天會話的數據，包括歷史記錄和其他相關資訊。
+
+        Returns:
+            int: 新訊息的 id，保存失敗時返回 None。
         """
+        # 取得當前時間
+        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
         # 初始化資料字典，從 chat_session_data 中獲取數據
         data = {key: chat_session_data.get(key, default) for key, default in {
+            'conversation_id': None,
             'agent': None,
             'mode': None,
             'llm_option': None,
             'model': None,
             'db_source': None,
             'db_name': None,
-            'conversation_id': None,
-            'active_window_index': 0,
-            'num_chat_windows': 0,
-            'title': None,
-            'user_query': query,
-            'ai_response': response
+            'title': None
         }.items()}
 
         try:
-            # 插入資料到 chat_history 表格
-            self.base_db.execute_query(
-                """
-                INSERT INTO chat_history 
-                (agent, mode, llm_option, model, db_source, db_name, 
-                 conversation_id, active_window_index, num_chat_windows, title,
-                 user_query, ai_response) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                tuple(data.values())
-            )
-            logging.info("查詢結果已成功保存到資料庫 UserDB (chat_history)")
+            message_id = self.base_db.execute_transaction([
+                # 新增或更新視窗設定（新視窗排在最後，沿用既有的標題與順序）
+                ("""
+                    INSERT INTO conversations
+                    (conversation_id, agent, mode, llm_option, model,
+                     db_source, db_name, title, created_at, updated_at, window_order)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                            (SELECT COALESCE(MAX(window_order), -1) + 1 FROM conversations))
+                    ON CONFLICT (conversation_id) DO UPDATE SET
+                        agent = excluded.agent,
+                        mode = excluded.mode,
+                        llm_option = excluded.llm_option,
+                        model = excluded.model,
+                        db_source = excluded.db_source,
+                        db_name = excluded.db_name,
+                        title = COALESCE(NULLIF(conversations.title, ''), excluded.title),
+                        updated_at = excluded.updated_at
+                """, (*data.values(), current_time, current_time)),
+                # 插入訊息
+                ("""
+                    INSERT INTO messages (conversation_id, user_query, ai_response, created_at)
+                    VALUES (?, ?, ?, ?)
+                """, (data['conversation_id'], query, response, current_time)),
+            ])
+            logging.info("查詢結果已成功保存到資料庫 UserDB (conversations, messages)")
+            return message_id
 
         except Exception as e:
-            logging.error(f"保存到 UserDB (chat_history) 資料庫時發生錯誤: {e}. Data: {data}")
+            logging.error(f"保存到 UserDB (conversations, messages) 資料庫時發生錯誤: {e}. Data: {data}")
 
     def save_to_pdf_uploads(self, chat_session_data):
         """將查詢結果保存到 pdf_uploads 表格中。"""
@@ -0,0 +1,166 @@
+import hashlib
+import logging
+from datetime import datetime
+from models.database_base import BaseDB
+from apis.file_paths import FilePaths
+
+logging.basicConfig(level=logging.INFO)
+
+
+class DocumentCorpus:
+    """
+    共用文件庫的索引。
+
+    每份 PDF 以內容 sha256 作為 doc_id，在每個 embedding 模型下只收錄一次（寫入共用向量資料庫），
+    各對話以 doc_id 引用文件，檢索時依對話的文件集合過濾。
+    document_chunks 表格為共用向量資料庫的清單 (manifest)，記錄每份文件已寫入的 chunk_id 與內容 sha256，
+    文件不再被任何對話引用時，依此刪除其向量。
+    """
+
+    # 舊有的對話專屬向量資料庫已合併到共用文件庫（但未刪除）時，寫入其目錄的標記檔
+    MIGRATED_MARKER = '.migrated_to_shared_corpus'
+
+    def __init__(self, db_path=None):
+        """初始化 DocumentCorpus 類別。"""
+        # 設定資料庫路徑
+        if db_path is None:
+            db_path = FilePaths().get_shared_dir().joinpath('DocumentCorpus.db')
+        self.db_path = db_path
+        self.base_db = BaseDB(self.db_path)
+
+        # 初始化資料庫表格
+        self.base_db.ensure_db_path_exists()
+        self._init_db()
+
+    def _init_db(self):
+        """初始化資料庫，創建必要的表格。"""
+        # 已收錄到共用向量資料庫的文件
+        self.base_db.execute_query('''
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id TEXT,
+                embedding TEXT,
+                org_name TEXT,
+                chunk_count INTEGER,
+                created_at TIMESTAMP,
+                PRIMARY KEY (doc_id, embedding)
+            )
+        ''')
+        # 已寫入共用向量資料庫的文檔塊
+        self.base_db.execute_query('''
+            CREATE TABLE IF NOT EXISTS document_chunks (
+                doc_id TEXT,
+                embedding TEXT,
+                chunk_id TEXT,
+                chunk_hash TEXT,
+                PRIMARY KEY (embedding, chunk_id)
+            )
+        ''')
+        # 對話引用的文件
+        self.base_db.execute_query('''
+            CREATE TABLE IF NOT EXISTS conversation_documents (
+                username TEXT,
+                conversation_id TEXT,
+                doc_id TEXT,
+                org_name TEXT,
+                PRIMARY KEY (conversation_id, doc_id)
+            )
+        ''')
+
+    @staticmethod
+    def file_hash(content):
+        """計算文件內容的 sha256，作為 doc_id。"""
+        return hashlib.sha256(content).hexdigest()
+
+    def is_ingested(self, doc_id, embedding):
+        """檢查文件是否已在指定 embedding 模型下收錄。"""
+        rows = self.base_db.fetch_query(
+            "SELECT 1 FROM documents WHERE doc_id = ? AND embedding = ?",
+            (doc_id, embedding))
+        return bool(rows)
+
+    def add_document(self, doc_id, embedding, org_name, chunk_count, chunks=None):
+        """
+        記錄已收錄到共用向量資料庫的文件。
+
+        Args:
+            doc_id (str): 文件內容的 sha256。
+            embedding (str): embedding 模型名稱。
+            org_name (str): 原始檔名。
+            chunk_count (int): 文檔塊數量。
+            chunks (list, optional): 已寫入的 (chunk_id, chunk_hash) 列表。
+        """
+        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if chunks:
+            self.base_db.execute_many(
+                "INSERT OR REPLACE INTO document_chunks (doc_id, embedding, chunk_id, chunk_hash) VALUES (?, ?, ?, ?)",
+                [(doc_id, embedding, chunk_id, chunk_hash) for chunk_id, chunk_hash in chunks])
+        self.base_db.execute_query(
+            """
+            INSERT OR REPLACE INTO documents (doc_id, embedding, org_name, chunk_count, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (doc_id, embedding, org_name, chunk_count, current_time))
+        logging.info(f"DocumentCorpus 已收錄文件: {org_name} ({doc_id[:12]}..., {embedding})")
+
+    def link_documents(self, username, conversation_id, docs):
+        """
+        讓對話引用文件。
+
+        Args:
+            username (str): 使用者名稱。
+            conversation_id (str): 對話 ID。
+            docs (dict): {doc_id: org_name}。
+        """
+        self.base_db.execute_many(
+            """
+            INSERT OR REPLACE INTO conversation_documents (username, conversation_id, doc_id, org_name)
+            VALUES (?, ?, ?, ?)
+            """,
+            [(username, conversation_id, doc_id, org_name) for doc_id, org_name in docs.items()])
+
+    def get_conversation_doc_ids(self, conversation_id):
+        """取得對話引用的所有 doc_id。"""
+        rows = self.base_db.fetch_query(
+            "SELECT doc_id FROM conversation_documents WHERE conversation_id = ? ORDER BY doc_id",
+            (conversation_id,))
+        return [row[0] for row in rows]
+
+    def get_conversation_documents(self, conversation_id):
+        """取得對話引用的所有文件，返回 [(doc_id, org_name)]。"""
+        return self.base_db.fetch_query(
+            "SELECT doc_id, org_name FROM conversation_documents WHERE conversation_id = ? ORDER BY org_name",
+            (conversation_id,))
+
+    def unlink_documents(self, conversation_id, doc_ids):
+        """取消對話對文件的引用。"""
+        self.base_db.execute_many(
+            "DELETE FROM conversation_documents WHERE conversation_id = ? AND doc_id = ?",
+            [(conversation_id, doc_id) for doc_id in doc_ids])
+
+    def find_orphaned_documents(self, doc_ids):
+        """找出已不被任何對話引用的文件，返回 [(doc_id, embedding)]。"""
+        orphaned = []
+        for doc_id in doc_ids:
+            orphaned.extend(self.base_db.fetch_query(
+                """
+                SELECT doc_id, embedding FROM documents
+                WHERE doc_id = ?
+                  AND NOT EXISTS (SELECT 1 FROM conversation_documents WHERE doc_id = ?)
+                """,
+                (doc_id, doc_id)))
+        return orphaned
+
+    def get_chunk_ids(self, doc_id, embedding):
+        """取得文件在共用向量資料庫中的所有 chunk_id。"""
+        rows = self.base_db.fetch_query(
+            "SELECT chunk_id FROM document_chunks WHERE doc_id = ? AND embedding = ?",
+            (doc_id, embedding))
+        return [row[0] for row in rows]
+
+    def delete_document(self, doc_id, embedding):
+        """刪除文件的收錄紀錄與文檔塊清單。"""
+        self.base_db.execute_query(
+            "DELETE FROM document_chunks WHERE doc_id = ? AND embedding = ?", (doc_id, embedding))
+        self.base_db.execute_query(
+            "DELETE FROM documents WHERE doc_id = ? AND embedding = ?", (doc_id, embedding))
+        logging.info(f"DocumentCorpus 已刪除文件: {doc_id[:12]}... ({embedding})")
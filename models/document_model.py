@@ -1,11 +1,19 @@
 import logging
-import tempfile
-from langchain_community.document_loaders import PyPDFDirectoryLoader
+import threading
+import multiprocessing
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pypdf import PdfReader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 # from langchain_community.vectorstores import Chroma
 from langchain_chroma import Chroma
 from apis.file_paths import FilePaths
 from apis.embedding_api import EmbeddingAPI
+from models.vector_store_cache import vector_store_cache
+from models.embedding_pipeline import EmbeddingPipeline
+from models.embedding_cache import EmbeddingCache
+from models.ingest_pipeline import IngestPipeline
 from pathlib import Path
 import os
 from langchain.schema import Document
@@ -23,7 +31,32 @@ os.environ["CHROMA_TELEMETRY"] = "False"
 # 設定日誌記錄的級別為 INFO
 logging.basicConfig(level=logging.INFO)
 
+
+def _parse_pdf_pages(path, start, end):
+    """在子行程中解析 PDF 的第 start 到 end-1 頁，返回 (頁碼, 文字) 列表。"""
+    reader = PdfReader(path)
+    return [(page, reader.pages[page].extract_text()) for page in range(start, end)]
+
+
 class DocumentModel:
+    # 嵌入流程設定：每批次的文檔塊數量與同時送往 embedding 伺服器的請求數
+    EMBEDDING_BATCH_SIZE = 32
+    EMBEDDING_MAX_WORKERS = 4
+    # PDF 解析設定：每個解析任務的頁數、行程池大小（預設為 CPU 核心數）與同時提交的解析任務上限
+    PDF_PAGES_PER_TASK = 20
+    PDF_MAX_WORKERS = os.cpu_count() or 1
+    PDF_MAX_IN_FLIGHT = PDF_MAX_WORKERS * 2
+    # 行程內共用的 PDF 解析行程池（第一次解析時建立）
+    _parse_executor = None
+    _parse_executor_lock = threading.Lock()
+    # 可選用的拆分策略 {名稱: 拆分方法名稱}，供評估與效能測試比較
+    SPLITTERS = {
+        'recursive': 'split_documents_into_chunks',
+        'markdown_recursive': 'split_documents_into_chunks_1',
+        'markdown_headers': 'split_documents_into_chunks_3',
+        'markdown_headers_4': 'split_documents_into_chunks_4',
+    }
+
     def __init__(self, chat_session_data):
         # 初始化 hat_session_data
         self.chat_session_data = chat_session_data
@@ -32,29 +65,49 @@ class DocumentModel:
         username = self.chat_session_data.get("username")
         conversation_id = self.chat_session_data.get("conversation_id")
         self.tmp_dir = self.file_paths.get_tmp_dir(username, conversation_id)
-        self.vector_store_dir = self.file_paths.get_local_vector_store_dir(username, conversation_id)
+        # 文件收錄到依 embedding 模型區分的共用向量資料庫（效能測試可指定獨立的向量資料庫目錄）
+        if self.chat_session_data.get("vector_store_dir"):
+            self.vector_store_dir = Path(self.chat_session_data["vector_store_dir"])
+        else:
+            self.vector_store_dir = self.file_paths.get_shared_vector_store_dir(self.chat_session_data.get("embedding"))
+
+    def get_split_function(self, name):
+        """依 SPLITTERS 中的名稱取得拆分函式。"""
+        if name not in self.SPLITTERS:
+            raise ValueError(f"無效的拆分策略：{name}")
+        return getattr(self, self.SPLITTERS[name])
 
     def create_temporary_files(self, source_docs):
-        """建立臨時文件並返回檔案名稱對應關係。"""
+        """
+        建立臨時文件並返回檔案名稱對應關係。
+
+        臨時文件以 doc_id（內容 sha256）命名，相同內容的文件只會寫入一次。
+        """
         self.tmp_dir.mkdir(parents=True, exist_ok=True)
         doc_names = {}
 
         for source_doc in source_docs:
-            with tempfile.NamedTemporaryFile(delete=False, dir=self.tmp_dir.as_posix(), suffix='.pdf') as tmp_file:
-                tmp_file.write(source_doc['content'])  # 寫入文件內容
-                file_name = Path(tmp_file.name).name
-                doc_names[file_name] = source_doc['name']
+            file_name = f"{source_doc['doc_id']}.pdf"
+            tmp_file = self.tmp_dir.joinpath(file_name)
+            if not tmp_file.exists():
+                tmp_file.write_bytes(source_doc['content'])  # 寫入文件內容
                 logging.info(f"Created temporary file: {file_name}")
+            doc_names[file_name] = source_doc['name']
 
         return doc_names
 
-    def load_documents(self):
-        # 加載 PDF 文件
-        # 使用 PyPDFDirectoryLoader 從指定的目錄中加載所有 PDF 文件
-        loader = PyPDFDirectoryLoader(self.tmp_dir.as_posix(), glob='**/*.pdf')
-
-        # 加載 PDF 文件，並將其儲存在 documents 變數中
-        documents = loader.load()
+    def load_documents(self, file_names=None):
+        # 加載 PDF 文件（未指定時加載臨時目錄中的所有 PDF 文件）
+        pages_by_file = defaultdict(list)
+        failed_files = set()
+        for file_name, file_documents in self.iter_documents(file_names):
+            if file_documents is None:
+                failed_files.add(file_name)
+            else:
+                pages_by_file[file_name].extend(file_documents)
+        # 無法完整解析的文件整份略過
+        documents = [doc for file_name, pages in pages_by_file.items() if file_name not in failed_files
+                     for doc in pages]
 
         # 如果沒有加載到任何文件，拋出異常提示
         if not documents:
@@ -66,9 +119,106 @@ class DocumentModel:
         # 返回已加載的文件
         return documents
 
-    def delete_temporary_files(self):
-        # 刪除臨時文件
-        for file in self.tmp_dir.iterdir():
+    def iter_documents(self, file_names=None):
+        """
+        以行程池並行解析 PDF，依頁面順序逐一產生 (file_name, documents)，每項為一個頁面範圍
+        （PDF_PAGES_PER_TASK 頁）。
+
+        同時提交的解析任務最多 PDF_MAX_IN_FLIGHT 個，取出一個結果後才提交下一個，
+        因此下游處理較慢時解析也會暫停，記憶體用量與上傳大小無關。
+        無法解析的頁面範圍產生 (file_name, None)，該文件其餘的頁面範圍略過，不影響其他文件。
+        關閉產生器（管線中止）時取消尚未開始的解析任務。
+        """
+        tasks = self._iter_parse_tasks(file_names)
+        executor = self._get_parse_executor()
+        in_flight = deque()
+        failed_files = set()
+
+        def submit_next():
+            task = next(tasks, None)
+            if task is not None:
+                in_flight.append((task, executor.submit(_parse_pdf_pages, *task[1:])))
+
+        try:
+            for _ in range(self.PDF_MAX_IN_FLIGHT):
+                submit_next()
+            while in_flight:
+                (file_name, path, _, _), future = in_flight.popleft()
+                try:
+                    pages = future.result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    pages = None
+                    if file_name not in failed_files:
+                        logging.error(f"解析 PDF 文件 {file_name} 時發生錯誤，已略過: {e}")
+                submit_next()
+
+                if file_name in failed_files:
+                    continue
+                if pages is None:
+                    failed_files.add(file_name)
+                    yield file_name, None
+                    continue
+                yield file_name, [
+                    Document(page_content=text, metadata={'source': path, 'page': page})
+                    for page, text in pages
+                ]
+        except BrokenProcessPool:
+            # 子行程異常結束時行程池已無法使用，捨棄後由呼叫端處理錯誤
+            self._reset_parse_executor(executor)
+            raise
+        finally:
+            # 行程池由所有解析共用，只取消本次尚未開始的解析任務
+            for _, future in in_flight:
+                future.cancel()
+
+    @classmethod
+    def _get_parse_executor(cls):
+        """
+        取得行程內共用的 PDF 解析行程池，每個行程只建立一次，避免每次上傳都重新啟動子行程。
+
+        Streamlit 行程中已有多個執行緒（稽核寫入、標題生成、收錄工作等），
+        以 fork 建立子行程可能複製到被其他執行緒持有的鎖而死結，因此以 spawn 建立子行程。
+        """
+        with cls._parse_executor_lock:
+            if cls._parse_executor is None:
+                cls._parse_executor = ProcessPoolExecutor(
+                    max_workers=cls.PDF_MAX_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+            return cls._parse_executor
+
+    @classmethod
+    def _reset_parse_executor(cls, executor):
+        """捨棄已損壞的行程池，下次解析時重新建立。"""
+        with cls._parse_executor_lock:
+            if cls._parse_executor is executor:
+                cls._parse_executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _iter_parse_tasks(self, file_names=None):
+        """依頁數將每份文件切分為解析任務，逐一產生 (file_name, path, start, end)。"""
+        if file_names is None:
+            file_names = sorted(file.name for file in self.tmp_dir.glob('*.pdf'))
+
+        for file_name in file_names:
+            path = self.tmp_dir.joinpath(file_name).as_posix()
+            try:
+                page_count = len(PdfReader(path).pages)
+            except Exception as e:
+                logging.error(f"無法開啟 PDF 文件 {file_name}，已略過: {e}")
+                continue
+            if page_count == 0:
+                logging.warning(f"PDF 文件 {file_name} 沒有任何頁面，已略過。")
+                continue
+            for start in range(0, page_count, self.PDF_PAGES_PER_TASK):
+                yield file_name, path, start, min(start + self.PDF_PAGES_PER_TASK, page_count)
+
+    def delete_temporary_files(self, file_names=None):
+        # 刪除臨時文件（未指定時刪除臨時目錄中的所有文件）
+        files = [self.tmp_dir.joinpath(name) for name in file_names] if file_names else self.tmp_dir.iterdir()
+        for file in files:
+            if not file.exists():
+                continue
             try:
                 logging.info(f"Deleting temporary file: {file}")
                 file.unlink()
@@ -247,17 +397,116 @@ class DocumentModel:
         logging.info(f"Successfully split documents into {len(document_chunks)} chunks.")
         return document_chunks
 
-    def embeddings_on_local_vectordb(self, document_chunks):
-        # 將文檔塊嵌入本地向量數據庫，並返回檢索器設定
+    def split_documents_by_file(self, documents, split_function=None, chunk_offsets=None):
+        """
+        依來源文件分組拆分，並在每個文檔塊的 metadata 中標記 doc_id 與 chunk_id。
+
+        Args:
+            documents (list): 已加載的頁面 Document，metadata['source'] 為臨時文件路徑。
+            split_function (callable, optional): 拆分函式，預設為 split_documents_into_chunks_1。
+            chunk_offsets (dict, optional): {doc_id: 下一個 chunk 編號}；分段拆分同一文件時傳入同一個字典，
+                chunk_id 會接續編號並更新字典。
+        """
+        split_function = split_function or self.split_documents_into_chunks_1
+        chunk_offsets = {} if chunk_offsets is None else chunk_offsets
+
+        # 依來源文件分組（保留頁面順序）
+        pages_by_source = defaultdict(list)
+        for doc in documents:
+            pages_by_source[doc.metadata.get('source', '')].append(doc)
+
+        document_chunks = []
+        for source, pages in pages_by_source.items():
+            # 臨時文件以 doc_id 命名
+            doc_id = Path(source).stem
+            for i, chunk in enumerate(split_function(pages), start=chunk_offsets.get(doc_id, 0)):
+                chunk.metadata['doc_id'] = doc_id
+                chunk.metadata['chunk_id'] = f"{doc_id}-{i}"
+                document_chunks.append(chunk)
+                chunk_offsets[doc_id] = i + 1
+
+        return document_chunks
+
+    def embeddings_on_local_vectordb(self, document_chunks, progress_callback=None):
+        # 將文檔塊以批次、並行的方式嵌入本地的共用向量數據庫
+        if not document_chunks:
+            raise ValueError("No document chunks to embed. Please check the text splitting process.")
+
+        vector_db, pipeline = self._create_embedding_pipeline()
+        embedding_stats = pipeline.embed_and_upsert(document_chunks, vector_db, progress_callback)
+
+        # 記錄本次上傳的文檔塊數量與 embedding 快取命中數，供 pdf_uploads 使用
+        self.chat_session_data['chunk_count'] = embedding_stats['chunk_count']
+        self.chat_session_data['cache_hits'] = embedding_stats['cache_hits']
+        logging.info(f"Persisted vector DB at {self.vector_store_dir}")
+
+        # 向量資料庫已寫入新的 chunks，使快取的向量資料庫失效
+        vector_store_cache.invalidate(self.vector_store_dir)
+
+    def ingest_documents(self, file_names, split_function=None, progress_callback=None):
+        """
+        以串流管線收錄臨時文件：解析、拆分、嵌入與寫入向量資料庫同時進行。
+
+        Args:
+            file_names (list): 臨時目錄中要收錄的文件名稱。
+            split_function (callable, optional): 拆分函式，預設為 split_documents_into_chunks_1。
+            progress_callback (callable, optional): 以 (已嵌入數量, 目前已拆分的總數量, 已解析頁數) 呼叫的進度回報函式。
+
+        Returns:
+            dict: IngestPipeline 的統計資料，包含各文件的文檔塊數 'chunk_counts'。
+        """
+        vector_db, pipeline = self._create_embedding_pipeline()
+        try:
+            ingest_stats = IngestPipeline(self, pipeline, vector_db, split_function).run(file_names, progress_callback)
+        finally:
+            # 即使中途失敗，向量資料庫也可能已寫入部分 chunks，使快取的向量資料庫失效
+            vector_store_cache.invalidate(self.vector_store_dir)
+
+        if not ingest_stats['chunk_count']:
+            raise ValueError("No document chunks to embed. Please check the PDF files.")
+
+        # 記錄本次上傳的文檔塊數量與 embedding 快取命中數，供 pdf_uploads 使用
+        self.chat_session_data['chunk_count'] = ingest_stats['chunk_count']
+        self.chat_session_data['cache_hits'] = ingest_stats['cache_hits']
+        logging.info(f"Persisted vector DB at {self.vector_store_dir}")
+        return ingest_stats
+
+    def _create_embedding_pipeline(self):
+        """開啟共用向量資料庫，並建立使用 embedding 快取的 EmbeddingPipeline。"""
         mode = self.chat_session_data.get("mode")
         embedding = self.chat_session_data.get("embedding")
         embedding_function = EmbeddingAPI.get_embedding_function(mode, embedding)
-        if not document_chunks:
-            raise ValueError("No document chunks to embed. Please check the text splitting process.")
 
-        Chroma.from_documents(
-            documents=document_chunks,
-            embedding=embedding_function,
+        vector_db = Chroma(
+            embedding_function=embedding_function,
             persist_directory=self.vector_store_dir.as_posix()
         )
-        logging.info(f"Persisted vector DB at {self.vector_store_dir}")
+        pipeline = EmbeddingPipeline(
+            embedding_function,
+            batch_size=self.EMBEDDING_BATCH_SIZE,
+            max_workers=self.EMBEDDING_MAX_WORKERS,
+            # 效能測試建立向量資料庫時停用快取，建立時間才反映實際的嵌入耗時
+            embedding_cache=EmbeddingCache() if self.chat_session_data.get("use_embedding_cache", True) else None,
+            model_key=embedding
+        )
+        return vector_db, pipeline
+
+    def delete_document_vectors(self, doc_id, embedding, chunk_ids=None):
+        """
+        從共用向量資料庫刪除文件的向量。
+
+        Args:
+            doc_id (str): 文件的 doc_id。
+            embedding (str): 文件收錄時使用的 embedding 模型。
+            chunk_ids (list, optional): 文檔塊清單中的 chunk_id；未提供時依 metadata 的 doc_id 刪除。
+        """
+        vector_store_dir = self.file_paths.get_shared_vector_store_dir(embedding)
+        collection = Chroma(persist_directory=vector_store_dir.as_posix())._collection
+        if chunk_ids:
+            collection.delete(ids=chunk_ids)
+        else:
+            collection.delete(where={'doc_id': doc_id})
+        logging.info(f"已從共用向量資料庫刪除文件的向量: {doc_id[:12]}... ({embedding})")
+
+        # 向量資料庫已變更，使快取的向量資料庫失效
+        vector_store_cache.invalidate(vector_store_dir)
@@ -0,0 +1,86 @@
+import hashlib
+import logging
+from array import array
+from models.database_base import BaseDB
+from apis.file_paths import FilePaths
+
+logging.basicConfig(level=logging.INFO)
+
+
+class EmbeddingCache:
+    """
+    以 (embedding 模型, 文字 sha256) 為鍵的持久化 embedding 快取。
+
+    所有使用者與對話共用同一個 SQLite 檔案，向量以 float32 位元組儲存，
+    相同的文字在同一個 embedding 模型下只需嵌入一次。
+    """
+
+    # SQLite 單一語句可使用的參數數量有限，查詢時分批進行
+    LOOKUP_BATCH_SIZE = 500
+
+    def __init__(self, db_path=None):
+        """初始化 EmbeddingCache 類別。"""
+        # 設定資料庫路徑
+        if db_path is None:
+            db_path = FilePaths().get_developer_dir().joinpath('EmbeddingCache.db')
+        self.db_path = db_path
+        self.base_db = BaseDB(self.db_path)
+
+        # 初始化資料庫表格
+        self.base_db.ensure_db_path_exists()
+        self._init_db()
+
+    def _init_db(self):
+        """初始化資料庫，創建 embeddings 表格。"""
+        self.base_db.execute_query('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT,
+                text_hash TEXT,
+                dim INTEGER,
+                vector BLOB,
+                PRIMARY KEY (model, text_hash)
+            )
+        ''')
+
+    @staticmethod
+    def text_hash(text):
+        """計算文字的 sha256。"""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, model, text_hashes):
+        """
+        查詢多個文字的 embedding。
+
+        Args:
+            model (str): embedding 模型名稱。
+            text_hashes (iterable): 文字的 sha256。
+
+        Returns:
+            dict: 已快取的 {text_hash: vector}。
+        """
+        text_hashes = list(text_hashes)
+        vectors = {}
+        for i in range(0, len(text_hashes), self.LOOKUP_BATCH_SIZE):
+            batch = text_hashes[i:i + self.LOOKUP_BATCH_SIZE]
+            placeholders = ', '.join('?' * len(batch))
+            rows = self.base_db.fetch_query(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                (model, *batch))
+            for text_hash, blob in rows:
+                vectors[text_hash] = array('f', blob).tolist()
+        return vectors
+
+    def put_many(self, model, vectors):
+        """
+        保存多個文字的 embedding。
+
+        Args:
+            model (str): embedding 模型名稱。
+            vectors (dict): {text_hash: vector}。
+        """
+        if not vectors:
+            return
+        self.base_db.execute_many(
+            "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector) VALUES (?, ?, ?, ?)",
+            [(model, text_hash, len(vector), array('f', vector).tobytes())
+             for text_hash, vector in vectors.items()])
@@ -0,0 +1,132 @@
+import time
+import uuid
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from models.embedding_cache import EmbeddingCache
+
+logging.basicConfig(level=logging.INFO)
+
+
+class EmbeddingPipeline:
+    """
+    批次、並行的 embedding 流程。
+
+    將文檔塊分批，以多個並行請求送往 embedding 伺服器，失敗的批次以指數退避重試，
+    完成的批次依序寫入 (upsert) 向量資料庫，並透過 progress_callback 回報進度。
+    若提供 embedding_cache，已嵌入過的文字直接使用快取的向量，不再送往 embedding 伺服器。
+    """
+
+    def __init__(self, embedding_function, batch_size=32, max_workers=4, max_retries=3, backoff_seconds=1.0,
+                 embedding_cache=None, model_key=None):
+        """
+        Args:
+            embedding_function: LangChain Embeddings 物件（由 EmbeddingAPI 取得）。
+            batch_size (int): 每批次的文檔塊數量。
+            max_workers (int): 同時送往 embedding 伺服器的請求數。
+            max_retries (int): 每個批次失敗時的最大重試次數。
+            backoff_seconds (float): 第一次重試前等待的秒數，之後每次加倍。
+            embedding_cache (EmbeddingCache, optional): 以文字 sha256 為鍵的 embedding 快取。
+            model_key (str, optional): embedding 快取中使用的模型名稱。
+        """
+        self.embedding_function = embedding_function
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.embedding_cache = embedding_cache
+        self.model_key = model_key
+
+    def embed_and_upsert(self, document_chunks, vector_db, progress_callback=None):
+        """
+        將文檔塊嵌入並分批寫入向量資料庫。
+
+        Args:
+            document_chunks (list): LangChain Document 列表。
+            vector_db (Chroma): 要寫入的向量資料庫。
+            progress_callback (callable, optional): 以 (已完成數量, 總數量) 呼叫的進度回報函式。
+
+        Returns:
+            dict: 文檔塊總數 'chunk_count' 與命中 embedding 快取的數量 'cache_hits'。
+        """
+        total = len(document_chunks)
+        done = 0
+
+        # 以文字 sha256 分組，同一次上傳中重複的文字只嵌入一次
+        chunks_by_hash = defaultdict(list)
+        for doc in document_chunks:
+            chunks_by_hash[EmbeddingCache.text_hash(doc.page_content)].append(doc)
+
+        # 先查詢 embedding 快取，命中的文檔塊直接寫入向量資料庫
+        cached_vectors = {}
+        if self.embedding_cache is not None:
+            cached_vectors = self.embedding_cache.get_many(self.model_key, chunks_by_hash.keys())
+        cache_hits = sum(len(chunks_by_hash[text_hash]) for text_hash in cached_vectors)
+        for batch_hashes in self._batched(list(cached_vectors)):
+            done += self._upsert_hashes(vector_db, batch_hashes, cached_vectors, chunks_by_hash)
+            if progress_callback:
+                progress_callback(done, total)
+
+        # 未命中的文字分批並行嵌入
+        missing_hashes = [text_hash for text_hash in chunks_by_hash if text_hash not in cached_vectors]
+        batches = list(self._batched(missing_hashes))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self._embed_with_retry,
+                                [chunks_by_hash[text_hash][0].page_content for text_hash in batch]): batch
+                for batch in batches
+            }
+            # 在呼叫端執行緒中依完成順序寫入向量資料庫與快取，避免多個執行緒同時寫入
+            for future in as_completed(futures):
+                batch_hashes = futures[future]
+                vectors = dict(zip(batch_hashes, future.result()))
+                if self.embedding_cache is not None:
+                    self.embedding_cache.put_many(self.model_key, vectors)
+                done += self._upsert_hashes(vector_db, batch_hashes, vectors, chunks_by_hash)
+                if progress_callback:
+                    progress_callback(done, total)
+
+        hit_ratio = cache_hits / total if total else 0.0
+        logging.info(f"已嵌入並寫入 {total} 個文檔塊（{len(batches)} 個批次送往 embedding 伺服器），"
+                     f"embedding 快取命中率 {hit_ratio:.1%} ({cache_hits}/{total})")
+        return {'chunk_count': total, 'cache_hits': cache_hits}
+
+    def _batched(self, items):
+        """將列表依 batch_size 分批。"""
+        for i in range(0, len(items), self.batch_size):
+            yield items[i:i + self.batch_size]
+
+    def _embed_with_retry(self, texts):
+        """嵌入一個批次的文字，失敗時以指數退避重試。"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embedding_function.embed_documents(texts)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logging.error(f"批次嵌入失敗，已重試 {self.max_retries} 次: {e}")
+                    raise
+                delay = self.backoff_seconds * (2 ** attempt)
+                logging.warning(f"批次嵌入失敗，{delay:.1f} 秒後重試 ({attempt + 1}/{self.max_retries}): {e}")
+                time.sleep(delay)
+
+    def _upsert_hashes(self, vector_db, batch_hashes, vectors, chunks_by_hash):
+        """將一個批次的文字（含重複的文檔塊）寫入 Chroma，返回寫入的文檔塊數量。"""
+        batch = [doc for text_hash in batch_hashes for doc in chunks_by_hash[text_hash]]
+        embeddings = [vectors[text_hash] for text_hash in batch_hashes for _ in chunks_by_hash[text_hash]]
+        self._upsert(vector_db, batch, embeddings)
+        return len(batch)
+
+    @staticmethod
+    def _upsert(vector_db, batch, embeddings):
+        """以預先計算的 embeddings 將一個批次寫入 Chroma。"""
+        vector_db._collection.upsert(
+            # 有 chunk_id 時使用固定的 id，重複收錄同一文件時覆寫而非新增
+            ids=[doc.metadata.get('chunk_id') or str(uuid.uuid4()) for doc in batch],
+            embeddings=embeddings,
+            documents=[doc.page_content for doc in batch],
+            # Chroma 的 metadata 只接受 str、int、float、bool
+            metadatas=[
+                {key: value for key, value in doc.metadata.items() if isinstance(value, (str, int, float, bool))}
+                for doc in batch
+            ]
+        )
@@ -0,0 +1,206 @@
+import time
+import queue
+import logging
+import threading
+from pathlib import Path
+from collections import Counter, defaultdict
+from models.embedding_cache import EmbeddingCache
+
+logging.basicConfig(level=logging.INFO)
+
+
+class IngestPipeline:
+    """
+    串流式的文件收錄管線：parse → split → embed/upsert。
+
+    各階段在各自的執行緒中執行，以有界佇列 (bounded queue) 連接，每次只傳遞一個頁面範圍的資料，
+    解析也只在下游取走結果後才繼續，因此記憶體用量與上傳大小無關，
+    且後面的頁面仍在解析時，embedding 伺服器已在處理前面的頁面。
+    無法完整解析的文件，已寫入的部分向量會在結束時刪除，不計入統計。
+    """
+
+    # 佇列結束標記
+    _DONE = object()
+    # 等待佇列時檢查是否中止的間隔（秒）
+    _POLL_SECONDS = 0.5
+
+    def __init__(self, doc_model, embedding_pipeline, vector_db, split_function=None, queue_size=4):
+        """
+        Args:
+            doc_model (DocumentModel): 提供 iter_documents 與 split_documents_by_file。
+            embedding_pipeline (EmbeddingPipeline): 負責嵌入並寫入向量資料庫。
+            vector_db (Chroma): 要寫入的向量資料庫。
+            split_function (callable, optional): 拆分函式，預設為 split_documents_into_chunks_1。
+            queue_size (int): 各階段之間佇列的容量（以頁面範圍為單位）。
+        """
+        self.doc_model = doc_model
+        self.embedding_pipeline = embedding_pipeline
+        self.vector_db = vector_db
+        self.split_function = split_function
+        self.queue_size = queue_size
+
+    def run(self, file_names, progress_callback=None):
+        """
+        執行管線並返回統計資料。
+
+        Args:
+            file_names (list): 臨時目錄中要收錄的文件名稱。
+            progress_callback (callable, optional): 以 (已嵌入數量, 目前已拆分的總數量, 已解析頁數) 呼叫的進度回報函式。
+
+        Returns:
+            dict: 頁數、文檔塊數、各文件的文檔塊數與 (chunk_id, chunk_hash) 清單、embedding 快取命中數、
+                  各階段耗時與佇列最大深度。
+        """
+        parsed_queue = queue.Queue(maxsize=self.queue_size)
+        chunk_queue = queue.Queue(maxsize=self.queue_size)
+        self._stop = threading.Event()
+        self._errors = []
+        self._failed_doc_ids = set()
+        self.stats = {
+            'pages': 0,
+            'chunk_count': 0,
+            'split_chunk_count': 0,
+            'cache_hits': 0,
+            'chunk_counts': Counter(),
+            'chunk_manifest': defaultdict(list),
+            'stage_seconds': {'parse': 0.0, 'split': 0.0, 'embed': 0.0},
+            'max_queue_depth': {'parsed': 0, 'chunks': 0},
+        }
+
+        start_time = time.perf_counter()
+        threads = [
+            threading.Thread(target=self._run_stage, args=(self._parse_stage, file_names, parsed_queue), daemon=True),
+            threading.Thread(target=self._run_stage, args=(self._split_stage, parsed_queue, chunk_queue), daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            self._embed_stage(chunk_queue, progress_callback)
+        except Exception:
+            self._stop.set()
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+        self._discard_failed_documents()
+
+        self.stats['total_seconds'] = time.perf_counter() - start_time
+        logging.info(
+            f"收錄管線完成: {self.stats['pages']} 頁, {self.stats['chunk_count']} 個文檔塊, "
+            f"總耗時 {self.stats['total_seconds']:.2f}s, "
+            f"各階段耗時 {{{', '.join(f'{k}: {v:.2f}s' for k, v in self.stats['stage_seconds'].items())}}}, "
+            f"佇列最大深度 {self.stats['max_queue_depth']}")
+        return self.stats
+
+    def _run_stage(self, stage, input_data, output_queue):
+        """執行一個階段；發生錯誤時記錄並中止整個管線，最後一定送出結束標記。"""
+        try:
+            stage(input_data, output_queue)
+        except Exception as e:
+            logging.error(f"收錄管線 {stage.__name__} 發生錯誤: {e}")
+            self._errors.append(e)
+            self._stop.set()
+        finally:
+            self._put(output_queue, self._DONE, force=True)
+
+    def _parse_stage(self, file_names, parsed_queue):
+        """解析階段：每個頁面範圍解析完成即放入佇列（佇列已滿時暫停解析）。"""
+        documents_iter = self.doc_model.iter_documents(file_names)
+        try:
+            while not self._stop.is_set():
+                stage_start = time.perf_counter()
+                item = next(documents_iter, None)
+                self.stats['stage_seconds']['parse'] += time.perf_counter() - stage_start
+                if item is None:
+                    break
+                if item[1] is None:
+                    # 文件有頁面無法解析，整份文件不收錄
+                    self._failed_doc_ids.add(Path(item[0]).stem)
+                    continue
+                self.stats['pages'] += len(item[1])
+                self._put(parsed_queue, item)
+                self._record_depth('parsed', parsed_queue)
+        finally:
+            # 關閉產生器以取消尚未開始的解析任務
+            documents_iter.close()
+
+    def _split_stage(self, parsed_queue, chunk_queue):
+        """拆分階段：將每個頁面範圍拆分成塊並標記 doc_id，同一文件的 chunk_id 接續編號。"""
+        chunk_offsets = {}
+        while True:
+            item = self._get(parsed_queue)
+            if item is self._DONE:
+                break
+            file_name, documents = item
+            stage_start = time.perf_counter()
+            document_chunks = self.doc_model.split_documents_by_file(documents, self.split_function, chunk_offsets)
+            self.stats['stage_seconds']['split'] += time.perf_counter() - stage_start
+            self.stats['split_chunk_count'] += len(document_chunks)
+            if document_chunks:
+                self._put(chunk_queue, document_chunks)
+                self._record_depth('chunks', chunk_queue)
+
+    def _embed_stage(self, chunk_queue, progress_callback):
+        """嵌入階段：在呼叫端執行緒中以批次、並行的方式嵌入並寫入向量資料庫。"""
+        while True:
+            document_chunks = self._get(chunk_queue)
+            if document_chunks is self._DONE:
+                break
+            embedded_before = self.stats['chunk_count']
+
+            def report(done, total):
+                if progress_callback:
+                    progress_callback(embedded_before + done, self.stats['split_chunk_count'], self.stats['pages'])
+
+            stage_start = time.perf_counter()
+            result = self.embedding_pipeline.embed_and_upsert(document_chunks, self.vector_db, report)
+            self.stats['stage_seconds']['embed'] += time.perf_counter() - stage_start
+            self.stats['chunk_count'] += result['chunk_count']
+            self.stats['cache_hits'] += result['cache_hits']
+            for chunk in document_chunks:
+                doc_id = chunk.metadata['doc_id']
+                self.stats['chunk_counts'][doc_id] += 1
+                self.stats['chunk_manifest'][doc_id].append(
+                    (chunk.metadata['chunk_id'], EmbeddingCache.text_hash(chunk.page_content)))
+
+    def _discard_failed_documents(self):
+        """刪除無法完整解析的文件已寫入的向量，並從統計中移除（呼叫端不會記錄這些文件）。"""
+        for doc_id in self._failed_doc_ids:
+            chunks = self.stats['chunk_manifest'].pop(doc_id, [])
+            self.stats['chunk_counts'].pop(doc_id, None)
+            self.stats['chunk_count'] -= len(chunks)
+            if chunks:
+                self.vector_db.delete(ids=[chunk_id for chunk_id, _ in chunks])
+                logging.warning(f"文件 {doc_id} 無法完整解析，已刪除已寫入的 {len(chunks)} 個文檔塊")
+
+    def _put(self, output_queue, item, force=False):
+        """放入佇列；佇列已滿時等待，管線中止時放棄（結束標記除外）。"""
+        while True:
+            if self._stop.is_set() and not force:
+                return
+            try:
+                output_queue.put(item, timeout=self._POLL_SECONDS)
+                return
+            except queue.Full:
+                if force and self._stop.is_set():
+                    # 管線已中止且下游不再讀取，丟棄最舊的項目以送出結束標記
+                    try:
+                        output_queue.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def _get(self, input_queue):
+        """從佇列取出項目；管線中止時返回結束標記。"""
+        while True:
+            try:
+                return input_queue.get(timeout=self._POLL_SECONDS)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return self._DONE
+
+    def _record_depth(self, name, target_queue):
+        """記錄佇列的最大深度。"""
+        self.stats['max_queue_depth'][name] = max(self.stats['max_queue_depth'][name], target_queue.qsize())
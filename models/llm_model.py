@@ -1,13 +1,14 @@
-# import logging
+import time
+import logging
 from apis.llm_api import LLMAPI
+from models.conversation_memory import TokenBudgetMemory
+from models.chat_history_cache import chat_history_cache
+from models.llm_response_cache import LLMResponseCache
 # from apis.embedding_api import EmbeddingAPI
 # from apis.file_paths import FilePaths
 # from langchain.prompts import PromptTemplate
 # from langchain.prompts import ChatPromptTemplate
-from langchain.chains import ConversationChain
 from langchain.memory import ConversationBufferMemory
-# from langchain.memory import ChatMessageHistory
-from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.prompts import ChatPromptTemplate
 from langchain.prompts import PromptTemplate
 
@@ -25,67 +26,101 @@ class LLMModel:
         # self.output_dir = file_paths.get_output_dir()
         # self.vector_store_dir = file_paths.get_local_vector_store_dir()
     def query_llm_direct(self, query):
-        # 獲取 active_window_index
-        active_window_index = self.chat_session_data.get('active_window_index', 0)
+        # 取得受 token 預算限制的對話歷史
+        history = self._load_history()
 
-        # 確保 self.chat_session_data 中有針對 active_window_index 的 'conversation_memory'
-        memory_key = f'conversation_memory_{active_window_index}'
-        if memory_key not in self.chat_session_data:
-            self.chat_session_data[memory_key] = ConversationBufferMemory(memory_key="history", input_key="input")
+        # 定義 LLM，並以 prompt | llm 組成對話鏈
+        llm = LLMAPI.get_llm(self.mode, self.llm_option, cache=self._get_llm_cache())
+        chain = ChatPromptTemplate.from_template(self._direct_prompt()) | llm
+
+        # 查詢 LLM 並返回結果
+        start_time = time.perf_counter()
+        response = LLMAPI.to_text(chain.invoke({'history': history, 'input': query}))
+        self._log_prompt_stats(history, query, time.perf_counter() - start_time, '總耗時')
+        return response
+
+    def stream_llm_direct(self, query):
+        """以串流方式直接查詢 LLM，逐一產生回應的 token。"""
+        # 取得受 token 預算限制的對話歷史
+        history = self._load_history()
+
+        # 定義 LLM，並以 prompt | llm 組成可串流的鏈
+        llm = LLMAPI.get_llm(self.mode, self.llm_option, cache=self._get_llm_cache())
+        chain = ChatPromptTemplate.from_template(self._direct_prompt()) | llm
+
+        # 啟用 LLM 回應快取時以 invoke 查詢（stream 不查詢快取），一次返回完整回應
+        start_time = time.perf_counter()
+        if llm.cache is not None:
+            response = LLMAPI.to_text(chain.invoke({'history': history, 'input': query}))
+            self._log_prompt_stats(history, query, time.perf_counter() - start_time, '總耗時 (快取)')
+            yield response
+            return
+
+        # 逐一產生 token；首個 token 的延遲主要即為 prompt 的 prefill 時間
+        first_token = True
+        for chunk in chain.stream({'history': history, 'input': query}):
+            if first_token:
+                self._log_prompt_stats(history, query, time.perf_counter() - start_time, 'prefill (TTFT)')
+                first_token = False
+            yield LLMAPI.to_text(chunk)
+
+    def _get_llm_cache(self):
+        """依 chat_session_data['llm_cache'] 取得 LLM 回應快取，未啟用時返回 None。"""
+        return LLMResponseCache.from_setting(self.chat_session_data.get('llm_cache', False))
 
-        # 使用 ChatMessageHistory 添加對話歷史到 ConversationBufferMemory
-        chat_history_data = self.chat_session_data.get('chat_history', [])
-        if chat_history_data:
-            chat_history = ChatMessageHistory()
-            for record in chat_history_data:
-                user_query, ai_response = record['user_query'], record['ai_response']
-                chat_history.add_user_message(user_query)
-                chat_history.add_ai_message(ai_response)
+    def _load_history(self):
+        """
+        取得填入 prompt 的對話歷史。
+
+        預設 (memory_mode='token_budget') 為滾動摘要加上最近幾輪的原文；
+        memory_mode='buffer' 時沿用完整的對話歷史。
+        """
+        if self.chat_session_data.get('memory_mode', 'token_budget') == 'buffer':
+            memory = self._get_conversation_memory()
+            return memory.load_memory_variables({}).get('history', '')
+        return TokenBudgetMemory(self.chat_session_data).load_history()
+
+    def _log_prompt_stats(self, history, query, seconds, label):
+        """記錄本輪 prompt 的估計 token 數（與完整對話歷史比較）及延遲。"""
+        estimate_tokens = TokenBudgetMemory.estimate_tokens
+        prompt_tokens = estimate_tokens(self._direct_prompt()) + estimate_tokens(history) + estimate_tokens(query)
+        full_history = TokenBudgetMemory.format_turns(self.chat_session_data.get('chat_history', []))
+        full_tokens = prompt_tokens - estimate_tokens(history) + estimate_tokens(full_history)
+        logging.info(f"直接查詢 prompt ≈ {prompt_tokens} tokens (完整對話歷史 ≈ {full_tokens} tokens), "
+                     f"{label}={seconds:.3f}s (llm_option={self.llm_option})")
+
+    def _get_conversation_memory(self):
+        """取得目前窗口的 ConversationBufferMemory，對話歷史直接使用快取的 ChatMessageHistory。"""
+        # 以不會因刪除其他窗口而改變的 conversation_id 區分各窗口的記憶體
+        conversation_id = self.chat_session_data.get('conversation_id')
 
-            # 將 ChatMessageHistory 設置為 ConversationBufferMemory 的歷史記錄
-            self.chat_session_data[memory_key].chat_memory = chat_history
+        # 確保 self.chat_session_data 中有針對 conversation_id 的 'conversation_memory'
+        memory_key = f'conversation_memory_{conversation_id}'
+        if memory_key not in self.chat_session_data:
+            self.chat_session_data[memory_key] = ConversationBufferMemory(memory_key="history", input_key="input")
 
-        # 定義 LLM
-        llm = LLMAPI.get_llm(self.mode, self.llm_option)
+        # 每輪結束時由 LLMService 追加訊息，這裡不需重建對話歷史
+        self.chat_session_data[memory_key].chat_memory = chat_history_cache.get(
+            self.chat_session_data.get('username'), conversation_id)
+        return self.chat_session_data[memory_key]
 
-        # 自訂提示模板，包含上下文和指令
-        init_prompt = f"""
+    def _direct_prompt(self):
+        """自訂提示模板，包含上下文和指令。"""
+        return """
         You are a helpful and knowledgeable assistant. You will provide responses in Traditional Chinese (台灣中文).
         Here is the conversation history:
-        {{history}}
+        {history}
 
         Now, please provide a concise and relevant response to the following query:
-        {{input}}
+        {input}
         """
 
-        # 建立對話鏈
-        conversation_chain = ConversationChain(
-            llm=llm,
-            memory=self.chat_session_data[memory_key],
-            prompt=ChatPromptTemplate.from_template(init_prompt)
-        )
-        # 查詢 LLM 並返回結果
-        result = conversation_chain.invoke(input=query)
-        response = result.get('response', '')
-        return response
-
-    def set_window_title(self, query):
-        """使用 LLM 根據用戶的查詢設置窗口標題。"""
-        try:
-            llm = LLMAPI.get_llm(self.mode, self.llm_option)          # 獲取 LLM API 物件
-            prompt_template = self._title_prompt()   # 獲取prompt模板
-            formatted_prompt = prompt_template.format(query=query)  # 格式化prompt模板，插入query
-
-            title = llm.invoke(formatted_prompt)    # 調用 LLM 生成 window title
-            if self.chat_session_data.get('mode') == '內部LLM':
-                pass
-            else:
-                title = title.content
-            self.chat_session_data['title'] = title
-            return title
-
-        except Exception as e:
-            return print(f"查詢 set_window_title 時發生錯誤: {e}")
+    def generate_window_title(self, query):
+        """使用小模型根據用戶的查詢生成窗口標題（不修改 chat_session_data，可在背景執行緒中執行）。"""
+        llm = LLMAPI.get_utility_llm(self.mode)                   # 標題只需關鍵字，使用較快的小模型
+        prompt_template = self._title_prompt()   # 獲取prompt模板
+        formatted_prompt = prompt_template.format(query=query)  # 格式化prompt模板，插入query
+        return LLMAPI.to_text(llm.invoke(formatted_prompt)).strip()
 
     def _title_prompt(self):
         """生成設置窗口標題所需的提示模板。"""
@@ -3,23 +3,38 @@ import pandas as pd
 from apis.llm_api import LLMAPI
 from apis.embedding_api import EmbeddingAPI
 from apis.file_paths import FilePaths
+from models.vector_store_cache import vector_store_cache
+from models.document_corpus import DocumentCorpus
+from models.chat_history_cache import chat_history_cache
+from models.question_rephraser import question_rephraser
+from models.semantic_answer_cache import SemanticAnswerCache
+from models.conversation_memory import TokenBudgetMemory
+from models.llm_response_cache import LLMResponseCache
 
 # from langchain_community.vectorstores import Chroma
 from langchain_chroma import Chroma
 
-from langchain_core.runnables import RunnableWithMessageHistory
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-# from langchain.memory import ChatMessageHistory
-from langchain_community.chat_message_histories import ChatMessageHistory
+from langchain_core.runnables import RunnableLambda
+from langchain_core.documents import Document
 
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 
 import time
+import logging
+import threading
+import itertools
+from pathlib import Path
 import os
 os.environ["CHROMA_TELEMETRY"] = "False"
 
 class RAGModel:
+    # 修改回答或改寫問題的 prompt 時遞增，讓語意快取中依舊 prompt 產生的回答失效
+    PROMPT_VERSION = 1
+    # 保護 retrieved_data.csv 的寫入
+    _csv_lock = threading.Lock()
+
     def __init__(self, chat_session_data):
         # 初始化 hat_session_data
         self.chat_session_data = chat_session_data
@@ -31,39 +46,68 @@ class RAGModel:
         self.output_dir = file_paths.get_output_dir()
         username = chat_session_data.get("username")
         conversation_id = chat_session_data.get("conversation_id")
-        self.vector_store_dir = file_paths.get_local_vector_store_dir(username, conversation_id)
 
-    def query_llm_rag(self, query):
-        """使用 RAG 查詢 LLM，根據給定的問題和檢索的文件內容返回答案。"""
+        # 對話引用共用文件庫中的文件時，從共用向量資料庫中依 doc_id 過濾檢索；
+        # 否則沿用舊有的對話專屬向量資料庫（尚未遷移的對話）。
+        # 尚未執行 migrate_shared_corpus.py 的對話上傳新文件後，兩個向量資料庫都檢索，舊文件不會被遺漏。
+        # 效能測試可直接指定向量資料庫目錄（不依 doc_id 過濾）
+        self.doc_ids = DocumentCorpus().get_conversation_doc_ids(conversation_id)
+        self.legacy_vector_store_dir = None
+        local_vector_store_dir = file_paths.get_local_vector_store_dir(username, conversation_id)
+        if chat_session_data.get("vector_store_dir"):
+            self.doc_ids = []
+            self.vector_store_dir = Path(chat_session_data["vector_store_dir"])
+        elif self.doc_ids:
+            self.vector_store_dir = file_paths.get_shared_vector_store_dir(chat_session_data.get("embedding"))
+            if (local_vector_store_dir.exists()
+                    and not local_vector_store_dir.joinpath(DocumentCorpus.MIGRATED_MARKER).exists()):
+                self.legacy_vector_store_dir = local_vector_store_dir
+        else:
+            self.vector_store_dir = local_vector_store_dir
+        # 檢索設定（MMR 返回 k 個文檔塊，從 fetch_k 個候選中挑選）
+        self.retriever_k = chat_session_data.get('retriever_k', 3)
+        self.retriever_fetch_k = chat_session_data.get('retriever_fetch_k', 8)
+        # 串流查詢結束後檢索到的文件
+        self.retrieved_documents = []
+        # 最近一次 query_llm_rag 的各階段耗時與估計 token 數
+        self.last_timings = {}
+        self.qa_system_prompt = ''
+        # 重複問題的語意快取
+        self.answer_cache = SemanticAnswerCache()
+
+    def query_llm_rag(self, query, raise_errors=False):
+        """
+        使用 RAG 查詢 LLM，根據給定的問題和檢索的文件內容返回答案。
+
+        Args:
+            query (str): 使用者的問題。
+            raise_errors (bool): 發生錯誤時是否拋出例外（批次評估需要重試）；預設返回 (None, [])。
+        """
         try:
-            # 初始化語言模型
-            llm = LLMAPI.get_llm(self.mode, self.llm_option)
-            # 初始化 embedding 模型
-            embedding = self.chat_session_data.get("embedding")
-            embedding_function = EmbeddingAPI.get_embedding_function('內部LLM', embedding)
-
-            # 建立向量資料庫和檢索器
-            vector_db = Chroma(
-                embedding_function=embedding_function,
-                persist_directory=self.vector_store_dir.as_posix()
-            )
-            retriever = vector_db.as_retriever(search_type="mmr",search_kwargs={"k": 3, "fetch_k": 8})
+            start_time = time.perf_counter()
+            self.last_timings = {'retrieval_seconds': 0.0}
+            inputs = self._prepare_inputs(query)
+            self.last_timings['rephrase_seconds'] = time.perf_counter() - start_time
 
-            # 創建具備聊天記錄感知能力的檢索器
-            history_aware_retriever = self._create_history_aware_retriever(llm, retriever)
+            # 語意快取命中時直接返回保存的回答，不需檢索與生成
+            cached = self._lookup_answer_cache(inputs, start_time)
+            if cached is not None:
+                response, retrieved_documents = cached
+                self._record_timings(inputs, response, retrieved_documents, start_time, time.perf_counter())
+                self._save_retrieved_data_to_csv(query, retrieved_documents, response)
+                return response, retrieved_documents
 
             # 創建具聊天記錄功能的檢索增強生成鏈
-            conversational_rag_chain = self._create_conversational_rag_chain(llm, history_aware_retriever)
+            conversational_rag_chain = self._build_conversational_rag_chain()
 
             # 查詢 RAG，並獲取回答和檢索到的文件
-            result_rag = conversational_rag_chain.invoke({
-                'input': query,
-                'chat_history': ChatMessageHistory()      # self._get_chat_history_from_session(),
-            })
+            chain_start_time = time.perf_counter()
+            result_rag = conversational_rag_chain.invoke(inputs)
 
             response = result_rag.get('answer', '')  # 取得回答
             retrieved_documents = result_rag.get('context', [])  # 取得檢索到的文件
-
+            self._record_timings(inputs, response, retrieved_documents, start_time, chain_start_time)
+            self._store_answer_cache(inputs, response, retrieved_documents, time.perf_counter() - start_time)
 
             # 保存檢索到的數據到 CSV 文件
             self._save_retrieved_data_to_csv(query, retrieved_documents, response)
@@ -71,27 +115,214 @@ class RAGModel:
             return response, retrieved_documents
 
         except Exception as e:
+            if raise_errors:
+                raise
             # 當發生錯誤時顯示錯誤訊息
             return print(f"查詢 query_llm_rag 時發生錯誤: {e}"), []
 
-    def _create_history_aware_retriever(self, llm, retriever):
-        """創建具備聊天記錄感知能力的檢索器。"""
-        contextualize_q_system_prompt = """
-            根據聊天記錄和最新的使用者問題，\
-            該問題可能參考了聊天記錄中的上下文，請將其重構為一個可以不依賴聊天記錄就能理解的問題。\
-            不要回答問題，只需重新表述，若無需表述則保持不變。
+    def _record_timings(self, inputs, response, retrieved_documents, start_time, chain_start_time):
         """
-        contextualize_q_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", contextualize_q_system_prompt),
-                MessagesPlaceholder("chat_history"),
-                ("human", "{input}"),
-            ]
+        記錄本次查詢的各階段耗時，以及 prompt 與回答的估計 token 數（以字元數估算，欄位名稱標示 _est）。
+        """
+        end_time = time.perf_counter()
+        context = "\n\n".join(doc.page_content for doc in retrieved_documents)
+        history = "\n".join(str(getattr(message, 'content', message)) for message in inputs['chat_history'])
+        prompt = self.qa_system_prompt.replace('{context}', context) + history + inputs['input']
+        self.last_timings.update({
+            'total_seconds': end_time - start_time,
+            'generation_seconds': max(end_time - chain_start_time - self.last_timings['retrieval_seconds'], 0.0),
+            'prompt_tokens_est': TokenBudgetMemory.estimate_tokens(prompt),
+            'completion_tokens_est': TokenBudgetMemory.estimate_tokens(response or ''),
+        })
+
+    def stream_llm_rag(self, query):
+        """以串流方式使用 RAG 查詢 LLM，逐一產生回答的 token。"""
+        start_time = time.perf_counter()
+        inputs = self._prepare_inputs(query)
+
+        # 語意快取命中時一次返回保存的回答
+        cached = self._lookup_answer_cache(inputs, start_time)
+        if cached is not None:
+            response, self.retrieved_documents = cached
+            yield response
+            self._save_retrieved_data_to_csv(query, self.retrieved_documents, response)
+            return
+
+        # 創建具聊天記錄功能的檢索增強生成鏈
+        conversational_rag_chain = self._build_conversational_rag_chain()
+
+        # 串流輸出中，'context' 片段為檢索到的文件，'answer' 片段為回答的 token；
+        # 啟用 LLM 回應快取時以 invoke 查詢（stream 不查詢快取），一次返回完整回應
+        answer_chunks = []
+        retrieved_documents = []
+        if self._get_llm_cache() is not None:
+            chunks = [conversational_rag_chain.invoke(inputs)]
+        else:
+            chunks = conversational_rag_chain.stream(inputs)
+        for chunk in chunks:
+            if 'context' in chunk:
+                retrieved_documents = chunk['context']
+            if 'answer' in chunk:
+                answer_chunks.append(chunk['answer'])
+                yield chunk['answer']
+
+        # 串流結束後，保存回答到語意快取，並保存檢索到的數據到 CSV 文件
+        self.retrieved_documents = retrieved_documents
+        response = ''.join(answer_chunks)
+        self._store_answer_cache(inputs, response, retrieved_documents, time.perf_counter() - start_time)
+        self._save_retrieved_data_to_csv(query, retrieved_documents, response)
+
+    def _prepare_inputs(self, query):
+        """取得聊天記錄，並產生用於檢索與語意快取的獨立問題。"""
+        chat_history = self._get_chat_history_messages()
+        return {
+            'input': query,
+            'chat_history': chat_history,
+            'standalone': question_rephraser.get_standalone_question(self.mode, query, chat_history),
+        }
+
+    def _answer_cache_scope(self):
+        """返回語意快取的 (範圍鍵, 文件集合)；舊有的對話專屬向量資料庫以其目錄作為文件集合。"""
+        doc_ids = self.doc_ids or [self.vector_store_dir.as_posix()]
+        if self.legacy_vector_store_dir:
+            doc_ids = doc_ids + [self.legacy_vector_store_dir.as_posix()]
+        scope_key = SemanticAnswerCache.scope_key(
+            doc_ids, self.chat_session_data.get("embedding"), self.mode, self.llm_option, self.PROMPT_VERSION)
+        return scope_key, doc_ids
+
+    def _lookup_answer_cache(self, inputs, start_time):
+        """
+        以獨立問題的 embedding 查詢語意快取，命中時返回 (回答, 檢索到的文件)，否則返回 None。
+
+        chat_session_data['bypass_answer_cache'] 為 True 時不查詢也不保存。
+        查詢結果記錄於 chat_session_data['answer_cache_stats']，由 DevOpsDB 保存。
+        """
+        if self.chat_session_data.get('bypass_answer_cache'):
+            return None
+        try:
+            inputs['question_vector'] = self._get_embedding_function().embed_query(inputs['standalone'])
+            scope_key, _ = self._answer_cache_scope()
+            entry = self.answer_cache.lookup(scope_key, inputs['question_vector'])
+        except Exception as e:
+            logging.warning(f"查詢語意快取時發生錯誤: {e}")
+            return None
+        if entry is None:
+            return None
+
+        elapsed = time.perf_counter() - start_time
+        self.chat_session_data['answer_cache_stats'] = {
+            'hit': 1,
+            'response_seconds': elapsed,
+            'saved_seconds': max(entry['response_seconds'] - elapsed, 0.0),
+        }
+        logging.info(f"語意快取命中 (相似度 {entry['similarity']:.3f}): {inputs['standalone']} ≈ {entry['question']}，"
+                     f"節省 {self.chat_session_data['answer_cache_stats']['saved_seconds']:.2f}s")
+        documents = [Document(page_content=doc['page_content'], metadata=doc.get('metadata', {}))
+                     for doc in entry['context']]
+        return entry['answer'], documents
+
+    def _store_answer_cache(self, inputs, response, retrieved_documents, response_seconds):
+        """將新產生的回答保存到語意快取。"""
+        bypassed = self.chat_session_data.get('bypass_answer_cache')
+        self.chat_session_data['answer_cache_stats'] = {
+            'hit': None if bypassed else 0, 'response_seconds': response_seconds, 'saved_seconds': 0.0}
+        if 'question_vector' not in inputs or not response:
+            return
+        try:
+            scope_key, doc_ids = self._answer_cache_scope()
+            context = [{'page_content': doc.page_content, 'metadata': doc.metadata} for doc in retrieved_documents]
+            self.answer_cache.store(scope_key, doc_ids, inputs['standalone'], inputs['question_vector'],
+                                    response, context, response_seconds)
+        except Exception as e:
+            logging.warning(f"保存語意快取時發生錯誤: {e}")
+
+    def _get_llm_cache(self):
+        """依 chat_session_data['llm_cache'] 取得 LLM 回應快取，未啟用時返回 None。"""
+        return LLMResponseCache.from_setting(self.chat_session_data.get('llm_cache', False))
+
+    def _get_embedding_function(self):
+        """取得 embedding 模型。"""
+        return EmbeddingAPI.get_embedding_function('內部LLM', self.chat_session_data.get("embedding"))
+
+    def _build_conversational_rag_chain(self):
+        """初始化 LLM、向量資料庫與檢索器，並創建具聊天記錄功能的檢索增強生成鏈。"""
+        # 初始化語言模型
+        llm = LLMAPI.get_llm(self.mode, self.llm_option, cache=self._get_llm_cache())
+        # 初始化 embedding 模型
+        embedding = self.chat_session_data.get("embedding")
+        embedding_function = self._get_embedding_function()
+
+        # 從快取取得已開啟的向量資料庫（未命中時才開啟）
+        search_kwargs = {"k": self.retriever_k, "fetch_k": self.retriever_fetch_k}
+        if self.doc_ids:
+            search_kwargs["filter"] = {"doc_id": {"$in": self.doc_ids}}
+        stores = [(self._open_vector_store(self.vector_store_dir, embedding, embedding_function), search_kwargs)]
+        if self.legacy_vector_store_dir:
+            # 尚未遷移的舊有對話專屬向量資料庫（不依 doc_id 過濾）
+            stores.append((
+                self._open_vector_store(self.legacy_vector_store_dir, embedding, embedding_function),
+                {"k": self.retriever_k, "fetch_k": self.retriever_fetch_k}
+            ))
+
+        # 創建具備聊天記錄感知能力的檢索器
+        history_aware_retriever = self._create_history_aware_retriever(stores, embedding_function)
+
+        # 創建具聊天記錄功能的檢索增強生成鏈
+        return self._create_conversational_rag_chain(llm, history_aware_retriever)
+
+    @staticmethod
+    def _open_vector_store(vector_store_dir, embedding, embedding_function):
+        """從快取取得已開啟的向量資料庫，未命中時才開啟。"""
+        return vector_store_cache.get(
+            vector_store_dir,
+            ('內部LLM', embedding),
+            lambda: Chroma(
+                embedding_function=embedding_function,
+                persist_directory=vector_store_dir.as_posix()
+            )
         )
-        # 使用 LLM 和檢索器來創建具歷史感知的檢索器
-        history_aware_retriever = create_history_aware_retriever(llm, retriever, contextualize_q_prompt)
-        # print('5. history_aware_retriever: ', history_aware_retriever)
-        return history_aware_retriever
+
+    def _create_history_aware_retriever(self, stores, embedding_function):
+        """
+        創建具備聊天記錄感知能力的檢索器。
+
+        只有問題依賴聊天記錄時才以小模型改寫（第一輪或可獨立理解的問題直接檢索），
+        避免每輪都多一次對話模型的完整生成。
+        查詢語意快取時已計算獨立問題的 embedding，直接以該向量做 MMR 檢索，不再重新嵌入；
+        有多個向量資料庫時共用同一個向量，結果交錯合併後取前 k 個。
+
+        Args:
+            stores (list): (向量資料庫, MMR 檢索參數) 列表。
+            embedding_function: 未查詢語意快取時用於嵌入獨立問題。
+        """
+        # 獨立問題已由 _prepare_inputs 產生（同時用於語意快取），並記錄檢索耗時
+        def retrieve(inputs):
+            start_time = time.perf_counter()
+            question_vector = inputs.get('question_vector')
+            if question_vector is None:
+                question_vector = embedding_function.embed_query(inputs['standalone'])
+            results = [vector_db.max_marginal_relevance_search_by_vector(question_vector, **search_kwargs)
+                       for vector_db, search_kwargs in stores]
+            documents = self._merge_results(results, self.retriever_k)
+            self.last_timings['retrieval_seconds'] = time.perf_counter() - start_time
+            return documents
+
+        return RunnableLambda(retrieve).with_config(run_name="chat_retriever_chain")
+
+    @staticmethod
+    def _merge_results(results, k):
+        """
+        交錯合併多個向量資料庫的檢索結果（保留各自的排序），略過內容重複的文檔塊
+        （已合併到共用文件庫的舊文件），返回前 k 個。
+        """
+        merged = []
+        seen_contents = set()
+        for documents in itertools.zip_longest(*results):
+            for doc in documents:
+                if doc is not None and doc.page_content not in seen_contents:
+                    seen_contents.add(doc.page_content)
+                    merged.append(doc)
+        return merged[:k]
 
     def _create_conversational_rag_chain(self, llm, history_aware_retriever):
         """創建具聊天記錄功能的檢索增強生成鏈。"""
@@ -132,6 +363,7 @@ class RAGModel:
                     檢索到的內容: {context}
                 """
 
+        self.qa_system_prompt = qa_system_prompt
         qa_prompt = ChatPromptTemplate.from_messages(
             [
                 ("system", qa_system_prompt),
@@ -140,29 +372,20 @@ class RAGModel:
             ]
         )
 
-        # 創建一個問題回答鏈，並與檢索增強生成鏈結合
+        # 創建一個問題回答鏈，並與檢索增強生成鏈結合；
+        # 聊天記錄由呼叫端直接傳入，不需 RunnableWithMessageHistory 每次重建
         question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-        rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+        return create_retrieval_chain(history_aware_retriever, question_answer_chain)
 
-        # 創建具聊天記錄功能的檢索增強生成鏈
-        return RunnableWithMessageHistory(
-            rag_chain,
-            self._get_chat_history_from_session,
-            input_messages_key="input",
-            history_messages_key="chat_history",
-            output_messages_key="answer",
-        )
-
-    def _get_chat_history_from_session(self) -> ChatMessageHistory:
-        """從 session state 中取得聊天記錄，若無則創建新的聊天記錄。"""
-        # 從 session 中獲取聊天記錄，如果不存在，則初始化空的聊天記錄
-        chat_history_data = self.chat_session_data.get('chat_history', [])
-        chat_history = ChatMessageHistory()
-        for record in chat_history_data:
-            user_query, ai_response = record['user_query'], record['ai_response']
-            chat_history.add_user_message(user_query)
-            chat_history.add_ai_message(ai_response)
-        return chat_history
+    def _get_chat_history_messages(self):
+        """從快取取得目前對話的聊天記錄訊息（未快取時從資料庫載入）。"""
+        # 新窗口或批次評估（chat_history 為空）沒有聊天記錄，不需查詢快取或資料庫
+        if not self.chat_session_data.get('chat_history'):
+            return []
+        chat_history = chat_history_cache.get(
+            self.chat_session_data.get('username'), self.chat_session_data.get('conversation_id'))
+        # 傳入副本，避免查詢期間其他執行緒追加訊息
+        return list(chat_history.messages)
 
     def _save_retrieved_data_to_csv(self, query, retrieved_data, response):
         """將檢索到的數據保存到 CSV 文件中。"""
@@ -175,6 +398,13 @@ class RAGModel:
         new_data = {"Question": [query], "Context": [context], "Response": [response]}  # 新數據
         new_df = pd.DataFrame(new_data)  # 將新數據轉換為 DataFrame
 
+        # 批次評估時多個執行緒同時寫入，讀取-合併-寫入需互斥
+        with RAGModel._csv_lock:
+            self._append_to_csv(output_file, new_df)
+
+    @staticmethod
+    def _append_to_csv(output_file, new_df):
+        """將新數據合併到 CSV 文件。"""
         if output_file.exists():
             # 如果文件已存在，讀取現有數據，並合併新數據
             existing_df = pd.read_csv(output_file)
@@ -0,0 +1,133 @@
+import time
+import hashlib
+import logging
+import threading
+from models.database_base import BaseDB
+from apis.file_paths import FilePaths
+from apis.client_pool import client_pool
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+logging.basicConfig(level=logging.INFO)
+
+
+class LLMResponseCache(BaseCache):
+    """
+    持久化的 LLM 回應完全比對快取（LangChain BaseCache）。
+
+    以 (命名空間, 模型與生成參數 llm_string, prompt 內容) 的 sha256 為鍵，
+    所有行程共用 developer/LLMResponseCache.db；總大小超過 max_bytes 時刪除最久未使用的回應 (LRU)。
+    由呼叫端以 LLMAPI.get_llm(..., cache=LLMResponseCache.from_setting(...)) 決定是否啟用。
+    LangChain 只在 invoke 時查詢快取，stream 不會查詢，因此啟用快取時呼叫端改以 invoke 產生回應。
+    """
+
+    # 每寫入多少筆回應檢查一次總大小
+    EVICT_CHECK_INTERVAL = 50
+
+    def __init__(self, namespace='default', db_path=None, max_bytes=512 * 1024 ** 2):
+        """
+        Args:
+            namespace (str): 命名空間；相同 prompt 需要獨立結果時（例如多次評估）使用不同的命名空間。
+            db_path (Path, optional): 資料庫路徑。
+            max_bytes (int): 快取回應的總大小上限（位元組）。
+        """
+        # 設定資料庫路徑
+        if db_path is None:
+            db_path = FilePaths().get_developer_dir().joinpath('LLMResponseCache.db')
+        self.db_path = db_path
+        self.base_db = BaseDB(self.db_path)
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0}
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        # 初始化資料庫表格
+        self.base_db.ensure_db_path_exists()
+        self._init_db()
+
+    @classmethod
+    def from_setting(cls, setting):
+        """
+        依 chat_session_data['llm_cache'] 等設定取得快取：False/None 不使用快取（返回 None），
+        True 使用預設命名空間，字串為命名空間。同一命名空間在行程內共用同一個實例。
+        """
+        if not setting:
+            return None
+        namespace = setting if isinstance(setting, str) else 'default'
+        return client_pool.get_or_create(('llm_cache', namespace), lambda: cls(namespace))
+
+    def _init_db(self):
+        """初始化資料庫，創建 responses 表格。"""
+        self.base_db.execute_query('''
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                namespace TEXT,
+                generations TEXT,
+                size INTEGER,
+                last_used REAL
+            )
+        ''')
+        self.base_db.execute_query(
+            "CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used)")
+
+    def _cache_key(self, prompt, llm_string):
+        """計算快取鍵。"""
+        digest = hashlib.sha256()
+        for part in (self.namespace, llm_string, prompt):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        """查詢已快取的回應，未命中時返回 None。"""
+        cache_key = self._cache_key(prompt, llm_string)
+        rows = self.base_db.fetch_query("SELECT generations FROM responses WHERE cache_key = ?", (cache_key,))
+        if not rows:
+            self.stats['misses'] += 1
+            return None
+        try:
+            generations = loads(rows[0][0])
+        except Exception as e:
+            # 無法還原（例如 LangChain 版本變更）時視為未命中
+            logging.warning(f"LLMResponseCache 無法還原快取的回應: {e}")
+            self.stats['misses'] += 1
+            return None
+        self.base_db.execute_query("UPDATE responses SET last_used = ? WHERE cache_key = ?", (time.time(), cache_key))
+        self.stats['hits'] += 1
+        return generations
+
+    def update(self, prompt, llm_string, return_val):
+        """保存回應。"""
+        generations = dumps(list(return_val))
+        self.base_db.execute_query(
+            "INSERT OR REPLACE INTO responses (cache_key, namespace, generations, size, last_used) VALUES (?, ?, ?, ?, ?)",
+            (self._cache_key(prompt, llm_string), self.namespace, generations, len(generations.encode('utf-8')),
+             time.time()))
+        with self._lock:
+            self._writes += 1
+            check_size = self._writes % self.EVICT_CHECK_INTERVAL == 1
+        if check_size:
+            self._evict_over_budget()
+
+    def clear(self, **kwargs):
+        """清除此命名空間的所有回應。"""
+        self.base_db.execute_query("DELETE FROM responses WHERE namespace = ?", (self.namespace,))
+
+    def _evict_over_budget(self):
+        """總大小超過上限時，刪除最久未使用的回應直到總大小降到上限的九成。"""
+        total_bytes = self.base_db.fetch_query("SELECT COALESCE(SUM(size), 0) FROM responses")[0][0]
+        if total_bytes <= self.max_bytes:
+            return
+        excess = total_bytes - int(self.max_bytes * 0.9)
+        self.base_db.execute_query(
+            """
+            DELETE FROM responses WHERE cache_key IN (
+                SELECT cache_key FROM (
+                    SELECT cache_key, size, SUM(size) OVER (ORDER BY last_used, cache_key) AS running_bytes
+                    FROM responses
+                ) WHERE running_bytes - size < ?
+            )
+            """,
+            (excess,))
+        logging.info(f"LLMResponseCache 淘汰最久未使用的回應，釋放約 {excess} 位元組")
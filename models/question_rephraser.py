@@ -0,0 +1,129 @@
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from apis.llm_api import LLMAPI
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+logging.basicConfig(level=logging.INFO)
+
+
+class QuestionRephraser:
+    """
+    將依賴聊天記錄的問題改寫為可獨立理解的問題，供 RAG 檢索使用。
+
+    只有在需要時才呼叫 LLM 改寫：
+    - 第一輪（沒有聊天記錄）直接使用原問題。
+    - 問題不含代名詞、指示詞等指涉上下文的字詞且長度足夠時，視為可獨立理解，直接使用原問題。
+    - 其餘情況以小模型改寫，並以 (聊天記錄雜湊, 問題) 為鍵快取改寫結果。
+    並統計略過改寫的次數及節省的時間（以平均改寫耗時估算）。
+    """
+
+    # 短於此字數的問題多半是接續上文的追問
+    MIN_SELF_CONTAINED_CHARS = 8
+    # 指涉聊天記錄上下文的字詞
+    CONTEXT_REFERENCE_PATTERN = re.compile(
+        r'它|他們|她們|這個|那個|這些|那些|這樣|那樣|這種|那種|上述|上面|前面|剛才|剛剛|之前|其中|另外|還有|呢[?？]?$'
+        r'|\b(it|its|this|that|these|those|they|them|above|previous)\b',
+        re.IGNORECASE)
+    CONTEXTUALIZE_SYSTEM_PROMPT = """
+        根據聊天記錄和最新的使用者問題，\
+        該問題可能參考了聊天記錄中的上下文，請將其重構為一個可以不依賴聊天記錄就能理解的問題。\
+        不要回答問題，只需重新表述，若無需表述則保持不變。
+    """
+
+    def __init__(self, max_entries=1024):
+        """
+        Args:
+            max_entries (int): 最多快取的改寫結果數量。
+        """
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'first_turn': 0, 'self_contained': 0, 'cache_hit': 0, 'rephrased': 0,
+                      'rephrase_seconds': 0.0}
+        self.contextualize_prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", self.CONTEXTUALIZE_SYSTEM_PROMPT),
+                MessagesPlaceholder("chat_history"),
+                ("human", "{input}"),
+            ]
+        )
+
+    def get_standalone_question(self, mode, question, chat_history):
+        """
+        返回用於檢索的獨立問題。
+
+        Args:
+            mode (str): '內部LLM' 或 '外部LLM'，決定改寫使用的小模型。
+            question (str): 使用者的問題。
+            chat_history (list): 聊天記錄訊息。
+        """
+        if not chat_history:
+            return self._skip('first_turn', question)
+        if self.is_self_contained(question):
+            return self._skip('self_contained', question)
+
+        key = (self._history_hash(chat_history), question)
+        with self._lock:
+            standalone = self._cache.get(key)
+            if standalone is not None:
+                self._cache.move_to_end(key)
+        if standalone is not None:
+            return self._skip('cache_hit', standalone)
+
+        # 以小模型改寫問題
+        start_time = time.perf_counter()
+        try:
+            chain = self.contextualize_prompt | LLMAPI.get_utility_llm(mode)
+            standalone = LLMAPI.to_text(chain.invoke({'input': question, 'chat_history': chat_history})).strip()
+        except Exception as e:
+            # 改寫失敗時以原問題檢索
+            logging.warning(f"改寫問題時發生錯誤: {e}")
+            return question
+        elapsed = time.perf_counter() - start_time
+
+        with self._lock:
+            self._cache[key] = standalone or question
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            self.stats['rephrased'] += 1
+            self.stats['rephrase_seconds'] += elapsed
+        logging.info(f"改寫問題耗時 {elapsed:.3f}s: {question} -> {standalone}")
+        return standalone or question
+
+    @classmethod
+    def is_self_contained(cls, question):
+        """以啟發式規則判斷問題是否不需聊天記錄即可理解。"""
+        question = question.strip()
+        if len(question) < cls.MIN_SELF_CONTAINED_CHARS:
+            return False
+        return cls.CONTEXT_REFERENCE_PATTERN.search(question) is None
+
+    def _skip(self, reason, question):
+        """記錄略過改寫的原因與估計節省的時間。"""
+        with self._lock:
+            self.stats[reason] += 1
+            skipped = self.stats['first_turn'] + self.stats['self_contained'] + self.stats['cache_hit']
+            total = skipped + self.stats['rephrased']
+            average_seconds = (self.stats['rephrase_seconds'] / self.stats['rephrased']
+                               if self.stats['rephrased'] else 0.0)
+        logging.info(f"略過改寫問題 ({reason})：累計略過 {skipped}/{total} 次，"
+                     f"估計節省 {skipped * average_seconds:.1f}s (平均改寫耗時 {average_seconds:.3f}s)")
+        return question
+
+    @staticmethod
+    def _history_hash(chat_history):
+        """計算聊天記錄內容的雜湊值。"""
+        digest = hashlib.sha256()
+        for message in chat_history:
+            digest.update(getattr(message, 'type', '').encode('utf-8'))
+            digest.update(str(getattr(message, 'content', message)).encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+
+# 行程內共用的問題改寫器（共用改寫快取與統計）
+question_rephraser = QuestionRephraser()
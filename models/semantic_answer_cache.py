@@ -0,0 +1,147 @@
+import json
+import math
+import time
+import logging
+from array import array
+from models.database_base import BaseDB
+from apis.file_paths import FilePaths
+
+logging.basicConfig(level=logging.INFO)
+
+
+class SemanticAnswerCache:
+    """
+    RAG 回答的語意快取。
+
+    以 (文件集合, embedding 模型, LLM, prompt 版本) 為範圍，保存獨立問題的 embedding 與回答；
+    新問題的 embedding 與同一範圍內已保存問題的餘弦相似度超過 similarity_threshold 時，直接返回保存的回答，
+    不需再檢索與生成。回答超過 ttl_seconds 即失效；文件被新版本取代或從共用文件庫刪除時，
+    依 doc_id 使包含該文件的所有快取失效。所有使用者共用 developer/SemanticAnswerCache.db。
+    """
+
+    # 每個範圍最多保存的回答數量，超過時刪除最舊的回答
+    MAX_ENTRIES_PER_SCOPE = 500
+
+    def __init__(self, db_path=None, similarity_threshold=0.95, ttl_seconds=7 * 24 * 60 * 60):
+        """
+        Args:
+            db_path (Path, optional): 資料庫路徑。
+            similarity_threshold (float): 視為相同問題的最低餘弦相似度。
+            ttl_seconds (int): 回答的有效秒數。
+        """
+        # 設定資料庫路徑
+        if db_path is None:
+            db_path = FilePaths().get_developer_dir().joinpath('SemanticAnswerCache.db')
+        self.db_path = db_path
+        self.base_db = BaseDB(self.db_path)
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+
+        # 初始化資料庫表格
+        self.base_db.ensure_db_path_exists()
+        self._init_db()
+
+    def _init_db(self):
+        """初始化資料庫，創建 answers 表格。"""
+        self.base_db.execute_query('''
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY,
+                scope_key TEXT,
+                doc_ids TEXT,
+                question TEXT,
+                vector BLOB,
+                answer TEXT,
+                context TEXT,
+                response_seconds REAL,
+                created_at REAL,
+                hits INTEGER DEFAULT 0
+            )
+        ''')
+        self.base_db.execute_query(
+            "CREATE INDEX IF NOT EXISTS idx_answers_scope ON answers (scope_key, created_at)")
+
+    @staticmethod
+    def scope_key(doc_ids, embedding, mode, llm_option, prompt_version):
+        """組成快取範圍的鍵。"""
+        return json.dumps([sorted(doc_ids), embedding, mode, llm_option, prompt_version], ensure_ascii=False)
+
+    def lookup(self, scope_key, vector):
+        """
+        查詢與 vector 最相似且未過期的回答。
+
+        Args:
+            scope_key (str): scope_key() 返回的快取範圍。
+            vector (list): 獨立問題的 embedding。
+
+        Returns:
+            dict: 命中時返回 {'question', 'answer', 'context', 'response_seconds', 'similarity'}，否則返回 None。
+        """
+        vector = self._normalize(vector)
+        rows = self.base_db.fetch_query(
+            """
+            SELECT id, question, vector, answer, context, response_seconds FROM answers
+            WHERE scope_key = ? AND created_at >= ?
+            """,
+            (scope_key, time.time() - self.ttl_seconds))
+
+        best_row, best_similarity = None, self.similarity_threshold
+        for row in rows:
+            similarity = sum(a * b for a, b in zip(vector, array('f', row[2])))
+            if similarity >= best_similarity:
+                best_row, best_similarity = row, similarity
+        if best_row is None:
+            return None
+
+        entry_id, question, _, answer, context, response_seconds = best_row
+        self.base_db.execute_query("UPDATE answers SET hits = hits + 1 WHERE id = ?", (entry_id,))
+        return {
+            'question': question,
+            'answer': answer,
+            'context': json.loads(context) if context else [],
+            'response_seconds': response_seconds or 0.0,
+            'similarity': best_similarity,
+        }
+
+    def store(self, scope_key, doc_ids, question, vector, answer, context, response_seconds):
+        """
+        保存回答，並刪除同一範圍內已過期或超過數量上限的回答。
+
+        Args:
+            scope_key (str): scope_key() 返回的快取範圍。
+            doc_ids (list): 回答所依據的文件集合（供文件被取代或刪除時使快取失效）。
+            question (str): 獨立問題。
+            vector (list): 獨立問題的 embedding。
+            answer (str): 回答。
+            context (list): 檢索到的文件 [{'page_content', 'metadata'}]。
+            response_seconds (float): 產生回答的耗時（命中時即為節省的時間）。
+        """
+        now = time.time()
+        self.base_db.execute_transaction([
+            (
+                """
+                INSERT INTO answers (scope_key, doc_ids, question, vector, answer, context, response_seconds, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (scope_key, ' '.join(doc_ids), question, array('f', self._normalize(vector)).tobytes(), answer,
+                 json.dumps(context, ensure_ascii=False, default=str), response_seconds, now)
+            ),
+            (
+                """
+                DELETE FROM answers WHERE scope_key = ? AND (created_at < ? OR id NOT IN (
+                    SELECT id FROM answers WHERE scope_key = ? ORDER BY created_at DESC LIMIT ?))
+                """,
+                (scope_key, now - self.ttl_seconds, scope_key, self.MAX_ENTRIES_PER_SCOPE)
+            ),
+        ])
+
+    def invalidate_documents(self, doc_ids):
+        """使依據任一 doc_id 的回答失效（文件被新版本取代或從共用文件庫刪除時呼叫）。"""
+        for doc_id in doc_ids:
+            self.base_db.execute_query("DELETE FROM answers WHERE instr(doc_ids, ?) > 0", (doc_id,))
+        logging.info(f"SemanticAnswerCache 已使 {len(doc_ids)} 份文件的快取回答失效")
+
+    @staticmethod
+    def _normalize(vector):
+        """將向量正規化為單位長度，內積即為餘弦相似度。"""
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
@@ -0,0 +1,128 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logging.basicConfig(level=logging.INFO)
+
+
+class VectorStoreCache:
+    """
+    已開啟向量資料庫 (Chroma) 的 LRU 快取，以 vector_store_dir 為鍵。
+
+    - 以目錄在磁碟上的大小估算每個向量資料庫佔用的記憶體，總量超過 max_bytes 時淘汰最久未使用者。
+    - 閒置超過 idle_seconds 的向量資料庫會被淘汰。
+    - 當文件寫入新的 chunks 時，呼叫 invalidate() 讓下一次查詢重新開啟。
+    - 開啟向量資料庫與計算目錄大小在全域鎖之外進行，只以每個目錄各自的鎖避免重複開啟，
+      開啟大型向量資料庫時不會阻塞其他使用者的快取命中。
+    """
+
+    def __init__(self, max_entries=32, max_bytes=2 * 1024 ** 3, idle_seconds=30 * 60):
+        """
+        Args:
+            max_entries (int): 最多快取的向量資料庫數量。
+            max_bytes (int): 快取的向量資料庫總大小上限（位元組）。
+            idle_seconds (int): 閒置超過此秒數即淘汰。
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self._stores = OrderedDict()
+        self._lock = threading.Lock()
+        # 每個目錄的開啟鎖、目錄大小（失效前不重新計算）與失效次數
+        self._open_locks = {}
+        self._sizes = {}
+        self._generations = {}
+
+    def get(self, vector_store_dir, embedding_key, factory):
+        """
+        取得 vector_store_dir 對應的向量資料庫，若未快取則呼叫 factory 開啟。
+
+        Args:
+            vector_store_dir (Path): 向量資料庫目錄。
+            embedding_key (tuple): 使用的 embedding 設定；設定不同時會重新開啟。
+            factory (callable): 無參數的函式，返回新開啟的向量資料庫。
+        """
+        key = Path(vector_store_dir).as_posix()
+
+        with self._lock:
+            self._evict_idle(time.monotonic())
+            store = self._get_cached(key, embedding_key)
+            if store is not None:
+                return store
+            open_lock = self._open_locks.setdefault(key, threading.Lock())
+
+        # 未命中或 embedding 設定不同：在全域鎖之外開啟，同一目錄同時只有一個執行緒開啟
+        with open_lock:
+            with self._lock:
+                store = self._get_cached(key, embedding_key)
+                if store is not None:
+                    return store
+                generation = self._generations.get(key, 0)
+                size = self._sizes.get(key)
+
+            store = factory()
+            if size is None:
+                size = self._dir_size(key)
+
+            with self._lock:
+                if self._generations.get(key, 0) != generation:
+                    # 開啟期間已失效（有新的 chunks 寫入），不放入快取，下一次查詢重新開啟
+                    return store
+                self._sizes[key] = size
+                self._stores[key] = {
+                    'store': store,
+                    'embedding_key': embedding_key,
+                    'size': size,
+                    'last_used': time.monotonic(),
+                }
+                self._stores.move_to_end(key)
+                self._evict_over_budget()
+                return store
+
+    def invalidate(self, vector_store_dir):
+        """移除 vector_store_dir 的快取，下一次查詢時重新開啟。"""
+        key = Path(vector_store_dir).as_posix()
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._sizes.pop(key, None)
+            if self._stores.pop(key, None) is not None:
+                logging.info(f"VectorStoreCache 已失效: {key}")
+
+    def _get_cached(self, key, embedding_key):
+        """返回已快取且 embedding 設定相同的向量資料庫並更新使用時間，否則返回 None（需持有 self._lock）。"""
+        entry = self._stores.get(key)
+        if entry is None or entry['embedding_key'] != embedding_key:
+            return None
+        entry['last_used'] = time.monotonic()
+        self._stores.move_to_end(key)
+        return entry['store']
+
+    def _evict_idle(self, now):
+        """淘汰閒置過久的向量資料庫。"""
+        idle_keys = [key for key, entry in self._stores.items()
+                     if now - entry['last_used'] > self.idle_seconds]
+        for key in idle_keys:
+            del self._stores[key]
+            logging.info(f"VectorStoreCache 淘汰閒置的向量資料庫: {key}")
+
+    def _evict_over_budget(self):
+        """淘汰最久未使用的向量資料庫，直到數量與大小都在上限內（至少保留最新的一個）。"""
+        total_bytes = sum(entry['size'] for entry in self._stores.values())
+        while len(self._stores) > 1 and (len(self._stores) > self.max_entries or total_bytes > self.max_bytes):
+            key, entry = self._stores.popitem(last=False)
+            total_bytes -= entry['size']
+            logging.info(f"VectorStoreCache 淘汰最久未使用的向量資料庫: {key}")
+
+    @staticmethod
+    def _dir_size(path):
+        """計算目錄在磁碟上的大小，作為記憶體用量的估計值（每個目錄只在失效後重新計算）。"""
+        path = Path(path)
+        if not path.exists():
+            return 0
+        return sum(file.stat().st_size for file in path.rglob('*') if file.is_file())
+
+
+# 行程內共用的向量資料庫快取
+vector_store_cache = VectorStoreCache()
@@ -1,5 +1,6 @@
 import pandas as pd
 from mockdata.evaluate_rag import ResponseEvaluator
+from mockdata.batch_runner import BatchRunner
 from models.llm_rag import RAGModel
 
 
@@ -13,6 +14,9 @@ class RagTest:
     INPUT_FILE_PATH = './mockdata/input.csv'  # 中間結果檔案路徑
     OUTPUT_FILE_PATH = './mockdata/output_Taide.csv'  # 輸出結果檔案路徑
 
+    # 同時生成回答的問題數（受限於 Ollama 伺服器的並行處理能力）
+    MAX_WORKERS = 4
+
     # 初始化 session 狀態參數，並儲存到 chat_session_data 字典中
     chat_session_data = {
         'conversation_id': "9b156925-8a55-4e5f-8a72-ac542672b5c2",
@@ -32,6 +36,8 @@ class RagTest:
         'title': '',
         'upload_time': None,
         'username': "n000191032",  # 設置使用者名稱
+        'llm_cache': True,  # 重複執行評估時，相同的 prompt 直接使用快取的回應
+        'bypass_answer_cache': True,  # 評估實際的檢索與生成，不使用語意快取的回答
         'empty_window_exists': True  # 確保新窗口存在
     }
     # self.llm = LLMAPI.get_llm('外部LLM', 'gpt-4o-mini')
@@ -48,14 +54,29 @@ class RagTest:
         # 初始化 RAG 模型
         llm_rag = RAGModel(RagTest.chat_session_data)
 
-        # 使用 RAG 模型回答問題
+        # 使用 RAG 模型並行回答問題（依原順序返回），中斷後重新執行時略過已完成的問題
         print("開始生成回答...")
-        df['Test'] = df['Question'].apply(lambda query: llm_rag.query_llm_rag(query)[0])
+        batch_runner = BatchRunner(
+            checkpoint_path=RagTest.INPUT_FILE_PATH.replace('.csv', '_checkpoint.db'),
+            run_name=f"generate:{RagTest.chat_session_data['llm_option']}:{RagTest.chat_session_data['embedding']}",
+            max_workers=RagTest.MAX_WORKERS
+        )
+        tasks = [(f"{index}:{query}", (llm_rag, query)) for index, query in enumerate(df['Question'])]
+        df['Test'] = [answer for answer, _ in batch_runner.run(tasks, RagTest.answer_question, description='生成回答')]
 
         # 將結果存入中間結果檔案
         print("儲存中間結果檔案...")
         df.to_csv(RagTest.INPUT_FILE_PATH, index=False, encoding='utf-8-sig')
 
+    @staticmethod
+    def answer_question(llm_rag, query):
+        """
+        回答單一問題，返回 (回答, 檢索到的文件)，文件轉為可寫入檢查點的字典。
+        發生錯誤時拋出例外，速率限制等暫時性錯誤由 BatchRunner 退避重試，失敗的問題不會寫入檢查點。
+        """
+        answer, documents = llm_rag.query_llm_rag(query, raise_errors=True)
+        return answer, [{'page_content': doc.page_content, 'metadata': doc.metadata} for doc in documents]
+
     @staticmethod
     def evaluate_answers():
         """
@@ -1,6 +1,8 @@
 from models.document_model import DocumentModel
+from models.document_corpus import DocumentCorpus
 from models.database_userRecords import UserRecordsDB
 from models.database_devOps import DevOpsDB
+from models.semantic_answer_cache import SemanticAnswerCache
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -9,38 +11,148 @@ class DocumentService:
         # 初始化 DocumentModel
         self.chat_session_data = chat_session_data
 
-    def process_uploaded_documents(self, source_docs):
-        doc_model = DocumentModel(self.chat_session_data)
+    def process_uploaded_documents(self, source_docs, progress_callback=None):
+        """
+        處理上傳的文件：建立臨時文件，並以串流管線加載、拆分並嵌入向量數據庫。
+
+        收錄為增量進行：只有共用文件庫中尚未收錄的文件（新文件或內容已變更的文件）會被解析與嵌入；
+        上傳與對話中既有文件同名但內容不同的文件時，取代舊版本並刪除不再被引用的向量。
+        背景執行時改用 IngestJobService.submit_uploaded_documents，由工作執行緒呼叫 ingest_prepared_documents。
+
+        Args:
+            source_docs (list): 上傳的文件列表，每項包含 'name' 與 'content'。
+            progress_callback (callable, optional): 以 (已嵌入數量, 目前已拆分的總數量, 已解析頁數) 呼叫的進度回報函式。
+        """
         try:
-            # 建立臨時文件
-            doc_names = doc_model.create_temporary_files(source_docs)
-            self.chat_session_data['doc_names'] = doc_names
+            docs = self.prepare_uploaded_documents(source_docs)
+            return self.ingest_prepared_documents(docs, progress_callback)
+
+        except Exception as e:
+            # 處理文檔時發生錯誤，顯示錯誤訊息
+            logging.error(f"處理文檔時發生錯誤 process_uploaded_documents：{e}")
+
+    def prepare_uploaded_documents(self, source_docs):
+        """
+        計算上傳文件的 doc_id，並為尚未收錄的文件建立臨時文件。
+
+        Args:
+            source_docs (list): 上傳的文件列表，每項包含 'name' 與 'content'。
+
+        Returns:
+            list: 去除重複內容後的文件列表，每項包含 'doc_id' 與 'name'（不含文件內容）。
+        """
+        doc_model = DocumentModel(self.chat_session_data)
+        corpus = DocumentCorpus()
+        embedding = self.chat_session_data.get('embedding')
+
+        # 以內容 sha256 作為 doc_id，相同內容的文件只保留一份
+        docs_by_id = {}
+        for source_doc in source_docs:
+            docs_by_id[DocumentCorpus.file_hash(source_doc['content'])] = source_doc
+        for doc_id, source_doc in docs_by_id.items():
+            source_doc['doc_id'] = doc_id
+
+        # 建立臨時文件（已收錄到共用文件庫的文件不需要）
+        new_docs = [doc for doc_id, doc in docs_by_id.items() if not corpus.is_ingested(doc_id, embedding)]
+        if new_docs:
+            doc_model.create_temporary_files(new_docs)
+        return [{'doc_id': doc_id, 'name': doc['name']} for doc_id, doc in docs_by_id.items()]
 
-            # 加載文檔
-            documents = doc_model.load_documents()
+    def ingest_prepared_documents(self, docs, progress_callback=None):
+        """
+        收錄已建立臨時文件的上傳文件，讓目前對話引用，並記錄上傳紀錄。發生錯誤時拋出異常。
+
+        Args:
+            docs (list): prepare_uploaded_documents 返回的文件列表。
+            progress_callback (callable, optional): 以 (已嵌入數量, 目前已拆分的總數量, 已解析頁數) 呼叫的進度回報函式。
+
+        Returns:
+            dict: 更新後的 chat_session_data。
+        """
+        doc_model = DocumentModel(self.chat_session_data)
+        corpus = DocumentCorpus()
+        embedding = self.chat_session_data.get('embedding')
+        docs_by_id = {doc['doc_id']: doc for doc in docs}
+        self.chat_session_data['doc_names'] = {f"{doc_id}.pdf": doc['name'] for doc_id, doc in docs_by_id.items()}
+
+        # 對話中同名但內容已變更的文件，收錄新版本後移除舊版本
+        conversation_id = self.chat_session_data.get('conversation_id')
+        uploaded_names = {doc['name'] for doc in docs_by_id.values()}
+        replaced_ids = [doc_id for doc_id, org_name in corpus.get_conversation_documents(conversation_id)
+                        if org_name in uploaded_names and doc_id not in docs_by_id]
+
+        # 只有尚未收錄到共用文件庫的文件需要加載、拆分與嵌入
+        new_docs = [doc for doc_id, doc in docs_by_id.items() if not corpus.is_ingested(doc_id, embedding)]
+        self.chat_session_data['chunk_count'] = 0
+        self.chat_session_data['cache_hits'] = 0
+        if new_docs:
+            # 以串流管線解析、拆分並嵌入文檔塊到共用向量數據庫，並標記 doc_id
+            ingest_stats = doc_model.ingest_documents(
+                [f"{doc['doc_id']}.pdf" for doc in new_docs], doc_model.split_documents_into_chunks_1,
+                progress_callback)
 
             # 刪除臨時文件
             # doc_model.delete_temporary_files()
 
-            # 將文檔拆分成塊
-            document_chunks = doc_model.split_documents_into_chunks_1(documents)
+            # 記錄已收錄的文件與文檔塊清單（無法解析的文件不記錄，下次上傳時重新處理）
+            chunk_counts = ingest_stats['chunk_counts']
+            for doc in new_docs:
+                if chunk_counts.get(doc['doc_id']):
+                    corpus.add_document(doc['doc_id'], embedding, doc['name'], chunk_counts[doc['doc_id']],
+                                        ingest_stats['chunk_manifest'][doc['doc_id']])
+        else:
+            logging.info("上傳的文件皆已收錄於共用文件庫，直接引用。")
+        logging.info(f"增量收錄: 上傳 {len(docs_by_id)} 份文件，新收錄 {len(new_docs)} 份，"
+                     f"取代 {len(replaced_ids)} 份舊版本。")
+
+        # 讓目前對話引用所有上傳的文件
+        corpus.link_documents(
+            self.chat_session_data.get('username'),
+            conversation_id,
+            {doc_id: doc['name'] for doc_id, doc in docs_by_id.items()})
 
-            # 在本地向量數據庫中嵌入文檔塊
-            doc_model.embeddings_on_local_vectordb(document_chunks)
+        # 移除被新版本取代的文件，並使依據舊版本的快取回答失效
+        if replaced_ids:
+            self.remove_documents(replaced_ids)
+            SemanticAnswerCache().invalidate_documents(replaced_ids)
 
-            # 存入 userRecords_db
-            username = self.chat_session_data.get('username')
-            userRecords_db = UserRecordsDB(username)
-            userRecords_db.save_to_file_names(self.chat_session_data)
-            userRecords_db.save_to_pdf_uploads(self.chat_session_data)
+        # 存入 userRecords_db
+        username = self.chat_session_data.get('username')
+        userRecords_db = UserRecordsDB(username)
+        userRecords_db.save_to_file_names(self.chat_session_data)
+        userRecords_db.save_to_pdf_uploads(self.chat_session_data)
 
-            # 存入 devOps_db
-            devOps_db = DevOpsDB()
-            devOps_db.save_to_file_names(self.chat_session_data)
-            devOps_db.save_to_pdf_uploads(self.chat_session_data)
+        # 存入 devOps_db
+        devOps_db = DevOpsDB()
+        devOps_db.save_to_file_names(self.chat_session_data)
+        devOps_db.save_to_pdf_uploads(self.chat_session_data)
 
-            return self.chat_session_data
+        return self.chat_session_data
 
+    def list_documents(self):
+        """取得目前對話引用的文件，返回 [(doc_id, org_name)]。"""
+        return DocumentCorpus().get_conversation_documents(self.chat_session_data.get('conversation_id'))
+
+    def remove_documents(self, doc_ids):
+        """
+        從目前對話移除文件；不再被任何對話引用的文件，同時從共用向量數據庫刪除其向量。
+
+        Args:
+            doc_ids (list): 要移除的 doc_id 列表。
+        """
+        doc_model = DocumentModel(self.chat_session_data)
+        corpus = DocumentCorpus()
+        try:
+            corpus.unlink_documents(self.chat_session_data.get('conversation_id'), doc_ids)
+            doc_model.delete_temporary_files([f"{doc_id}.pdf" for doc_id in doc_ids])
+
+            # 依文檔塊清單刪除孤立文件的向量（清單不存在時依 doc_id 刪除），並使依據這些文件的快取回答失效
+            orphaned_ids = set()
+            for doc_id, embedding in corpus.find_orphaned_documents(doc_ids):
+                doc_model.delete_document_vectors(doc_id, embedding, corpus.get_chunk_ids(doc_id, embedding))
+                corpus.delete_document(doc_id, embedding)
+                orphaned_ids.add(doc_id)
+            if orphaned_ids:
+                SemanticAnswerCache().invalidate_documents(sorted(orphaned_ids))
         except Exception as e:
-            # 處理文檔時發生錯誤，顯示錯誤訊息
-            logging.error(f"處理文檔時發生錯誤 process_uploaded_documents：{e}")
\ No newline at end of file
+            logging.error(f"移除文件時發生錯誤 remove_documents：{e}")
@@ -0,0 +1,112 @@
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from models.database_ingestJobs import IngestJobsDB
+from services.document_services import DocumentService
+
+logging.basicConfig(level=logging.INFO)
+
+
+class IngestJobService:
+    """
+    背景文件收錄工作佇列。
+
+    上傳的文件先寫入臨時目錄，工作記錄於 IngestJobsDB 後立即返回 job_id，
+    由行程內共用的工作執行緒執行收錄，不阻塞 Streamlit 的頁面執行；
+    頁面重新執行或瀏覽器重新整理後可依 job_id 或使用者查詢進度。
+    行程重新啟動時，未完成的工作會重新排入佇列（臨時文件仍保留在磁碟上）。
+    """
+
+    # 同時執行的收錄工作數
+    MAX_WORKERS = 2
+    # 寫入進度的最短間隔（秒）
+    PROGRESS_INTERVAL_SECONDS = 1.0
+    # 工作中保存的會話欄位（收錄只需要這些欄位；API 金鑰等其他欄位不寫入磁碟）
+    JOB_SESSION_KEYS = ('username', 'conversation_id', 'embedding', 'mode', 'agent')
+
+    # 行程內共用的工作執行緒
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    def __init__(self, jobs_db=None):
+        self.jobs_db = jobs_db or IngestJobsDB()
+        self._ensure_workers()
+
+    def _ensure_workers(self):
+        """建立工作執行緒（每個行程只建立一次），並重新排入上次未完成的工作。"""
+        with IngestJobService._executor_lock:
+            if IngestJobService._executor is not None:
+                return
+            IngestJobService._executor = ThreadPoolExecutor(
+                max_workers=self.MAX_WORKERS, thread_name_prefix='ingest-job')
+            unfinished_jobs = self.jobs_db.get_unfinished_jobs()
+        for job in unfinished_jobs:
+            logging.info(f"重新排入未完成的收錄工作: {job['job_id']}")
+            self.jobs_db.update_status(job['job_id'], IngestJobsDB.STATUS_QUEUED)
+            IngestJobService._executor.submit(self._run_job, job['job_id'])
+
+    def submit_uploaded_documents(self, chat_session_data, source_docs):
+        """
+        建立臨時文件並提交收錄工作，立即返回 job_id。
+
+        Args:
+            chat_session_data (dict): 目前的會話數據。
+            source_docs (list): 上傳的文件列表，每項包含 'name' 與 'content'。
+
+        Returns:
+            str: 工作 ID。
+        """
+        docs = DocumentService(chat_session_data).prepare_uploaded_documents(source_docs)
+
+        session_data = self._job_session(chat_session_data)
+        job_id = str(uuid.uuid4())
+        self.jobs_db.create_job(
+            job_id,
+            chat_session_data.get('username'),
+            chat_session_data.get('conversation_id'),
+            {'chat_session_data': session_data, 'docs': docs})
+        IngestJobService._executor.submit(self._run_job, job_id)
+        logging.info(f"已提交收錄工作 {job_id}: {len(docs)} 份文件")
+        return job_id
+
+    def get_job(self, job_id):
+        """取得工作的狀態與進度。"""
+        return self.jobs_db.get_job(job_id)
+
+    def get_active_jobs(self, username):
+        """取得使用者排隊中或執行中的工作。"""
+        return self.jobs_db.get_user_jobs(username)
+
+    def _run_job(self, job_id):
+        """在工作執行緒中執行收錄工作，並記錄狀態與進度。"""
+        job = self.jobs_db.get_job(job_id)
+        if job is None or job['status'] not in IngestJobsDB.ACTIVE_STATUSES:
+            return
+        self.jobs_db.update_status(job_id, IngestJobsDB.STATUS_RUNNING)
+        progress = {'pages': 0, 'reported_at': 0.0}
+
+        def report(done, total, pages):
+            # 限制寫入頻率，最後一次進度在工作完成時寫入
+            progress['pages'] = pages
+            now = time.monotonic()
+            if now - progress['reported_at'] >= self.PROGRESS_INTERVAL_SECONDS:
+                progress['reported_at'] = now
+                self.jobs_db.update_progress(job_id, pages, done, total)
+
+        try:
+            chat_session_data = self._job_session(job['payload']['chat_session_data'])
+            DocumentService(chat_session_data).ingest_prepared_documents(job['payload']['docs'], report)
+            chunk_count = chat_session_data.get('chunk_count', 0)
+            self.jobs_db.update_progress(job_id, progress['pages'], chunk_count, chunk_count)
+            self.jobs_db.update_status(job_id, IngestJobsDB.STATUS_DONE)
+            logging.info(f"收錄工作 {job_id} 完成: {chunk_count} 個文檔塊")
+        except Exception as e:
+            logging.error(f"收錄工作 {job_id} 發生錯誤：{e}")
+            self.jobs_db.update_status(job_id, IngestJobsDB.STATUS_FAILED, str(e))
+
+    @classmethod
+    def _job_session(cls, chat_session_data):
+        """只保留收錄需要的會話欄位。"""
+        return {key: chat_session_data.get(key) for key in cls.JOB_SESSION_KEYS}
@@ -1,14 +1,23 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from models.llm_model import LLMModel
 from models.llm_rag import RAGModel
 from models.database_userRecords import UserRecordsDB
 from models.database_devOps import DevOpsDB
+from models.chat_history_cache import chat_history_cache
 
 # from sql.sqlagent import agent
 # from sql.sqlagent2 import agent as agent_II
 # from sql.sql_test import query as qu
 
+logging.basicConfig(level=logging.INFO)
+
 
 class LLMService:
+    # 產生窗口標題的共用執行緒，與回答並行執行
+    _title_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='window-title')
+
     def __init__(self, chat_session_data):
         """初始化 LLMModel 和 DatabaseModel"""
         self.chat_session_data = chat_session_data
@@ -20,10 +29,10 @@ class LLMService:
         db_name = self.chat_session_data.get('db_name')
         db_source = self.chat_session_data.get('db_source')
 
-        # 如果聊天記錄為空，設定新窗口的標題
-        if not self.chat_session_data.get('chat_history'):
-            llm_model = LLMModel(self.chat_session_data)
-            llm_model.set_window_title(query)
+        # 如果聊天記錄為空，在背景產生新窗口的標題，與回答並行
+        title_future = self._start_window_title_if_new(query)
+        # 清除上一輪的語意快取統計（只有個人KM會重新設定）
+        self.chat_session_data.pop('answer_cache_stats', None)
 
         # 根據選擇的助理類型來執行對應的查詢
         if selected_agent == '資料庫查找助理':
@@ -51,20 +60,123 @@ class LLMService:
             llm_model = LLMModel(self.chat_session_data)
             response = llm_model.query_llm_direct(query)
 
-        # 更新 chat_session_data 中的聊天記錄
-        # test
-        # self.chat_session_data['chat_history'].append({"user_query": query, "ai_response": response})
-        self.chat_session_data['chat_history'] = []
-        # test
-        print('chat_history', self.chat_session_data['chat_history'])
+        self._save_query_result(query, response, title_future)
+        return response, self.chat_session_data
+
+    def query_stream(self, query):
+        """
+        以串流方式執行查詢，逐一產生回應的 token。
+
+        串流結束後才將完整回應保存到 UserRecordsDB 與 DevOpsDB，
+        並記錄首個 token 的延遲 (time-to-first-token) 與總耗時。
+        """
+        # 如果聊天記錄為空，在背景產生新窗口的標題，與回答並行
+        title_future = self._start_window_title_if_new(query)
+        # 清除上一輪的語意快取統計（只有個人KM會重新設定）
+        self.chat_session_data.pop('answer_cache_stats', None)
+
+        start_time = time.perf_counter()
+        time_to_first_token = None
+        response_chunks = []
+
+        for token in self._stream_response(query):
+            if time_to_first_token is None:
+                time_to_first_token = time.perf_counter() - start_time
+                logging.info(f"首個 token 延遲 (TTFT): {time_to_first_token:.3f}s "
+                             f"(agent={self.chat_session_data.get('agent')}, "
+                             f"llm_option={self.chat_session_data.get('llm_option')})")
+            response_chunks.append(token)
+            yield token
+
+        total_time = time.perf_counter() - start_time
+        logging.info(f"串流回應完成: TTFT={time_to_first_token or total_time:.3f}s, 總耗時={total_time:.3f}s")
+
+        # 串流結束後保存完整回應
+        self._save_query_result(query, ''.join(response_chunks), title_future)
+
+    def _stream_response(self, query):
+        """根據選擇的助理類型，產生對應查詢的串流回應。"""
+        selected_agent = self.chat_session_data.get('agent')
+
+        if selected_agent == '個人KM':
+            # 使用檢索增強生成模式進行串流查詢
+            llm_rag = RAGModel(self.chat_session_data)
+            yield from llm_rag.stream_llm_rag(query)
+
+        elif selected_agent in ['資料庫查找助理', '資料庫查找助理2.0', 'SQL生成助理']:
+            # 資料庫助理尚未支援串流（目前亦未啟用），一次返回完整回應
+            print(f'{selected_agent}...')
+            yield ''
+
+        else:
+            # 直接使用 LLM 進行串流查詢
+            llm_model = LLMModel(self.chat_session_data)
+            yield from llm_model.stream_llm_direct(query)
+
+    def _start_window_title_if_new(self, query):
+        """如果聊天記錄為空，在背景執行緒以小模型產生新窗口的標題，返回 Future（非新窗口時返回 None）。"""
+        if self.chat_session_data.get('chat_history'):
+            return None
+        llm_model = LLMModel(self.chat_session_data)
+        return self._title_executor.submit(llm_model.generate_window_title, query)
+
+    def _apply_window_title(self, title_future):
+        """標題已產生時直接寫入 chat_session_data，與本輪對話一起保存；返回是否已套用。"""
+        if title_future is None:
+            return True
+        if not title_future.done():
+            return False
+        title = self._get_title_result(title_future)
+        if title:
+            self.chat_session_data['title'] = title
+        return True
+
+    def _update_window_title_when_done(self, title_future):
+        """標題在回答完成後才產生時，於產生後更新資料庫中的標題，並清除快取的窗口列表。"""
+        chat_session_data = self.chat_session_data
+        username = chat_session_data.get('username')
+        conversation_id = chat_session_data.get('conversation_id')
+
+        def update_title(future):
+            title = self._get_title_result(future)
+            if not title:
+                return
+            UserRecordsDB(username).update_title(conversation_id, title)
+            if chat_session_data.get('conversation_id') == conversation_id:
+                chat_session_data['title'] = title
+            chat_session_data['window_list'] = None
+
+        title_future.add_done_callback(update_title)
+
+    @staticmethod
+    def _get_title_result(title_future):
+        """取得背景產生的標題，失敗時返回 None。"""
+        try:
+            return title_future.result()
+        except Exception as e:
+            logging.warning(f"產生窗口標題時發生錯誤: {e}")
+            return None
+
+    def _save_query_result(self, query, response, title_future=None):
+        """更新 chat_session_data，並將查詢和回應結果保存到資料庫。"""
         self.chat_session_data['empty_window_exists'] = False
+        # 不等待標題產生：已產生則一起保存，否則產生後再更新
+        title_applied = self._apply_window_title(title_future)
 
         # 將查詢和回應結果保存到資料庫 userRecords_db
         username = self.chat_session_data.get('username')
         userRecords_db = UserRecordsDB(username)
-        userRecords_db.save_to_database(query, response, self.chat_session_data)
+        message_id = userRecords_db.save_to_database(query, response, self.chat_session_data)
+        if not title_applied:
+            self._update_window_title_when_done(title_future)
+
+        # 更新 chat_session_data 中的聊天記錄（含訊息 id，供分頁載入較早的訊息）
+        self.chat_session_data.setdefault('chat_history', []).append(
+            {'id': message_id, 'user_query': query, 'ai_response': response})
+        # 將本輪對話追加到快取的 ChatMessageHistory，下一輪不需重建對話歷史
+        chat_history_cache.append(username, self.chat_session_data.get('conversation_id'), query, response)
+        # 窗口的標題與最後活動時間已變更，清除快取的窗口列表
+        self.chat_session_data['window_list'] = None
         # 將查詢和回應結果保存到資料庫 DevOpsDB()
         devOps_db = DevOpsDB()
         devOps_db.save_to_database(query, response, self.chat_session_data)
-
-        return response, self.chat_session_data
@@ -28,8 +28,9 @@ class MainPage:
         if query := st.chat_input():
             st.chat_message("human").write(query)
             try:
-                response, chat_session_data = LLMService(chat_session_data).query(query)
-                st.chat_message("ai").write(response)
+                # 以串流方式逐一顯示回應的 token，串流結束後才保存完整回應
+                with st.chat_message("ai"):
+                    st.write_stream(LLMService(chat_session_data).query_stream(query))
             except Exception as e:
                 st.error(f"An error occurred while processing your request: {e}")
 
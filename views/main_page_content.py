@@ -1,7 +1,12 @@
 import streamlit as st
 from services.document_services import DocumentService
+from services.ingest_job_services import IngestJobService
+from controllers.ui_controller import UIController
 
 class MainContent:
+    # 查詢背景收錄工作進度的間隔（秒）
+    JOB_POLL_SECONDS = 2
+
     def __init__(self, chat_session_data):
         """初始化主內容物件"""
         self.chat_session_data = chat_session_data
@@ -32,15 +37,65 @@ class MainContent:
             # 準備文件列表，包含文件名和內容
             source_docs = [{'name': file.name, 'content': file.read()} for file in uploaded_files] if uploaded_files else []
 
-            # 顯示提交按鈕，點擊時觸發 process_uploaded_documents 方法
+            # 顯示提交按鈕，點擊時提交背景收錄工作，不阻塞頁面
             if st.button("提交文件", key="submit", help="提交文件"):
                 try:
-                    self.chat_session_data = DocumentService(self.chat_session_data).process_uploaded_documents(source_docs)
+                    job_id = IngestJobService().submit_uploaded_documents(self.chat_session_data, source_docs)
+                    st.session_state['ingest_job_id'] = job_id
                 except Exception as e:
                     st.error(f"處理文檔時發生錯誤：{e}")
 
+            # 顯示背景收錄工作的進度
+            self.display_ingest_jobs()
+
+            # 顯示目前對話引用的文件，可個別移除
+            self.display_conversation_documents()
+
             st.write(f'此功能仍在測試階段...')  # 顯示測試階段提示
 
+    def display_ingest_jobs(self):
+        """顯示背景收錄工作的進度，執行中時定期重新查詢"""
+        job_service = IngestJobService()
+        active_jobs = job_service.get_active_jobs(self.chat_session_data.get('username'))
+
+        def render():
+            jobs = job_service.get_active_jobs(self.chat_session_data.get('username'))
+            for job in jobs:
+                total = job['chunk_total'] or 0
+                done = min(job['chunks_embedded'] or 0, total)
+                text = (f"文件收錄中... 已解析 {job['pages']} 頁，已嵌入 {done}/{total} 個文檔塊"
+                        if job['status'] == 'running' else "文件收錄排隊中...")
+                st.progress(done / total if total else 0.0, text=text)
+            if active_jobs and not jobs:
+                # 工作已全部完成，重新執行整個頁面以更新文件列表並停止查詢
+                st.rerun()
+
+            # 顯示本次提交的工作結果
+            job_id = st.session_state.get('ingest_job_id')
+            job = job_service.get_job(job_id) if job_id else None
+            if job and job['status'] == 'done':
+                st.success(f"文件收錄完成：{job['pages']} 頁，{job['chunks_embedded']} 個文檔塊")
+            elif job and job['status'] == 'failed':
+                st.error(f"處理文檔時發生錯誤：{job['error']}")
+
+        if active_jobs and hasattr(st, 'fragment'):
+            # 只重新執行進度區塊，不影響聊天
+            st.fragment(run_every=self.JOB_POLL_SECONDS)(render)()
+        else:
+            render()
+            if active_jobs:
+                st.button("重新整理進度", key="refresh_ingest_jobs")
+
+    def display_conversation_documents(self):
+        """顯示目前對話引用的文件與移除按鈕"""
+        document_service = DocumentService(self.chat_session_data)
+        for doc_id, org_name in document_service.list_documents():
+            name_col, button_col = st.columns([5, 1])
+            name_col.write(org_name)
+            if button_col.button("移除", key=f"remove_doc_{doc_id}", help="從此對話移除文件"):
+                document_service.remove_documents([doc_id])
+                st.rerun()
+
     def display_sql_example(self):
         """根據資料庫來源顯示 prompt"""
         db_source = self.chat_session_data.get('db_source')
@@ -64,7 +119,12 @@ class MainContent:
                     st.write('輸入範例1：SALARE=荷蘭的TARIFFAMT總和')
 
     def display_active_chat_history(self):
-        """顯示聊天記錄"""
+        """顯示聊天記錄（開啟窗口時只載入最新一頁，較早的訊息按需載入）"""
+        if self.chat_session_data.get('has_older_messages'):
+            if st.button("載入較早的訊息", key="load_older_messages"):
+                UIController(self.chat_session_data).load_older_messages()
+                st.rerun()
+
         chat_records = self.chat_session_data.get('chat_history', [])
         if chat_records:
             # 迭代顯示每一條聊天記錄
@@ -73,4 +133,3 @@ class MainContent:
                     st.markdown(result['user_query'])
                 with st.chat_message("ai"):
                     st.markdown(result['ai_response'])
-